@@ -0,0 +1,105 @@
+import logging
+import subprocess
+from typing import Iterator
+
+import numpy as np
+
+logger = logging.getLogger("audio")
+
+# Whisper and pyannote both work on 16 kHz mono float32 samples
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_SECONDS
+
+# Same headroom pydub's effects.normalize leaves below full scale
+NORMALIZE_HEADROOM_DB = 0.1
+
+
+def iter_pcm_frames(path: str, frame_samples: int = FRAME_SAMPLES) -> Iterator[np.ndarray]:
+    """Decode any ffmpeg-readable file into fixed-size 16 kHz mono float32 frames."""
+    cmd = [
+        "ffmpeg", "-nostdin", "-v", "error",
+        "-i", path,
+        "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+        "pipe:1",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    frame_bytes = frame_samples * 4
+    try:
+        while True:
+            chunk = proc.stdout.read(frame_bytes)
+            if not chunk:
+                break
+            usable = len(chunk) - len(chunk) % 4
+            yield np.frombuffer(chunk[:usable], dtype=np.float32)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        stderr = proc.stderr.read()
+        proc.stderr.close()
+        proc.wait()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {path}: {stderr.decode(errors='replace').strip()}")
+
+
+def decode_pcm(path: str, pcm_path: str, mmap_min_seconds: float = 600) -> np.ndarray:
+    """Decode a file once into a 16 kHz mono float32 buffer.
+
+    Short files stay in memory. Once the decoded audio passes
+    ``mmap_min_seconds`` the frames are spilled to ``pcm_path`` and the
+    result is memory-mapped, so long files never have to fit in RAM.
+    """
+    spill_after = int(mmap_min_seconds * SAMPLE_RATE)
+    frames = []
+    samples = 0
+    out = None
+    try:
+        for frame in iter_pcm_frames(path):
+            samples += len(frame)
+            if out is None:
+                frames.append(frame)
+                if samples <= spill_after:
+                    continue
+                out = open(pcm_path, "wb")
+                for pending in frames:
+                    out.write(pending.tobytes())
+                frames = []
+            else:
+                out.write(frame.tobytes())
+    finally:
+        if out is not None:
+            out.close()
+
+    logger.info(f"Decoded {samples / SAMPLE_RATE:.1f}s of audio")
+    if out is None:
+        # Copy so the buffer is writable for in-place restoration
+        return np.concatenate(frames) if frames else np.zeros(0, dtype=np.float32)
+    return np.memmap(pcm_path, dtype=np.float32, mode="r+", shape=(samples,))
+
+
+def pcm_peak(pcm: np.ndarray, frame_samples: int = FRAME_SAMPLES) -> float:
+    """Absolute peak of the signal, computed one frame at a time."""
+    peak = 0.0
+    for start in range(0, len(pcm), frame_samples):
+        frame = pcm[start:start + frame_samples]
+        peak = max(peak, float(np.max(np.abs(frame))))
+    return peak
+
+
+def restore_pcm(pcm: np.ndarray, frame_samples: int = FRAME_SAMPLES) -> np.ndarray:
+    """Peak-normalize PCM in place using two streaming passes (analysis, then gain)."""
+    peak = pcm_peak(pcm, frame_samples)
+    if peak == 0.0:
+        return pcm
+
+    target = 10 ** (-NORMALIZE_HEADROOM_DB / 20)
+    gain = np.float32(target / peak)
+    for start in range(0, len(pcm), frame_samples):
+        frame = pcm[start:start + frame_samples]
+        np.multiply(frame, gain, out=frame)
+
+    if isinstance(pcm, np.memmap):
+        pcm.flush()
+    logger.info(f"Audio normalized with gain {float(gain):.3f}")
+    return pcm
@@ -1,17 +1,26 @@
+import logging
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import jwt, JWTError
 from passlib.context import CryptContext
+from redis.exceptions import RedisError
 from sqlalchemy.orm import Session
 from .config import settings
 from . import models, schemas
 from .database import get_db
 
+logger = logging.getLogger("auth")
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+# User IDs by token subject, so status polls need no database round trip.
+# Accounts are never deleted or renamed, so an entry cannot go stale.
+USER_ID_KEY = "auth:user:{email}:id"
+USER_ID_CACHE_SECONDS = 24 * 3600
+
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -39,20 +48,54 @@ def authenticate_user(db: Session, email: str, password: str):
     return user
 
 
-async def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+async def get_token_subject(token: str = Depends(oauth2_scheme)) -> str:
+    """The email a valid bearer token was issued to."""
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    return email
+
+
+async def get_current_user(db: Session = Depends(get_db), email: str = Depends(get_token_subject)):
     user = get_user(db, email=email)
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
+
+
+def queue_user_id(pipe, email: str) -> Callable[[object], Optional[int]]:
+    """Queue the cached user ID read on ``pipe``; the returned function parses its reply (None on a miss or error)."""
+    pipe.get(USER_ID_KEY.format(email=email))
+    return lambda reply: int(reply) if isinstance(reply, bytes) else None
+
+
+def resolve_user_id(db: Session, redis_conn, email: str, cached: Optional[int]) -> int:
+    """The token subject's user ID: ``cached`` if the cache had it, else from the database, then cached."""
+    if cached is not None:
+        return cached
+    user = get_user(db, email=email)
+    if user is None:
+        raise _credentials_exception()
+    try:
+        redis_conn.set(USER_ID_KEY.format(email=email), user.id, ex=USER_ID_CACHE_SECONDS)
+    except RedisError as e:
+        logger.warning(f"Could not cache the user ID of {email}: {e}")
+    return user.id
+
+
+async def get_current_admin(current_user: models.User = Depends(get_current_user)):
+    if current_user.email.lower() not in settings.admin_email_list:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
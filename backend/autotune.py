@@ -0,0 +1,312 @@
+"""
+CPU layout autotuner for the transcription worker.
+
+Many-core hosts lose throughput when several worker processes each start a
+full set of inference threads. This tool measures, on the local machine,
+every layout of ``processes x threads`` that splits the physical cores
+evenly, with each process pinned to its own cores, for each compute type
+and mode. It then writes the best layout to a profile that
+``worker.start_workers`` applies at startup: how many worker processes to
+run, the cores each one is pinned to, its thread count and the compute type
+per mode.
+
+The default clip is synthetic (voiced, formant-shaped syllables), so runs
+are reproducible without bundling audio. Pass ``--clip`` with a
+representative recording for numbers closer to production.
+
+    python -m backend.autotune [--modes cheetah dolphin] [--clip meeting.wav] [--out cpu_profile.json]
+"""
+
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import queue
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional
+
+from .config import settings
+
+logger = logging.getLogger("autotune")
+
+SAMPLE_RATE = 16000
+CPU_COMPUTE_TYPES = ("int8", "int8_float32", "float32")
+MAX_LAYOUTS = 6
+# Longest one trial (model loads and every transcription) may take
+TRIAL_TIMEOUT_SECONDS = 1800
+PROFILE_VERSION = 1
+
+
+class Slot(NamedTuple):
+    """One worker process: the logical CPUs it is pinned to and its inference threads."""
+    cpus: List[int]
+    threads: int
+
+
+def physical_cores() -> List[List[int]]:
+    """Usable logical CPUs grouped by physical core (hyperthread siblings together)."""
+    usable = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    cores: Dict[str, List[int]] = {}
+    for cpu in usable:
+        try:
+            with open(f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list") as f:
+                key = f.read().strip()
+        except OSError:
+            key = str(cpu)
+        cores.setdefault(key, []).append(cpu)
+    return list(cores.values())
+
+
+def slots_for(processes: int, cores: Optional[List[List[int]]] = None) -> List[Slot]:
+    """Split the physical cores evenly over ``processes`` pinned slots."""
+    cores = cores or physical_cores()
+    per_process = max(1, len(cores) // processes)
+    slots = []
+    for i in range(processes):
+        group = cores[i * per_process:(i + 1) * per_process] or cores[i % len(cores):i % len(cores) + 1]
+        slots.append(Slot(sorted(cpu for core in group for cpu in core), per_process))
+    return slots
+
+
+def candidate_process_counts(n_cores: int) -> List[int]:
+    """Process counts that divide the cores evenly, spread from 1 to one per core."""
+    counts = [p for p in range(1, n_cores + 1) if n_cores % p == 0]
+    if len(counts) > MAX_LAYOUTS:
+        step = (len(counts) - 1) / (MAX_LAYOUTS - 1)
+        counts = sorted({counts[round(i * step)] for i in range(MAX_LAYOUTS)})
+    return counts
+
+
+def synthetic_clip(seconds: float, seed: int = 7):
+    """Deterministic speech-like audio: a glottal pulse train through vowel formants, in syllables."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SAMPLE_RATE)
+    t = np.arange(n) / SAMPLE_RATE
+    audio = np.zeros(n, dtype=np.float32)
+    vowels = ((730, 1090, 2440), (270, 2290, 3010), (300, 870, 2240), (530, 1840, 2480), (570, 840, 2410))
+    pos = 0
+    while pos < n:
+        length = int(rng.uniform(0.15, 0.35) * SAMPLE_RATE)
+        seg = slice(pos, min(n, pos + length))
+        pitch = rng.uniform(100, 220)
+        formants = vowels[rng.integers(len(vowels))]
+        phase = 2 * np.pi * pitch * t[seg]
+        voiced = sum(np.sin(k * phase) / k * sum(np.exp(-((k * pitch - f) / 120.0) ** 2) for f in formants) for k in range(1, 30))
+        envelope = np.hanning(seg.stop - seg.start)
+        audio[seg] = (voiced * envelope).astype(np.float32)
+        # Short pauses between syllables, longer ones between "words"
+        pos = seg.stop + int(rng.choice([0.03, 0.03, 0.2]) * SAMPLE_RATE)
+    audio += rng.normal(0, 0.003, n).astype(np.float32)
+    return audio / max(1e-6, float(np.abs(audio).max())) * 0.5
+
+
+def load_clip(path: Optional[str], seconds: float):
+    if not path:
+        return synthetic_clip(seconds)
+    import tempfile
+    from .audio import decode_pcm
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pcm = decode_pcm(path, os.path.join(tmp, "clip.pcm"), mmap_min_seconds=float("inf"))
+    return pcm[: int(seconds * SAMPLE_RATE)]
+
+
+def _run_slot(size, compute_type, beam_size, slot, clip, repeat, barrier, results) -> None:
+    """Child process: load the model pinned to ``slot`` and time ``repeat`` transcriptions."""
+    try:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, slot.cpus)
+        from faster_whisper import WhisperModel
+
+        model = WhisperModel(size, device="cpu", compute_type=compute_type, cpu_threads=slot.threads)
+        segments, _ = model.transcribe(clip[: 5 * SAMPLE_RATE], beam_size=beam_size)
+        list(segments)
+        barrier.wait()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            segments, _ = model.transcribe(clip, beam_size=beam_size, condition_on_previous_text=False)
+            list(segments)
+        results.put(time.perf_counter() - start)
+    except Exception as e:
+        barrier.abort()
+        results.put(e)
+
+
+def measure(mode: str, compute_type: str, slots: List[Slot], clip, repeat: int, timeout: float = TRIAL_TIMEOUT_SECONDS) -> dict:
+    """Run every slot at once and report aggregate throughput and per-job latency.
+
+    Raises RuntimeError if a process fails, dies without reporting (e.g. on
+    an instruction its CPU lacks) or the trial takes longer than ``timeout``.
+    """
+    from .tasks import MODEL_SIZES
+
+    size = MODEL_SIZES[mode]
+    # Same beam settings the worker uses for this mode
+    beam_size = 5 if mode == "whale" else 1
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(len(slots))
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=_run_slot, args=(size, compute_type, beam_size, slot, clip, repeat, barrier, results))
+        for slot in slots
+    ]
+    for proc in procs:
+        proc.start()
+    deadline = time.monotonic() + timeout
+    elapsed = []
+    while len(elapsed) < len(procs):
+        try:
+            elapsed.append(results.get(timeout=1))
+            continue
+        except queue.Empty:
+            pass
+        died = [proc.exitcode for proc in procs if proc.exitcode not in (None, 0)]
+        if died or time.monotonic() > deadline:
+            # The others may be waiting at the barrier for the one that died
+            for proc in procs:
+                proc.kill()
+                proc.join()
+            reason = f"a process exited with code {died[0]}" if died else f"no result after {timeout:.0f}s"
+            raise RuntimeError(f"{mode}/{compute_type} with {len(slots)} process(es) failed: {reason}")
+    for proc in procs:
+        proc.join()
+    errors = [e for e in elapsed if isinstance(e, Exception)]
+    if errors:
+        raise RuntimeError(f"{mode}/{compute_type} with {len(slots)} process(es) failed: {errors[0]}")
+
+    audio_seconds = len(clip) / SAMPLE_RATE
+    return {
+        "throughput": len(slots) * repeat * audio_seconds / max(elapsed),
+        "latency_seconds": sum(elapsed) / len(elapsed) / repeat,
+    }
+
+
+def tune(modes: List[str], compute_types: List[str], clip, repeat: int, timeout: float = TRIAL_TIMEOUT_SECONDS) -> dict:
+    cores = physical_cores()
+    trials = []
+    for processes in candidate_process_counts(len(cores)):
+        slots = slots_for(processes, cores)
+        for mode in modes:
+            for compute_type in compute_types:
+                try:
+                    result = measure(mode, compute_type, slots, clip, repeat, timeout)
+                except RuntimeError as e:
+                    # Not every CPU supports every compute type
+                    logger.warning(str(e))
+                    continue
+                trial = {"processes": processes, "threads": slots[0].threads, "mode": mode, "compute_type": compute_type, **result}
+                logger.info(f"Trial: {trial}")
+                trials.append(trial)
+    if not trials:
+        raise RuntimeError("No layout could be measured")
+
+    # One process layout serves every mode, so pick the layout with the best
+    # geometric mean of per-mode throughput relative to that mode's best
+    best_per_mode = {mode: max((t["throughput"] for t in trials if t["mode"] == mode), default=0) for mode in modes}
+    scores = {}
+    for processes in {t["processes"] for t in trials}:
+        per_mode = {}
+        for mode in modes:
+            options = [t for t in trials if t["processes"] == processes and t["mode"] == mode]
+            if options:
+                per_mode[mode] = max(options, key=lambda t: t["throughput"])
+        if len(per_mode) == len(modes) and all(best_per_mode.values()):
+            score = math.exp(sum(math.log(per_mode[m]["throughput"] / best_per_mode[m]) for m in modes) / len(modes))
+            scores[processes] = (score, per_mode)
+    if not scores:
+        measured = sorted({t["mode"] for t in trials})
+        raise RuntimeError(f"No layout could be measured for every mode (only for {', '.join(measured)})")
+    processes, (score, per_mode) = max(scores.items(), key=lambda item: item[1][0])
+
+    return {
+        "version": PROFILE_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "host": {"node": platform.node(), "machine": platform.machine(), "physical_cores": len(cores),
+                 "logical_cpus": sum(len(c) for c in cores)},
+        "processes": processes,
+        "threads": per_mode[modes[0]]["threads"],
+        "slots": [slot._asdict() for slot in slots_for(processes, cores)],
+        "modes": {
+            mode: {k: per_mode[mode][k] for k in ("compute_type", "throughput", "latency_seconds")}
+            for mode in modes
+        },
+        "score": score,
+        "trials": trials,
+    }
+
+
+def load_profile(path: Optional[str] = None) -> Optional[dict]:
+    path = path or settings.cpu_profile_path
+    try:
+        with open(path) as f:
+            profile = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable CPU profile {path}: {e}")
+        return None
+    if profile.get("version") != PROFILE_VERSION:
+        logger.warning(f"Ignoring CPU profile {path} with unsupported version {profile.get('version')}")
+        return None
+    return profile
+
+
+def worker_slots(profile: Optional[dict], processes: Optional[int] = None) -> List[Slot]:
+    """The pinned slots to run: from the profile, or ``processes`` even splits of the cores."""
+    cores = physical_cores()
+    if processes is None and profile is not None:
+        usable = {cpu for core in cores for cpu in core}
+        slots = [Slot(**slot) for slot in profile["slots"]]
+        if all(set(slot.cpus) <= usable for slot in slots):
+            return slots
+        logger.warning("CPU profile was tuned for other CPUs; splitting the available cores evenly instead")
+        processes = profile["processes"]
+    return slots_for(min(processes or 1, len(cores)), cores)
+
+
+def apply_slot(slot: Slot, profile: Optional[dict]) -> None:
+    """Pin this process to ``slot`` and size the inference libraries to it (before importing them)."""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, slot.cpus)
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(slot.threads)
+    settings.whisper_cpu_threads = slot.threads
+    if settings.diarization_cpu_threads == 0:
+        settings.diarization_cpu_threads = slot.threads
+    if profile is not None:
+        from . import tasks
+        tasks.CPU_COMPUTE_TYPES.update({mode: entry["compute_type"] for mode, entry in profile["modes"].items()})
+
+
+def main(argv=None) -> None:
+    from .tasks import MODEL_SIZES
+
+    parser = argparse.ArgumentParser(description="Find the fastest worker CPU layout on this machine")
+    parser.add_argument("--modes", nargs="+", default=list(MODEL_SIZES), choices=list(MODEL_SIZES))
+    parser.add_argument("--compute-types", nargs="+", default=list(CPU_COMPUTE_TYPES))
+    parser.add_argument("--clip", help="audio file to benchmark with (default: synthetic clip)")
+    parser.add_argument("--clip-seconds", type=float, default=30.0)
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--trial-timeout", type=float, default=TRIAL_TIMEOUT_SECONDS, help="seconds before a trial is given up")
+    parser.add_argument("--out", default=settings.cpu_profile_path)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    clip = load_clip(args.clip, args.clip_seconds)
+    profile = tune(args.modes, args.compute_types, clip, args.repeat, args.trial_timeout)
+    with open(args.out, "w") as f:
+        json.dump(profile, f, indent=2)
+    logger.info(
+        f"Best layout: {profile['processes']} process(es) x {profile['threads']} thread(s); "
+        f"compute types {({m: e['compute_type'] for m, e in profile['modes'].items()})}; written to {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Measure API process startup: import time, peak RSS and which heavy libraries load.
+
+``backend.main`` is what uvicorn imports. A worker with its ML stack
+warmed up is shown alongside it: that is the cost the API used to pay when
+it imported ``tasks`` directly. Each probe runs in a fresh interpreter with
+a throwaway SQLite DB.
+
+    python -m backend.benchmarks.bench_api_startup
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from .harness import record
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+HEAVY_MODULES = ("torch", "faster_whisper", "ctranslate2", "pyannote", "googletrans", "pydub", "numpy")
+TARGETS = {
+    "api": "import backend.main",
+    "worker_warm": "import backend.tasks; backend.tasks.warm_up()",
+}
+
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": len(sys.modules),
+    "heavy_modules": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def probe(statement: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "PYTHONPATH": str(REPO_ROOT),
+            "DATABASE_URL": f"sqlite:///{tmp}/startup.db",
+        }
+        proc = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(statement=statement, heavy=HEAVY_MODULES)],
+            cwd=tmp, env=env, capture_output=True, text=True,
+        )
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr else f"exit {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run(quick: bool = False) -> list:
+    results = []
+    for name, statement in TARGETS.items():
+        stats = probe(statement)
+        if "error" in stats:
+            # The warm worker needs the full ML stack installed
+            results.append(record("startup.import", {"process": name}, seconds=None, **stats))
+        else:
+            results.append(record("startup.import", {"process": name}, **stats))
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,73 @@
+"""
+Estimate compute saved by cascade mode against whale for a range of re-decoded fractions.
+
+Decode cost is modelled as audio seconds times a relative cost per model.
+The defaults are rough CPU int8 ratios (large with beam 5 against tiny
+greedy); pass measured real-time factors to get numbers for a given host.
+
+    python -m backend.benchmarks.bench_cascade [draft_cost refine_cost]
+"""
+
+import json
+import sys
+import time
+
+import numpy as np
+
+from ..cascade import Segment, plan_regions, refined_fraction, splice
+from .harness import record
+
+DRAFT_COST = 1.0
+REFINE_COST = 24.0
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLDS = (-2.0, -1.5, -1.0, -0.8, -0.6, -0.4, -0.2)
+
+
+def synthetic_draft(n: int, seed: int = 0) -> list:
+    """Draft segments with a Whisper-like spread of avg_logprob values."""
+    rng = np.random.default_rng(seed)
+    durations = rng.uniform(2.0, 8.0, n)
+    gaps = rng.uniform(0.0, 1.5, n)
+    logprobs = -np.abs(rng.normal(0.35, 0.4, n))
+    no_speech = rng.beta(1, 12, n)
+    segments = []
+    t = 0.0
+    for i in range(n):
+        t += gaps[i]
+        segments.append(Segment(t, t + durations[i], f"segment {i}", float(logprobs[i]), float(no_speech[i])))
+        t += durations[i]
+    return segments
+
+
+def run(quick: bool = False, n_segments: int = 2000, draft_cost: float = DRAFT_COST, refine_cost: float = REFINE_COST) -> list:
+    draft = synthetic_draft(n_segments)
+    audio_seconds = draft[-1].end
+    whale_cost = audio_seconds * refine_cost
+    results = []
+    for threshold in LOGPROB_THRESHOLDS:
+        start = time.perf_counter()
+        regions = plan_regions(draft, threshold, NO_SPEECH_THRESHOLD)
+        refined = splice(draft, regions, lambda s, e: [Segment(0.0, e - s, "refined")])
+        elapsed = time.perf_counter() - start
+
+        redecoded = sum(r.end - r.start for r in regions)
+        cascade_cost = audio_seconds * draft_cost + redecoded * refine_cost
+        flagged = sum(r.last - r.first + 1 for r in regions)
+        results.append(record(
+            "cascade.compute_saved",
+            {"segments": n_segments, "logprob_threshold": threshold},
+            seconds=elapsed,
+            segments_redecoded_fraction=flagged / len(draft),
+            speech_redecoded_fraction=refined_fraction(draft, regions),
+            regions=len(regions),
+            segments_after_splice=len(refined),
+            cascade_cost=cascade_cost,
+            whale_cost=whale_cost,
+            compute_saved_fraction=1 - cascade_cost / whale_cost,
+        ))
+    return results
+
+
+if __name__ == "__main__":
+    costs = [float(arg) for arg in sys.argv[1:3]]
+    print(json.dumps(run(False, 2000, *costs), indent=2))
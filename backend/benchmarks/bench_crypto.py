@@ -0,0 +1,40 @@
+"""
+Time file and transcript encryption from 1 MB up to 1 GB.
+
+The 1 GB case needs several GB of RAM and only runs in the full suite.
+
+    python -m backend.benchmarks.bench_crypto
+"""
+
+import json
+import os
+
+from ..utils import decrypt, decrypt_bytes, encrypt, encrypt_bytes
+from .harness import record, timeit
+
+MB = 1024 * 1024
+SIZES_MB = (1, 16, 128, 1024)
+QUICK_SIZES_MB = (1, 16)
+
+
+def run(quick: bool = False) -> list:
+    results = []
+    for size_mb in QUICK_SIZES_MB if quick else SIZES_MB:
+        repeat = 1 if size_mb >= 128 else 3
+        data = os.urandom(size_mb * MB)
+        token = encrypt_bytes(data)
+        # Bound as defaults: the names are deleted below to free the memory
+        results.append(record("crypto.encrypt_bytes", {"mb": size_mb}, **timeit(lambda data=data: encrypt_bytes(data), repeat, warmup=0)))
+        results.append(record("crypto.decrypt_bytes", {"mb": size_mb}, **timeit(lambda token=token: decrypt_bytes(token), repeat, warmup=0)))
+        del data, token
+
+        text = "x" * (size_mb * MB)
+        text_token = encrypt(text)
+        results.append(record("crypto.encrypt_text", {"mb": size_mb}, **timeit(lambda text=text: encrypt(text), repeat, warmup=0)))
+        results.append(record("crypto.decrypt_text", {"mb": size_mb}, **timeit(lambda text_token=text_token: decrypt(text_token), repeat, warmup=0)))
+        del text, text_token
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
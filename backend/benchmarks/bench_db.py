@@ -0,0 +1,60 @@
+"""
+Time the queries behind ``GET /jobs`` and ``GET /jobs/{id}`` on SQLite.
+
+    python -m backend.benchmarks.bench_db
+"""
+
+import json
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from ..database import Base
+from ..models import TranscriptionJob, User
+from .harness import record, timeit
+
+USERS = 50
+JOBS_PER_USER = (10, 100, 1000)
+QUICK_JOBS_PER_USER = (10, 100)
+
+
+def _populate(db, jobs_per_user: int) -> None:
+    users = [User(email=f"user{u}@example.com", hashed_password="x") for u in range(USERS)]
+    db.add_all(users)
+    db.flush()
+    for user in users:
+        db.add_all([
+            TranscriptionJob(user_id=user.id, filename=f"audio_{j}.mp3", status="completed", transcript_encrypted="x" * 512)
+            for j in range(jobs_per_user)
+        ])
+    db.commit()
+
+
+def run(quick: bool = False) -> list:
+    results = []
+    for jobs_per_user in QUICK_JOBS_PER_USER if quick else JOBS_PER_USER:
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        _populate(db, jobs_per_user)
+        user_id = USERS // 2
+        job_id = db.query(TranscriptionJob.id).filter_by(user_id=user_id).first()[0]
+
+        def list_jobs():
+            db.expunge_all()
+            return db.query(TranscriptionJob).filter_by(user_id=user_id).order_by(TranscriptionJob.created_at.desc()).all()
+
+        def job_status():
+            db.expunge_all()
+            return db.query(TranscriptionJob).filter_by(id=job_id, user_id=user_id).first()
+
+        params = {"users": USERS, "jobs_per_user": jobs_per_user}
+        results.append(record("db.list_jobs", params, **timeit(list_jobs, repeat=20)))
+        results.append(record("db.job_status", params, **timeit(job_status, repeat=50)))
+        db.close()
+        engine.dispose()
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,30 @@
+"""
+Time every transcript exporter at several transcript sizes.
+
+    python -m backend.benchmarks.bench_export
+"""
+
+import json
+
+from ..export_utils import EXPORTERS
+from ..segments import SegmentTable
+from .fakes import synthetic_segments
+from .harness import record, timeit
+
+SIZES = (10, 100, 1000, 10000)
+QUICK_SIZES = (10, 100, 1000)
+
+
+def run(quick: bool = False) -> list:
+    results = []
+    for n in QUICK_SIZES if quick else SIZES:
+        segments = SegmentTable.from_dicts(synthetic_segments(n))
+        for fmt, (func, _, _) in EXPORTERS.items():
+            stats = timeit(lambda: func(segments), repeat=3 if n >= 1000 else 5)
+            size = len(func(segments).getvalue())
+            results.append(record(f"export.{fmt}", {"segments": n}, output_bytes=size, **stats))
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
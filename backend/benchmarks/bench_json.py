@@ -0,0 +1,29 @@
+"""
+Time transcript JSON serialization and parsing as the worker and API do it.
+
+    python -m backend.benchmarks.bench_json
+"""
+
+import json
+
+from .fakes import synthetic_segments
+from .harness import record, timeit
+
+SIZES = (100, 1000, 10000, 100000)
+QUICK_SIZES = (100, 1000, 10000)
+
+
+def run(quick: bool = False) -> list:
+    results = []
+    for n in QUICK_SIZES if quick else SIZES:
+        transcript = {"segments": synthetic_segments(n), "metadata": {"mode": "dolphin", "language": "en"}}
+        encoded = json.dumps(transcript, ensure_ascii=False)
+        repeat = 3 if n >= 10000 else 5
+        results.append(record("json.dumps", {"segments": n}, output_bytes=len(encoded.encode()),
+                              **timeit(lambda: json.dumps(transcript, ensure_ascii=False), repeat)))
+        results.append(record("json.loads", {"segments": n}, **timeit(lambda: json.loads(encoded), repeat)))
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,94 @@
+"""
+Benchmark the streaming NumPy restoration stage against the old pydub path.
+
+Each variant runs in a fresh process so peak RSS is measured in isolation.
+Both variants decode with ffmpeg and the pydub one also needs pydub; a
+variant that cannot run here is reported as skipped.
+
+    python -m backend.benchmarks.bench_restore [minutes ...]
+"""
+
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import wave
+
+import numpy as np
+
+from ..audio import decode_pcm, restore_pcm
+from .harness import measure_in_child, record
+
+SOURCE_RATE = 44100
+
+
+def make_wav(path: str, seconds: int) -> None:
+    """Write a quiet stereo 44.1 kHz speech-band test signal, one second at a time."""
+    rng = np.random.default_rng(0)
+    t = np.arange(SOURCE_RATE) / SOURCE_RATE
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(SOURCE_RATE)
+        for sec in range(seconds):
+            tone = 0.2 * np.sin(2 * np.pi * (220 + sec % 200) * t)
+            noise = 0.02 * rng.standard_normal(SOURCE_RATE)
+            mono = ((tone + noise) * 0.25 * 32767).astype(np.int16)
+            wav.writeframes(np.column_stack([mono, mono]).tobytes())
+
+
+def pydub_restore(path: str) -> None:
+    """The original restoration stage: whole file in pydub, normalized, re-exported."""
+    from pydub import AudioSegment, effects
+
+    audio = AudioSegment.from_file(path)
+    normalized = effects.normalize(audio)
+    normalized.export(path + ".restored.wav", format="wav")
+    os.remove(path + ".restored.wav")
+
+
+def numpy_restore(path: str) -> None:
+    pcm_path = path + ".pcm"
+    # Always spill to disk so this measures the streaming, memory-mapped path
+    pcm = restore_pcm(decode_pcm(path, pcm_path, mmap_min_seconds=0))
+    del pcm
+    os.remove(pcm_path)
+
+
+VARIANTS = {
+    "pydub": pydub_restore,
+    "numpy_stream": numpy_restore,
+}
+
+
+def missing_requirement(variant: str):
+    if shutil.which("ffmpeg") is None:
+        return "ffmpeg is not on PATH"
+    if variant == "pydub" and importlib.util.find_spec("pydub") is None:
+        return "pydub is not installed"
+    return None
+
+
+def run(quick: bool = False, durations_min=None) -> list:
+    durations_min = durations_min or ((1,) if quick else (1, 10, 60))
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for minutes in durations_min:
+            path = os.path.join(tmp, f"synthetic_{minutes}m.wav")
+            make_wav(path, minutes * 60)
+            for variant, fn in VARIANTS.items():
+                missing = missing_requirement(variant)
+                if missing:
+                    print(f"restore.{variant}: skipped, {missing}", file=sys.stderr)
+                    results.append(record(f"restore.{variant}", {"audio_minutes": minutes}, skipped=missing))
+                    continue
+                stats = measure_in_child(fn, path)
+                results.append(record(f"restore.{variant}", {"audio_minutes": minutes}, **stats))
+    return results
+
+
+if __name__ == "__main__":
+    durations = tuple(int(arg) for arg in sys.argv[1:])
+    print(json.dumps(run(durations_min=durations), indent=2))
@@ -0,0 +1,175 @@
+"""
+Model loads and throughput of the worker pool under each routing policy.
+
+A discrete-event simulation of a pool of workers fed a Poisson stream of
+jobs with a mixed mode and tier profile. Each policy decides which job an
+idle worker takes next and which models it keeps:
+
+- ``shared_per_job``: one queue per tier; every job loads its models in a
+  fresh work horse (the pool before routing, where models were not loaded
+  in the worker's main process).
+- ``shared_cached``: one queue per tier; workers keep their most recent
+  modes' models loaded (what a shared queue gives at best).
+- ``affinity``: per-mode sub-queues planned by ``routing.plan``, with the
+  same model cache, for a few ``AFFINITY_REBALANCE_DEPTH`` values. Lower
+  depths trade model loads for shorter waits when one mode bursts.
+
+Workers may also be recycled after ``max_jobs`` jobs, as ``WORKER_MAX_JOBS``
+does: the replacement reloads its home models before taking a job, and
+either keeps the modes its predecessor had adopted (what the supervisor
+does) or starts over from ``routing.initial_home``. The affinity policy is
+run with the old limit of 10 jobs both ways and with the default limit.
+
+Load and decode costs are rough CPU int8 figures; the ratios matter more
+than the absolute numbers.
+
+    python -m backend.benchmarks.bench_routing
+"""
+
+import heapq
+import json
+import random
+from collections import deque
+
+from .. import routing
+from .harness import record
+
+WORKERS = 4
+HOURS = 8
+LOADS = (0.6, 0.9, 1.1)
+MAX_MODES = 2
+REBALANCE_DEPTHS = (1, 2, 4)
+# (max_jobs, carry_home) of the recycled affinity runs, at AFFINITY_REBALANCE_DEPTH=2
+RECYCLING = ((10, False), (10, True), (500, True))
+# Seconds to load each model and seconds of decode per second of audio
+LOAD_SECONDS = {"cheetah": 3.0, "dolphin": 6.0, "whale": 45.0}
+REAL_TIME_FACTOR = {"cheetah": 0.05, "dolphin": 0.1, "whale": 0.6, "cascade": 0.05 + 0.3 * 0.6}
+MODE_MIX = {"cheetah": 0.35, "dolphin": 0.35, "whale": 0.2, "cascade": 0.1}
+PAID_SHARE = 0.3
+AUDIO_SECONDS = (60, 1800)
+
+
+def arrivals(load: float, workers: int, hours: float, seed: int) -> list:
+    """(time, tier, mode, audio seconds) jobs whose decode work is ``load`` x the pool's capacity."""
+    rng = random.Random(seed)
+    mean_audio = sum(AUDIO_SECONDS) / 2
+    mean_work = sum(share * REAL_TIME_FACTOR[mode] * mean_audio for mode, share in MODE_MIX.items())
+    rate = load * workers / mean_work
+    jobs, t = [], 0.0
+    while True:
+        t += rng.expovariate(rate)
+        if t >= hours * 3600:
+            return jobs
+        mode = rng.choices(list(MODE_MIX), weights=list(MODE_MIX.values()))[0]
+        tier = "paid" if rng.random() < PAID_SHARE else "free"
+        jobs.append((t, tier, mode, rng.uniform(*AUDIO_SECONDS)))
+
+
+def loaded_models(home: routing.HomeModes) -> set:
+    return {m for mode in routing.served_modes(home) for m in routing.required_modes(mode)}
+
+
+def simulate(
+    policy: str, jobs: list, workers: int, hours: float, rebalance_depth: int = 2,
+    max_jobs: int = None, carry_home: bool = True,
+) -> dict:
+    horizon = hours * 3600
+    homes = [routing.HomeModes(routing.initial_home(i), MAX_MODES) for i in range(workers)]
+    served = [0] * workers
+    queues = {name: deque() for name in routing.all_queue_names()}
+    idle = set(range(workers))
+    events = [(t, 0, i) for i, t in enumerate(job[0] for job in jobs)]
+    heapq.heapify(events)
+    loads = completed = 0
+    load_seconds = audio_done = 0.0
+    waits = []
+
+    def queue_order(worker: int) -> list:
+        if policy != "affinity":
+            return list(routing.TIERS)
+        depths = {name: len(queue) for name, queue in queues.items()}
+        counts = {}
+        for home in homes:
+            for mode in routing.served_modes(home):
+                counts[mode] = counts.get(mode, 0) + 1
+        return routing.plan(homes[worker], depths, counts, rebalance_depth)
+
+    while events:
+        now, kind, payload = heapq.heappop(events)
+        if now > horizon:
+            break
+        if kind == 0:
+            _, tier, mode, audio = jobs[payload]
+            name = routing.queue_name(tier, mode) if policy == "affinity" else tier
+            queues[name].append(payload)
+        elif kind == 1:
+            completed += 1
+            served[payload] += 1
+            if max_jobs and served[payload] >= max_jobs:
+                # Replaced: the new process loads its home models before taking jobs
+                served[payload] = 0
+                if not carry_home:
+                    homes[payload] = routing.HomeModes(routing.initial_home(payload), MAX_MODES)
+                cost = 0.0 if policy == "shared_per_job" else sum(LOAD_SECONDS[m] for m in loaded_models(homes[payload]))
+                loads += 0 if policy == "shared_per_job" else len(loaded_models(homes[payload]))
+                load_seconds += cost
+                heapq.heappush(events, (now + cost, 2, payload))
+            else:
+                idle.add(payload)
+        else:
+            idle.add(payload)
+
+        for worker in sorted(idle):
+            name = next((name for name in queue_order(worker) if queues[name]), None)
+            if name is None:
+                continue
+            index = queues[name].popleft()
+            arrived, _, mode, audio = jobs[index]
+            if policy == "shared_per_job":
+                missing = routing.required_modes(mode)
+            else:
+                loaded = loaded_models(homes[worker])
+                missing = [m for m in routing.required_modes(mode) if m not in loaded]
+                homes[worker].adopt(mode)
+            cost = sum(LOAD_SECONDS[m] for m in missing)
+            loads += len(missing)
+            load_seconds += cost
+            audio_done += audio
+            waits.append(now - arrived)
+            idle.discard(worker)
+            heapq.heappush(events, (now + cost + audio * REAL_TIME_FACTOR[mode], 1, worker))
+
+    waits.sort()
+    return {
+        "jobs": len(jobs),
+        "completed": completed,
+        "jobs_per_hour": completed / hours,
+        "model_loads_per_hour": loads / hours,
+        "load_share": load_seconds / (workers * horizon),
+        "audio_hours_per_hour": audio_done / 3600 / hours,
+        "mean_wait_seconds": sum(waits) / len(waits) if waits else 0.0,
+        "p95_wait_seconds": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+    }
+
+
+def run(quick: bool = False) -> list:
+    results = []
+    hours = 2 if quick else HOURS
+    for load in LOADS:
+        jobs = arrivals(load, WORKERS, hours, seed=int(load * 100))
+        variants = [("shared_per_job", None, None, True), ("shared_cached", None, None, True)]
+        variants += [("affinity", depth, None, True) for depth in REBALANCE_DEPTHS]
+        variants += [("affinity", 2, max_jobs, carry_home) for max_jobs, carry_home in RECYCLING]
+        for policy, depth, max_jobs, carry_home in variants:
+            stats = simulate(policy, jobs, WORKERS, hours, depth, max_jobs, carry_home)
+            params = {"policy": policy, "load": load, "workers": WORKERS}
+            if depth is not None:
+                params["rebalance_depth"] = depth
+            if max_jobs is not None:
+                params.update(max_jobs=max_jobs, carry_home=carry_home)
+            results.append(record("routing.pool", params, seconds=None, **stats))
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,128 @@
+"""
+Search over 100k transcripts: the FTS5 index against decrypting and scanning.
+
+Builds a SQLite database of transcripts (gzip + Fernet, as the worker
+stores them) spread over ``USERS`` users, indexes every one through
+``SearchIndex.index_job`` as the worker does, and reports build time,
+database size and query latency for rare, common and phrase queries.
+The baseline is what search cost before the index: decrypt and scan every
+transcript of the user. Words follow a Zipf distribution over a synthetic
+vocabulary so hit counts look like real speech.
+
+The database runs in WAL mode with synchronous=NORMAL, so the build is not
+dominated by one fsync per job.
+
+    python -m backend.benchmarks.bench_search
+"""
+
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event
+
+from ..search import create_index
+from ..segments import SegmentTable
+from ..transcripts import load_transcript, pack_transcript
+from .harness import record, timeit
+
+TRANSCRIPTS = 100_000
+QUICK_TRANSCRIPTS = 5_000
+USERS = 100
+SEGMENTS_PER_TRANSCRIPT = 10
+VOCABULARY = [f"w{i}" for i in range(20_000)]
+# Zipf weights: word k is about 1/k as frequent as the most common word
+CUM_WEIGHTS = list(itertools.accumulate(1 / (k + 1) for k in range(len(VOCABULARY))))
+
+
+def synthetic_segments(rng: random.Random) -> SegmentTable:
+    return SegmentTable.from_columns(
+        [i * 5.0 for i in range(SEGMENTS_PER_TRANSCRIPT)],
+        [i * 5.0 + 4.8 for i in range(SEGMENTS_PER_TRANSCRIPT)],
+        ["Speaker 1"] * SEGMENTS_PER_TRANSCRIPT,
+        [" ".join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=rng.randint(8, 16))) for _ in range(SEGMENTS_PER_TRANSCRIPT)],
+    )
+
+
+def _engine(path: str):
+    engine = create_engine(f"sqlite:///{path}")
+
+    @event.listens_for(engine, "connect")
+    def _pragmas(conn, _):
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+    return engine
+
+
+def scan(stored: list, words: list) -> list:
+    """The pre-index approach: decrypt every transcript and look for the words."""
+    hits = []
+    for job_id, token in stored:
+        segments = load_transcript(token).segments
+        for i, text in enumerate(segments.texts()):
+            text = text.split()
+            if all(word in text for word in words):
+                hits.append((job_id, i, segments.starts[i]))
+    return hits
+
+
+def run(quick: bool = False) -> list:
+    n = QUICK_TRANSCRIPTS if quick else TRANSCRIPTS
+    rng = random.Random(42)
+    user_id = 1
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "search.db")
+        engine = _engine(path)
+        index = create_index(engine, key=b"benchmark-key")
+        index.ensure_schema()
+
+        heavy_user = []
+        build_start = time.perf_counter()
+        for job_id in range(1, n + 1):
+            owner = job_id % USERS + 1
+            segments = synthetic_segments(rng)
+            index.index_job(job_id, owner, segments)
+            if owner == user_id:
+                heavy_user.append((job_id, pack_transcript(segments, {})))
+        build_seconds = time.perf_counter() - build_start
+        engine.dispose()
+
+        params = {"transcripts": n, "users": USERS, "segments_per_transcript": SEGMENTS_PER_TRANSCRIPT}
+        results.append(record(
+            "search.build", params,
+            seconds=build_seconds,
+            per_transcript_ms=build_seconds / n * 1000,
+            db_bytes=sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p)),
+        ))
+
+        engine = _engine(path)
+        index = create_index(engine, key=b"benchmark-key")
+        queries = {
+            "common": "w0",
+            "mid": "w50",
+            "rare": "w5000",
+            "two_words": "w1 w20",
+            "phrase": '"w0 w1"',
+        }
+        for name, query in queries.items():
+            hits = index.search(user_id, query, limit=50)
+            results.append(record("search.query", {**params, "query": name}, hits=len(hits),
+                                  **timeit(lambda: index.search(user_id, query, limit=50), repeat=20)))
+
+        # Baseline over the same user's transcripts
+        results.append(record(
+            "search.scan", {**params, "query": "rare"},
+            user_transcripts=len(heavy_user),
+            **timeit(lambda: scan(heavy_user, ["w5000"]), repeat=1 if not quick else 3, warmup=0),
+        ))
+        engine.dispose()
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,70 @@
+"""
+SegmentTable against the list-of-dicts + JSON representation.
+
+For each size this reports the memory a parsed transcript keeps alive, the
+time to serialize and to parse it, and the time from stored bytes to a TXT
+export (parse + render), which is what a download pays.
+
+    python -m backend.benchmarks.bench_segments
+"""
+
+import json
+import tracemalloc
+
+from ..export_utils import _format_ts, segments_to_txt
+from ..segments import SegmentTable
+from .fakes import synthetic_segments
+from .harness import record, timeit
+
+SIZES = (1000, 10000, 100000)
+QUICK_SIZES = (1000, 10000)
+
+
+def retained_bytes(build) -> int:
+    """Bytes still allocated by the object ``build()`` returns."""
+    tracemalloc.start()
+    try:
+        obj = build()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del obj
+    return current
+
+
+def txt_from_dicts(segments: list) -> bytes:
+    """The TXT exporter as it worked on dicts, for the baseline."""
+    return "\n".join(
+        f"[{_format_ts(s['start'], ':')} - {_format_ts(s['end'], ':')}] {s.get('speaker', 'Speaker')}: {s.get('text', '')}"
+        for s in segments
+    ).encode()
+
+
+def run(quick: bool = False) -> list:
+    results = []
+    for n in QUICK_SIZES if quick else SIZES:
+        dicts = synthetic_segments(n)
+        table = SegmentTable.from_dicts(dicts)
+        encoded = json.dumps(dicts, ensure_ascii=False).encode()
+        blob = table.to_bytes()
+        repeat = 3 if n >= 100000 else 5
+
+        for fmt, serialize, parse, data in (
+            ("dicts_json", lambda: json.dumps(dicts, ensure_ascii=False).encode(), lambda: json.loads(encoded), encoded),
+            ("columnar", table.to_bytes, lambda: SegmentTable.from_bytes(blob), blob),
+        ):
+            params = {"segments": n, "format": fmt}
+            results.append(record("segments.memory", params, seconds=None,
+                                  retained_bytes=retained_bytes(parse), serialized_bytes=len(data)))
+            results.append(record("segments.serialize", params, **timeit(serialize, repeat)))
+            results.append(record("segments.parse", params, **timeit(parse, repeat)))
+
+        results.append(record("segments.export_txt", {"segments": n, "format": "dicts_json"},
+                              **timeit(lambda: txt_from_dicts(json.loads(encoded)), repeat)))
+        results.append(record("segments.export_txt", {"segments": n, "format": "columnar"},
+                              **timeit(lambda: segments_to_txt(SegmentTable.from_bytes(blob)), repeat)))
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,47 @@
+"""
+Time merging transcription segments with diarization turns.
+
+Uses the fake diarization pipeline, so only the merge in
+``assign_speakers`` (the part of ``recognize_speakers`` after inference)
+is measured.
+
+    python -m backend.benchmarks.bench_speakers
+"""
+
+import json
+
+from ..speakers import assign_speakers
+from .fakes import SAMPLE_RATE, FakeDiarizationPipeline, FakeWhisperModel
+from .harness import record, timeit
+
+SIZES = (100, 1000, 5000)
+QUICK_SIZES = (100, 1000)
+
+
+class _Samples:
+    """Stands in for a PCM buffer of a given length without allocating it."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def __len__(self) -> int:
+        return int(self.seconds * SAMPLE_RATE)
+
+
+def run(quick: bool = False) -> list:
+    results = []
+    pipeline = FakeDiarizationPipeline()
+    for n in QUICK_SIZES if quick else SIZES:
+        audio = _Samples(n * 5.0)
+        segments = list(FakeWhisperModel().transcribe(audio)[0])
+        turns = [
+            (turn.start, turn.end, f"Speaker {label}")
+            for turn, _, label in pipeline(audio).itertracks(yield_label=True)
+        ]
+        stats = timeit(lambda: assign_speakers(segments, turns), repeat=3)
+        results.append(record("speakers.assign", {"segments": n, "turns": len(turns)}, **stats))
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,123 @@
+"""
+Storage and egress of transcripts in each stored format.
+
+For a corpus of synthetic transcripts this reports the bytes stored per row
+and the time to write and read it for the formats the API reads: untagged
+(Fernet of plain JSON), ``gz:`` (gzip JSON), ``sc:`` with only the columns
+(written before the JSON stream was stored alongside them) and ``sc:`` with
+both (what the worker writes now). It also reports the bytes sent for
+``?format=json`` with and without gzip, the time to produce the gzip body
+of ``?format=json`` as the API does, and the peak memory allocated
+while packing one transcript (what the worker holds on top of the segments
+when it saves a transcript). Word order is shuffled per segment
+so the text compresses closer to real speech than ``synthetic_segments``
+alone would.
+
+    python -m backend.benchmarks.bench_storage
+"""
+
+import gzip
+import json
+import random
+import tracemalloc
+
+from ..segments import SegmentTable
+from ..transcripts import GZIP_TAG, SECTION_SEPARATOR, load_transcript, pack_transcript, transcript_body
+from ..utils import encrypt, encrypt_bytes
+from .fakes import WORDS, synthetic_segments
+from .harness import record, timeit
+
+SIZES = (100, 1000, 10000, 50000)
+QUICK_SIZES = (100, 1000)
+CORPUS_TRANSCRIPTS = 20
+
+
+def synthetic_transcript(n: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    segments = synthetic_segments(n)
+    for segment in segments:
+        segment["start"] += round(rng.uniform(0, 0.5), 3)
+        segment["text"] = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20)))
+    return {"segments": segments, "metadata": {"mode": "dolphin", "language": "en", "processing_time": rng.uniform(1, 600)}}
+
+
+def pack_legacy(transcript: dict) -> str:
+    return encrypt(json.dumps(transcript, ensure_ascii=False))
+
+
+def pack_gzip_json(transcript: dict) -> str:
+    body = json.dumps(transcript, ensure_ascii=False, separators=(",", ":")).encode()
+    return GZIP_TAG + encrypt_bytes(gzip.compress(body, compresslevel=6, mtime=0)).decode()
+
+
+def pack_columnar(transcript: dict) -> str:
+    return pack_transcript(SegmentTable.from_dicts(transcript["segments"]), transcript["metadata"])
+
+
+def pack_columns_only(transcript: dict) -> str:
+    return pack_columnar(transcript).split(SECTION_SEPARATOR)[0]
+
+
+FORMATS = {"legacy": pack_legacy, "gzip_json": pack_gzip_json, "columns_only": pack_columns_only, "columnar": pack_columnar}
+
+
+def serve_json(stored: str) -> bytes:
+    """The body of ``?format=json`` for a client accepting gzip, as ``main.get_transcript`` builds it."""
+    body, encoding = transcript_body(stored)
+    return body if encoding == "gzip" else gzip.compress(body, compresslevel=1)
+
+
+def peak_allocated(fn) -> int:
+    """Peak bytes allocated by ``fn`` beyond what was allocated when it started."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(quick: bool = False) -> list:
+    results = []
+    for n in QUICK_SIZES if quick else SIZES:
+        corpus = [synthetic_transcript(n, seed) for seed in range(CORPUS_TRANSCRIPTS if n <= 10000 else 3)]
+        # What Starlette's JSONResponse sent for the decoded transcript
+        json_bytes = sum(len(json.dumps(t, ensure_ascii=False, separators=(",", ":")).encode()) for t in corpus)
+        repeat = 3 if n >= 10000 else 5
+        legacy_stored = None
+        for fmt, pack in FORMATS.items():
+            stored = [pack(t) for t in corpus]
+            stored_bytes = sum(len(s) for s in stored)
+            legacy_stored = legacy_stored or stored_bytes
+            gzip_egress = sum(len(serve_json(s)) for s in stored)
+            params = {"segments": n, "format": fmt}
+            results.append(record(
+                "storage.transcript_bytes", params,
+                seconds=None,
+                transcripts=len(corpus),
+                stored_bytes=stored_bytes,
+                stored_ratio=stored_bytes / legacy_stored,
+                json_egress_bytes=json_bytes,
+                gzip_egress_bytes=gzip_egress,
+                egress_ratio=gzip_egress / json_bytes,
+            ))
+            results.append(record("storage.write", params, **timeit(lambda: pack(corpus[0]), repeat)))
+            if fmt == "columnar":
+                # The worker packs a table it already holds
+                table = SegmentTable.from_dicts(corpus[0]["segments"])
+                peak = peak_allocated(lambda: pack_transcript(table, corpus[0]["metadata"]))
+            else:
+                peak = peak_allocated(lambda: pack(corpus[0]))
+            results.append(record(
+                "storage.write_peak", params,
+                seconds=None,
+                peak_bytes=peak,
+                peak_ratio=peak / len(json.dumps(corpus[0], ensure_ascii=False).encode()),
+            ))
+            results.append(record("storage.read", params, **timeit(lambda: load_transcript(stored[0]), repeat)))
+            results.append(record("storage.serve_json", params, **timeit(lambda: serve_json(stored[0]), repeat)))
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
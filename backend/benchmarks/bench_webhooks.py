@@ -0,0 +1,163 @@
+"""
+A burst of Stripe webhook deliveries: acknowledgement time and batched processing.
+
+Thousands of signed synthetic events (checkouts, cancellations and failed
+payments for a pool of users, a share of them redelivered) are posted to
+``POST /stripe/webhook`` against an in-memory Redis, then drained into a
+SQLite file by ``webhooks.WebhookProcessor`` at several batch sizes. A
+batch size of 1 is one lookup and one commit per event, which is what the
+webhook used to do inline before acknowledging.
+
+    python -m backend.benchmarks.bench_webhooks
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import fakeredis
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .. import payments, webhooks
+from ..config import settings
+from ..database import Base
+from ..models import User
+from .harness import record
+from .loadtest import percentiles
+
+USERS = 1000
+EVENTS = 5000
+QUICK_EVENTS = 1000
+REDELIVERED_SHARE = 0.2
+BATCH_SIZES = (1, 50, 500)
+# Creation time of the first synthetic event; each later one is a second newer
+CREATED = 1_700_000_000
+EVENT_MIX = {"checkout.session.completed": 0.6, "customer.subscription.deleted": 0.3, "invoice.payment_failed": 0.1}
+
+
+def synthetic_events(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    types, weights = zip(*EVENT_MIX.items())
+    events = []
+    for n in range(count):
+        user = rng.randrange(USERS)
+        event_type = rng.choices(types, weights)[0]
+        if event_type == "checkout.session.completed":
+            obj = {"object": "checkout.session", "metadata": {"user_id": str(user + 1), "email": f"user{user}@example.com"}}
+        else:
+            obj = {"object": event_type.split(".")[1], "customer_email": f"user{user}@example.com"}
+        events.append({"id": f"evt_{seed}_{n}", "object": "event", "type": event_type, "created": CREATED + n, "data": {"object": obj}})
+    return events
+
+
+def deliveries(events: list, seed: int = 0) -> list:
+    """Signed request bodies in delivery order, with some events redelivered later on."""
+    rng = random.Random(seed)
+    bodies = [json.dumps(event).encode() for event in events]
+    redelivered = rng.sample(bodies, int(len(bodies) * REDELIVERED_SHARE))
+    out = bodies + redelivered
+    rng.shuffle(out)
+    return [(body, sign(body)) for body in out]
+
+
+def sign(body: bytes) -> str:
+    timestamp = int(time.time())
+    signature = hmac.new(settings.stripe_webhook_secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def expected_entitlements(events: list) -> dict:
+    """Entitlement each user should end up with (that of their newest event), by user ID."""
+    final = {}
+    for event in sorted(events, key=lambda e: e["created"]):
+        if event["type"] == "checkout.session.completed":
+            final[int(event["data"]["object"]["metadata"]["user_id"])] = True
+        elif event["type"] == "customer.subscription.deleted":
+            final[int(event["data"]["object"]["customer_email"][len("user"):].split("@")[0]) + 1] = False
+    return final
+
+
+def deliver(redis_conn, signed: list) -> dict:
+    app = FastAPI()
+    app.include_router(payments.router)
+    payments.redis_conn = redis_conn
+    latencies, duplicates = [], 0
+    with TestClient(app) as client:
+        start = time.perf_counter()
+        for body, signature in signed:
+            t0 = time.perf_counter()
+            response = client.post("/stripe/webhook", content=body, headers={"stripe-signature": signature})
+            latencies.append(time.perf_counter() - t0)
+            response.raise_for_status()
+            duplicates += response.json()["status"] == "duplicate"
+        elapsed = time.perf_counter() - start
+    spread = percentiles(latencies)
+    return {
+        "seconds": elapsed,
+        "p50_ms": spread["p50"] * 1000,
+        "p99_ms": spread["p99"] * 1000,
+        "duplicates": duplicates,
+    }
+
+
+def drain(redis_conn, events: list, batch_size: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'webhooks.db'}")
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            db.add_all([User(id=u + 1, email=f"user{u}@example.com", hashed_password="x") for u in range(USERS)])
+            db.commit()
+
+        processor = webhooks.WebhookProcessor(redis_conn, session_factory=Session, batch_size=batch_size, consumer=f"bench-{batch_size}")
+        start = time.perf_counter()
+        while processor.run_once(block_ms=0):
+            pass
+        elapsed = time.perf_counter() - start
+
+        with Session() as db:
+            paid = dict(db.query(User.id, User.is_paid).all())
+        engine.dispose()
+    wrong = sum(paid[user_id] != is_paid for user_id, is_paid in expected_entitlements(events).items())
+    if wrong:
+        raise AssertionError(f"{wrong} user(s) ended with the wrong entitlement at batch size {batch_size}")
+    return {"seconds": elapsed, "events_per_second": len(events) / elapsed}
+
+
+def run(quick: bool = False) -> list:
+    # The per-event log lines of failed payments would drown the output
+    logging.getLogger("webhooks").setLevel(logging.ERROR)
+    logging.getLogger("payments").setLevel(logging.WARNING)
+    count = QUICK_EVENTS if quick else EVENTS
+    events = synthetic_events(count)
+    signed = deliveries(events)
+    results = []
+
+    redis_conn = fakeredis.FakeRedis()
+    stats = deliver(redis_conn, signed)
+    if stats["duplicates"] != len(signed) - count:
+        raise AssertionError(f"{stats['duplicates']} redeliveries dropped, expected {len(signed) - count}")
+    results.append(record("webhooks.ack", {"events": count, "deliveries": len(signed)}, **stats))
+    queued = redis_conn.xrange(webhooks.STREAM_KEY)
+
+    for batch_size in BATCH_SIZES:
+        # Replay the same queued burst for every batch size
+        redis_conn.delete(webhooks.STREAM_KEY)
+        for _, fields in queued:
+            redis_conn.xadd(webhooks.STREAM_KEY, fields)
+        webhooks.WebhookProcessor(redis_conn).ensure_group()
+        params = {"events": count, "users": USERS, "batch_size": batch_size}
+        results.append(record("webhooks.drain", params, **drain(redis_conn, events, batch_size)))
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,63 @@
+"""
+Compare two runner reports and flag regressions.
+
+    python -m backend.benchmarks.compare base.json head.json [--threshold 0.10]
+
+Rows are matched on name and params. A row regresses when its best time
+grows by more than the threshold; the exit status is 1 if any did.
+"""
+
+import argparse
+import json
+import sys
+
+# Timings this small are dominated by noise
+MIN_SECONDS = 1e-4
+
+
+def _key(row: dict) -> str:
+    return f"{row['name']} {json.dumps(row.get('params', {}), sort_keys=True)}"
+
+
+def compare(base: dict, head: dict, threshold: float) -> list:
+    base_rows = {_key(r): r for r in base["results"]}
+    rows = []
+    for row in head["results"]:
+        key = _key(row)
+        if key not in base_rows:
+            continue
+        before, after = base_rows[key].get("seconds"), row.get("seconds")
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else 0.0
+        regressed = change > threshold and after > MIN_SECONDS
+        rows.append({"benchmark": key, "base": before, "head": after, "change": change, "regressed": regressed})
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown, as a fraction")
+    parser.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    rows = compare(base, head, args.threshold)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"{base.get('commit', '?')[:10]} -> {head.get('commit', '?')[:10]}")
+        for row in rows:
+            flag = "REGRESSION" if row["regressed"] else ""
+            print(f"{row['change']:+8.1%}  {row['base']:.6f}s -> {row['head']:.6f}s  {row['benchmark']}  {flag}")
+    return 1 if any(r["regressed"] for r in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Deterministic stand-ins for the ML stack and synthetic transcript data.
+
+They mirror the parts of the faster-whisper, pyannote and googletrans APIs
+the worker uses, so benchmarks and load tests run offline without weights.
+"""
+
+import time
+from typing import Iterator, List, NamedTuple, Optional
+
+SAMPLE_RATE = 16000
+SEGMENT_SECONDS = 5.0
+TURN_SECONDS = 12.0
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while transcription models "
+    "listen carefully to every speaker in the meeting and write it down"
+).split()
+
+# Rough relative cost of each model size, used to scale fake latency
+SIZE_COST = {"tiny": 1.0, "base": 2.0, "small": 4.0, "medium": 10.0, "large": 24.0}
+
+
+class FakeSegment(NamedTuple):
+    id: int
+    start: float
+    end: float
+    text: str
+    avg_logprob: float
+    no_speech_prob: float
+
+
+class FakeTranscriptionInfo(NamedTuple):
+    language: str
+    language_probability: float
+    duration: float
+
+
+def synthetic_text(i: int, words: int = 12) -> str:
+    return " ".join(WORDS[(i * 7 + k) % len(WORDS)] for k in range(words))
+
+
+def synthetic_segments(n: int, speakers: int = 3) -> List[dict]:
+    """Transcript segments shaped like the worker's output."""
+    return [
+        {
+            "start": i * SEGMENT_SECONDS,
+            "end": (i + 1) * SEGMENT_SECONDS - 0.2,
+            "speaker": f"Speaker {i // 3 % speakers + 1}",
+            "text": synthetic_text(i),
+        }
+        for i in range(n)
+    ]
+
+
+def audio_seconds(audio) -> float:
+    if hasattr(audio, "__len__") and not isinstance(audio, str):
+        return len(audio) / SAMPLE_RATE
+    return 60.0
+
+
+class FakeWhisperModel:
+    """Emits one segment per five seconds of audio.
+
+    ``rtf`` is the real-time factor of the tiny model; larger sizes are
+    scaled by ``SIZE_COST`` so latency is a function of audio length and mode.
+    """
+
+    def __init__(self, size: str = "base", rtf: float = 0.0, **kwargs):
+        self.size = size
+        self.rtf = rtf * SIZE_COST.get(size, 1.0)
+
+    def transcribe(self, audio, language: Optional[str] = None, task: str = "transcribe", **kwargs):
+        duration = audio_seconds(audio)
+        info = FakeTranscriptionInfo(language or "en", 0.99, duration)
+        return self._segments(duration), info
+
+    def _segments(self, duration: float) -> Iterator[FakeSegment]:
+        n = int(duration // SEGMENT_SECONDS) + (1 if duration % SEGMENT_SECONDS else 0)
+        for i in range(n):
+            start = i * SEGMENT_SECONDS
+            end = min(duration, start + SEGMENT_SECONDS)
+            if self.rtf:
+                time.sleep((end - start) * self.rtf)
+            logprob = -((i * 37) % 100) / 100.0
+            yield FakeSegment(i, start, end, synthetic_text(i), logprob, 0.01)
+
+
+class FakeTurn(NamedTuple):
+    start: float
+    end: float
+
+
+class FakeAnnotation:
+    def __init__(self, duration: float, speakers: int):
+        self.duration = duration
+        self.speakers = speakers
+
+    def itertracks(self, yield_label: bool = False):
+        t, i = 0.0, 0
+        while t < self.duration:
+            turn = FakeTurn(t, min(self.duration, t + TURN_SECONDS))
+            label = f"SPEAKER_{i % self.speakers:02d}"
+            yield (turn, i, label) if yield_label else (turn, i)
+            t += TURN_SECONDS
+            i += 1
+
+
+class FakeDiarizationPipeline:
+    """Alternates speakers every twelve seconds."""
+
+    def __init__(self, speakers: int = 3, rtf: float = 0.0):
+        self.speakers = speakers
+        self.rtf = rtf
+
+    def __call__(self, audio) -> FakeAnnotation:
+        if isinstance(audio, dict):
+            duration = audio["waveform"].shape[-1] / audio["sample_rate"]
+        else:
+            duration = audio_seconds(audio)
+        if self.rtf:
+            time.sleep(duration * self.rtf)
+        return FakeAnnotation(duration, self.speakers)
+
+
+class FakeTranslation(NamedTuple):
+    text: str
+
+
+class FakeTranslator:
+    def translate(self, text: str, dest: str = "en") -> FakeTranslation:
+        return FakeTranslation(f"[{dest}] {text}")
+
+
+MEDIA_MAGIC = b"FAKEMEDIA"
+
+
+def synthetic_media(seconds: float, kbps: int = 128) -> bytes:
+    """An upload of ``seconds`` of "audio", sized like a ``kbps`` encoding of it.
+
+    Only ``FakeDecoder`` understands it; the duration is in the header and
+    the rest is filler.
+    """
+    header = MEDIA_MAGIC + f" {seconds:.3f}\n".encode()
+    size = max(len(header), int(seconds * kbps * 125))
+    filler = bytes(range(256)) * (size // 256 + 1)
+    return header + filler[:size - len(header)]
+
+
+class FakeDecoder:
+    """Stands in for ``audio.decode_pcm`` on ``synthetic_media`` files.
+
+    Returns silence of the encoded duration after ``rtf`` seconds per audio
+    second. The buffer is allocated lazily by the OS, so long clips cost no
+    memory until something writes to them.
+    """
+
+    def __init__(self, rtf: float = 0.0):
+        self.rtf = rtf
+
+    def __call__(self, path: str, pcm_path: str = None, mmap_min_seconds: float = 600):
+        import numpy as np
+
+        with open(path, "rb") as f:
+            header = f.readline()
+        if not header.startswith(MEDIA_MAGIC):
+            raise ValueError(f"{path} is not synthetic media")
+        seconds = float(header[len(MEDIA_MAGIC):])
+        if self.rtf:
+            time.sleep(seconds * self.rtf)
+        return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
@@ -0,0 +1,59 @@
+"""Shared timing helpers for the benchmark modules."""
+
+import multiprocessing
+import resource
+import time
+from typing import Any, Callable
+
+
+def timeit(fn: Callable[[], Any], repeat: int = 5, warmup: int = 1) -> dict:
+    """Time ``fn`` several times and report the best and mean wall time."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {
+        "seconds": min(samples),
+        "mean_seconds": sum(samples) / len(samples),
+        "repeat": repeat,
+    }
+
+
+def _child(fn: Callable, args: tuple, conn) -> None:
+    start = time.perf_counter()
+    extra = fn(*args)
+    elapsed = time.perf_counter() - start
+    result = {"seconds": elapsed, "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    if isinstance(extra, dict):
+        result.update(extra)
+    conn.send(result)
+    conn.close()
+
+
+def measure_in_child(fn: Callable, *args) -> dict:
+    """Run ``fn(*args)`` in a fresh interpreter and report its wall time and peak RSS.
+
+    ``fn`` must be importable (module level). A dict it returns is merged
+    into the result.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(fn, args, child))
+    proc.start()
+    # Drop our copy of the child's end so recv() fails instead of hanging if it dies
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        raise RuntimeError(f"{fn.__name__} failed in the child process") from None
+    finally:
+        proc.join()
+    return result
+
+
+def record(name: str, params: dict, **stats) -> dict:
+    """One machine-readable result row; ``name`` plus ``params`` identify it across runs."""
+    return {"name": name, "params": params, **stats}
@@ -0,0 +1,608 @@
+"""
+Offline end-to-end load test of the API and the worker pool.
+
+Runs the real FastAPI app under uvicorn and real rq workers against local
+stand-ins: an in-memory Redis (fakeredis), SQLite, and the fakes in
+``fakes`` for Whisper,
+diarization, translation and audio decoding. Fake Whisper latency is a
+function of audio length and model size, so queues build up as they would
+in production with the model cost scaled down by ``--rtf``.
+
+Virtual users, a share of them on the paid tier, loop until ``--duration``
+has passed: upload a file (multipart, or through a resumable upload session
+for ``--chunked-share`` of uploads), poll its status with conditional
+requests until it finishes, export the transcript and think before the next
+one. Every ``--bulk-every`` finished jobs they also list their jobs and bulk
+export the latest ones. Free users' daily caps are reset before each upload
+so free traffic keeps flowing.
+
+The report gives throughput and latency percentiles per endpoint, job
+turnaround per tier as the client saw it, queue wait per tier from the
+workers' job traces, and jobs and audio processed overall. ``--out`` writes
+it in the benchmark runner's format, so ``compare`` can diff two runs.
+
+    python -m backend.benchmarks.loadtest --users 20 --workers 4 --duration 120 [--processes] [--out load.json]
+
+Workers are threads in this process by default. ``--redis-url`` runs
+against a real (scratch) Redis instead of the stand-in; with it,
+``--processes`` runs the workers as separate processes, as in production.
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional
+
+from .fakes import (
+    SAMPLE_RATE,
+    FakeDecoder,
+    FakeDiarizationPipeline,
+    FakeTranslator,
+    FakeWhisperModel,
+    synthetic_media,
+)
+from .harness import record
+from .runner import git_commit
+
+# Nothing from the backend package is imported at module level: its settings
+# are read from the environment on import, and ``configure`` sets that first
+
+logger = logging.getLogger("loadtest")
+
+FINISHED = ("completed", "failed")
+EXPORT_FORMATS = ("txt", "srt", "vtt", "json", "docx")
+
+
+class VirtualUser(NamedTuple):
+    id: int
+    tier: str
+    token: str
+
+
+class Stats:
+    """Request latencies by endpoint and job outcomes, shared by all virtual users."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(list)
+        self.jobs: List[dict] = []
+
+    def request(self, endpoint: str, seconds: float, status: int) -> None:
+        with self._lock:
+            self.requests[endpoint].append((seconds, status))
+
+    def job(self, **job) -> None:
+        with self._lock:
+            self.jobs.append(job)
+
+
+def use_redis_standin():
+    """Point the API and the worker threads at an in-memory Redis (before ``main`` and ``tasks`` import it)."""
+    from fakeredis import FakeRedis
+
+    from .. import producer
+
+    producer.redis_conn = FakeRedis()
+
+
+def configure(workdir: str, redis_url: Optional[str]) -> None:
+    """Point the backend's settings at the stand-ins (before anything imports it)."""
+    from cryptography.fernet import Fernet
+
+    metrics_dir = os.path.join(workdir, "metrics")
+    os.makedirs(metrics_dir, exist_ok=True)
+    os.environ.update({
+        # Nothing connects to this unless a real Redis was given
+        "REDIS_URL": redis_url or "redis://127.0.0.1:1/0",
+        # The API and worker processes must share the key
+        "FERNET_KEY": Fernet.generate_key().decode(),
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "PROMETHEUS_MULTIPROC_DIR": metrics_dir,
+        # Keep every job's trace for the report
+        "TRACE_HISTORY": "1000000",
+        # Workers notice backlogs and stop requests sooner
+        "AFFINITY_POLL_SECONDS": "1",
+    })
+
+
+def install_fakes(args) -> None:
+    """Swap the ML stack and ffmpeg decoding in ``tasks`` for the deterministic fakes."""
+    from .. import tasks
+
+    models = {}
+    pipeline = FakeDiarizationPipeline(rtf=args.diarization_rtf)
+    translator = FakeTranslator()
+
+    def get_model(mode: str) -> FakeWhisperModel:
+        size = tasks.MODEL_SIZES.get(mode.lower(), "base")
+        if size not in models:
+            models[size] = FakeWhisperModel(size, rtf=args.rtf)
+        return models[size]
+
+    def diarize(pcm) -> list:
+        annotation = pipeline({"waveform": pcm[None, :], "sample_rate": SAMPLE_RATE})
+        return [
+            (turn.start, turn.end, f"Speaker {label}")
+            for turn, _, label in annotation.itertracks(yield_label=True)
+        ]
+
+    tasks.get_model = get_model
+    tasks.get_diarization_pipeline = lambda: pipeline
+    tasks.get_translator = lambda: translator
+    tasks.diarize = diarize
+    tasks.decode_pcm = FakeDecoder(args.decode_rtf)
+    tasks.warm_up = lambda modes=(): None
+    tasks.keep_models = lambda modes: None
+
+
+def use_local_rate_limits(limiter) -> None:
+    """Without Lua the stand-in cannot run the limiter's script, so check limits on its in-process buckets.
+
+    There is a single API process, so the limits are the same ones Redis
+    would enforce. Checks queued on a pipeline fail on the stand-in and are
+    run again through the same method.
+    """
+    limiter._check = limiter._local.hit
+
+
+def create_users(count: int, paid_share: float, rng: random.Random) -> List[VirtualUser]:
+    from .. import auth, models
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        accounts = [
+            models.User(email=f"user{i}@loadtest.invalid", hashed_password="!", is_paid=rng.random() < paid_share)
+            for i in range(count)
+        ]
+        db.add_all(accounts)
+        db.commit()
+        return [
+            VirtualUser(user.id, "paid" if user.is_paid else "free", auth.create_access_token({"sub": user.email}))
+            for user in accounts
+        ]
+    finally:
+        db.close()
+
+
+def reset_usage(user_id: int) -> None:
+    """Start a new day for a free user."""
+    from .. import models
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        db.query(models.User).filter_by(id=user_id).update({"usage_count": 0})
+        db.commit()
+    finally:
+        db.close()
+
+
+def start_api():
+    """Serve the app on a free local port; returns the server and its base URL."""
+    import uvicorn
+    from ..main import app
+
+    # Clients say they came through the TLS-terminating proxy, so the HTTPS
+    # redirect lets them through
+    config = uvicorn.Config(
+        app, host="127.0.0.1", port=0, log_level="warning", access_log=False,
+        proxy_headers=True, forwarded_allow_ips="*",
+    )
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, name="api", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}"
+
+
+def thread_worker_class():
+    from rq.timeouts import TimerDeathPenalty
+
+    from ..worker import AffinityWorker
+
+    class ThreadWorker(AffinityWorker):
+        """Runs jobs in its own thread: no signal handlers, timer-based job timeouts."""
+
+        death_penalty_class = TimerDeathPenalty
+
+    return ThreadWorker
+
+
+def run_thread_worker(worker_class, index: int, stop: threading.Event) -> None:
+    from rq import Queue
+
+    from ..config import settings
+    from ..producer import redis_conn as connection
+    from ..routing import all_queue_names, initial_home
+
+    queues = [Queue(name, connection=connection) for name in all_queue_names()]
+    worker = worker_class(queues, connection=connection, home=initial_home(index))
+    worker.bootstrap(logging_level="WARNING")
+    poll = settings.affinity_poll_seconds
+    try:
+        while not stop.is_set():
+            result = worker.dequeue_job_and_maintain_ttl(poll, max_idle_time=poll)
+            if result is not None:
+                worker.execute_job(*result)
+                worker.heartbeat()
+    finally:
+        worker.teardown()
+
+
+def run_worker_process(index: int, args, stop) -> None:
+    """A worker subprocess; replaces its worker when it exits after ``WORKER_MAX_JOBS`` like the supervisor does."""
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    install_fakes(args)
+    from ..routing import initial_home
+    from ..worker import start_worker
+
+    while not stop.is_set():
+        start_worker(supervised=True, home=initial_home(index), slot=index)
+
+
+class Client:
+    """One virtual user's HTTP client, timing every request."""
+
+    def __init__(self, user: VirtualUser, base_url: str, stats: Stats):
+        import httpx
+
+        self.stats = stats
+        self.http = httpx.Client(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {user.token}", "X-Forwarded-Proto": "https"},
+            timeout=120,
+        )
+
+    def call(self, endpoint: str, method: str, url: str, **kwargs):
+        """The response, or None if the request failed without one (recorded as status 0)."""
+        import httpx
+
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.stats.request(endpoint, time.perf_counter() - start, 0)
+            return None
+        self.stats.request(endpoint, time.perf_counter() - start, response.status_code)
+        return response
+
+    def close(self) -> None:
+        self.http.close()
+
+
+def upload_multipart(client: Client, filename: str, media: bytes, params: dict) -> Optional[int]:
+    response = client.call(
+        "POST /jobs/upload", "POST", "/jobs/upload",
+        params=params, files={"files": (filename, media, "audio/mpeg")},
+    )
+    if response is None or response.status_code != 200:
+        return None
+    return response.json()["job_ids"][0]
+
+
+def upload_chunked(client: Client, filename: str, media: bytes, params: dict, chunk_size: int, connections: int) -> Optional[int]:
+    response = client.call(
+        "POST /uploads", "POST", "/uploads",
+        json={"filename": filename, "size": len(media), "chunk_size": chunk_size, **params},
+    )
+    if response is None or response.status_code != 201:
+        return None
+    session = response.json()
+
+    def put(index: int) -> bool:
+        body = media[index * chunk_size:(index + 1) * chunk_size]
+        response = client.call(
+            "PUT /uploads/{id}/chunks/{index}", "PUT", f"/uploads/{session['upload_id']}/chunks/{index}", content=body,
+        )
+        return response is not None and response.status_code == 204
+
+    with ThreadPoolExecutor(connections) as pool:
+        if not all(pool.map(put, range(session["chunks"]))):
+            return None
+    response = client.call("POST /uploads/{id}/finalize", "POST", f"/uploads/{session['upload_id']}/finalize")
+    if response is None or response.status_code != 200:
+        return None
+    return response.json()["job_ids"][0]
+
+
+def wait_for(client: Client, job_id: int, poll_seconds: float, give_up: float) -> str:
+    """Poll until the job finishes (revalidating with its ETag); returns its final status."""
+    etag, status = None, "queued"
+    while True:
+        headers = {"If-None-Match": etag} if etag else {}
+        response = client.call("GET /jobs/{id}", "GET", f"/jobs/{job_id}", headers=headers)
+        if response is not None and response.status_code == 200:
+            etag = response.headers.get("ETag")
+            status = response.json()["status"]
+        if status in FINISHED:
+            return status
+        if time.monotonic() >= give_up:
+            return "unfinished"
+        time.sleep(poll_seconds)
+
+
+def run_user(user: VirtualUser, args, base_url: str, stats: Stats, deadline: float, seed: int) -> None:
+    rng = random.Random(seed)
+    modes, weights = zip(*args.mode_mix.items())
+    client = Client(user, base_url, stats)
+    # Bulk exports are rendered from segments, so there is no JSON option
+    bulk_formats = [fmt for fmt in args.formats if fmt != "json"] or ["txt"]
+    finished: List[int] = []
+    uploaded = 0
+    try:
+        while True:
+            if args.think_seconds:
+                time.sleep(rng.expovariate(1 / args.think_seconds))
+            if time.monotonic() >= deadline:
+                return
+
+            seconds = rng.uniform(*args.audio_seconds)
+            mode = rng.choices(modes, weights=weights)[0]
+            params = {"mode": mode}
+            if rng.random() < args.speaker_share:
+                params["speaker_recognition"] = True
+            if rng.random() < args.translate_share:
+                params["target_language"] = "es"
+            media = synthetic_media(seconds, args.upload_kbps)
+            uploaded += 1
+            filename = f"user{user.id}-{uploaded}.mp3"
+            if user.tier == "free":
+                reset_usage(user.id)
+
+            submitted = time.monotonic()
+            if rng.random() < args.chunked_share:
+                job_id = upload_chunked(client, filename, media, params, args.chunk_size, args.chunk_connections)
+            else:
+                query = {k: str(v).lower() if isinstance(v, bool) else v for k, v in params.items()}
+                job_id = upload_multipart(client, filename, media, query)
+            if job_id is None:
+                stats.job(tier=user.tier, mode=mode, audio_seconds=seconds, status="rejected", turnaround=None)
+                continue
+
+            status = wait_for(client, job_id, args.poll_seconds, deadline + args.drain)
+            turnaround = time.monotonic() - submitted
+            stats.job(tier=user.tier, mode=mode, audio_seconds=seconds, status=status, turnaround=turnaround)
+            if status != "completed":
+                continue
+
+            client.call(
+                "GET /jobs/{id}/transcript", "GET", f"/jobs/{job_id}/transcript",
+                params={"format": rng.choice(args.formats)},
+            )
+            finished.append(job_id)
+            if args.bulk_every and len(finished) % args.bulk_every == 0:
+                client.call("GET /jobs", "GET", "/jobs")
+                client.call(
+                    "POST /jobs/export", "POST", "/jobs/export",
+                    json={"job_ids": finished[-args.bulk_every:], "format": rng.choice(bulk_formats)},
+                )
+    finally:
+        client.close()
+
+
+def percentiles(values: list) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None}
+
+    def at(q: float) -> float:
+        return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+    return {"count": len(values), "p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": values[-1]}
+
+
+def job_traces(since: float) -> List[dict]:
+    from ..metrics import TRACES_KEY
+    from ..producer import redis_conn
+
+    traces = [json.loads(raw) for raw in redis_conn.lrange(TRACES_KEY, 0, -1)]
+    return [trace for trace in traces if trace["started_at"] >= since]
+
+
+def summarize(stats: Stats, traces: List[dict], wall_seconds: float) -> list:
+    rows = []
+    for endpoint, samples in sorted(stats.requests.items()):
+        latency = percentiles([seconds for seconds, _ in samples])
+        statuses = Counter(status for _, status in samples)
+        rows.append(record(
+            "loadtest.request", {"endpoint": endpoint},
+            seconds=latency["p50"], p90_seconds=latency["p90"], p99_seconds=latency["p99"], max_seconds=latency["max"],
+            count=latency["count"], per_second=latency["count"] / wall_seconds,
+            errors=sum(n for status, n in statuses.items() if status == 0 or status >= 400),
+            statuses={str(status): n for status, n in sorted(statuses.items())},
+        ))
+
+    for tier in ("paid", "free"):
+        jobs = [job for job in stats.jobs if job["tier"] == tier]
+        completed = [job for job in jobs if job["status"] == "completed"]
+        turnaround = percentiles([job["turnaround"] for job in completed])
+        outcomes = Counter(job["status"] for job in jobs)
+        rows.append(record(
+            "loadtest.turnaround", {"tier": tier},
+            seconds=turnaround["p50"], p90_seconds=turnaround["p90"], p99_seconds=turnaround["p99"],
+            max_seconds=turnaround["max"], outcomes=dict(outcomes),
+            audio_seconds=sum(job["audio_seconds"] for job in completed),
+        ))
+
+        tier_traces = [trace for trace in traces if trace.get("queue") == tier]
+        wait = percentiles([trace["queue_wait_seconds"] for trace in tier_traces if trace["queue_wait_seconds"] is not None])
+        processing = percentiles([trace["processing_time"] for trace in tier_traces])
+        rows.append(record(
+            "loadtest.queue_wait", {"tier": tier},
+            seconds=wait["p50"], p90_seconds=wait["p90"], p99_seconds=wait["p99"], max_seconds=wait["max"],
+            jobs=wait["count"], processing_p50_seconds=processing["p50"], processing_p90_seconds=processing["p90"],
+        ))
+
+    completed = [trace for trace in traces if trace["status"] == "completed"]
+    requests = sum(len(samples) for samples in stats.requests.values())
+    rows.append(record(
+        "loadtest.throughput", {},
+        seconds=None,
+        wall_seconds=wall_seconds,
+        jobs_completed=len(completed),
+        jobs_per_minute=len(completed) * 60 / wall_seconds,
+        audio_seconds_per_second=sum(trace["audio_seconds"] or 0 for trace in completed) / wall_seconds,
+        requests_per_second=requests / wall_seconds,
+    ))
+    return rows
+
+
+def print_report(rows: list) -> None:
+    def fmt(value) -> str:
+        return "-" if value is None else f"{value * 1000:8.1f}ms" if value < 1 else f"{value:8.2f}s "
+
+    for row in rows:
+        label = " ".join(f"{v}" for v in row["params"].values())
+        if row["name"] == "loadtest.throughput":
+            print(
+                f"\n{row['jobs_completed']} jobs in {row['wall_seconds']:.0f}s: {row['jobs_per_minute']:.1f} jobs/min, "
+                f"{row['audio_seconds_per_second']:.1f} audio s/s, {row['requests_per_second']:.1f} requests/s"
+            )
+            continue
+        latency = " ".join(f"{q} {fmt(row[key])}" for q, key in (
+            ("p50", "seconds"), ("p90", "p90_seconds"), ("p99", "p99_seconds"), ("max", "max_seconds"),
+        ))
+        extra = {
+            "loadtest.request": lambda: f"n={row['count']} {row['per_second']:.2f}/s statuses={row['statuses']}",
+            "loadtest.turnaround": lambda: f"outcomes={row['outcomes']}",
+            "loadtest.queue_wait": lambda: f"jobs={row['jobs']}",
+        }[row["name"]]()
+        print(f"{row['name'][len('loadtest.'):]:<11} {label:<34} {latency}  {extra}")
+
+
+def run(args) -> dict:
+    """Run one load test against the configured stand-ins and return the report."""
+    if not args.redis_url:
+        use_redis_standin()
+    from .. import main as api
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    install_fakes(args)
+    if not args.redis_url and importlib.util.find_spec("lupa") is None:
+        use_local_rate_limits(api.limiter)
+
+    rng = random.Random(args.seed)
+    users = create_users(args.users, args.paid_share, rng)
+    server, base_url = start_api()
+
+    if args.processes:
+        ctx = multiprocessing.get_context("spawn")
+        stop_workers = ctx.Event()
+        workers = [ctx.Process(target=run_worker_process, args=(i, args, stop_workers)) for i in range(args.workers)]
+    else:
+        stop_workers = threading.Event()
+        worker_class = thread_worker_class()
+        workers = [
+            threading.Thread(target=run_thread_worker, args=(worker_class, i, stop_workers), name=f"worker-{i}")
+            for i in range(args.workers)
+        ]
+    for worker in workers:
+        worker.start()
+
+    stats = Stats()
+    started_at = time.time()
+    start = time.monotonic()
+    deadline = start + args.duration
+    clients = [
+        threading.Thread(target=run_user, args=(user, args, base_url, stats, deadline, rng.random()), name=f"user-{user.id}")
+        for user in users
+    ]
+    logger.warning(
+        f"{len(users)} users ({sum(u.tier == 'paid' for u in users)} paid), {args.workers} worker "
+        f"{'processes' if args.processes else 'threads'}, {args.duration:.0f}s at {base_url}"
+    )
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    wall_seconds = time.monotonic() - start
+
+    stop_workers.set()
+    for worker in workers:
+        if args.processes:
+            worker.terminate()
+        worker.join()
+    server.should_exit = True
+
+    rows = summarize(stats, job_traces(started_at), wall_seconds)
+    config = {k: v for k, v in vars(args).items() if k not in ("out", "verbose")}
+    return {
+        "commit": git_commit(),
+        "timestamp": started_at,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "results": rows,
+        "errors": {},
+    }
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(","):
+        mode, _, weight = item.partition("=")
+        mix[mode.strip()] = float(weight or 1)
+    return mix
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    traffic = parser.add_argument_group("traffic")
+    traffic.add_argument("--users", type=int, default=10)
+    traffic.add_argument("--paid-share", type=float, default=0.3)
+    traffic.add_argument("--duration", type=float, default=60, help="seconds during which users start new jobs")
+    traffic.add_argument("--drain", type=float, default=120, help="extra seconds to wait for jobs already queued")
+    traffic.add_argument("--think-seconds", type=float, default=2.0, help="mean pause before each upload")
+    traffic.add_argument("--poll-seconds", type=float, default=3.0)
+    traffic.add_argument("--audio-seconds", type=float, nargs=2, default=(30, 600), metavar=("MIN", "MAX"))
+    traffic.add_argument("--mode-mix", type=parse_mix, default="cheetah=0.35,dolphin=0.35,whale=0.2,cascade=0.1")
+    traffic.add_argument("--speaker-share", type=float, default=0.2)
+    traffic.add_argument("--translate-share", type=float, default=0.1)
+    traffic.add_argument("--chunked-share", type=float, default=0.2, help="uploads sent through /uploads sessions")
+    traffic.add_argument("--chunk-size", type=int, default=1024 * 1024)
+    traffic.add_argument("--chunk-connections", type=int, default=4)
+    traffic.add_argument("--upload-kbps", type=int, default=128, help="bitrate that sizes the uploaded files")
+    traffic.add_argument("--formats", type=lambda v: v.split(","), default=list(EXPORT_FORMATS))
+    traffic.add_argument("--bulk-every", type=int, default=5, help="bulk export after this many jobs (0: never)")
+    traffic.add_argument("--seed", type=int, default=1)
+    pool = parser.add_argument_group("workers")
+    pool.add_argument("--workers", type=int, default=2)
+    pool.add_argument("--processes", action="store_true", help="run workers as separate processes (needs --redis-url)")
+    pool.add_argument("--rtf", type=float, default=0.002, help="fake Whisper seconds per audio second (tiny model)")
+    pool.add_argument("--decode-rtf", type=float, default=0.001)
+    pool.add_argument("--diarization-rtf", type=float, default=0.005)
+    parser.add_argument("--redis-url", help="a scratch Redis to use instead of the in-memory stand-in")
+    parser.add_argument("--out", help="also write the report as JSON here")
+    parser.add_argument("--verbose", action="store_true", help="keep the API's and workers' INFO logs")
+    args = parser.parse_args(argv)
+    if args.processes and not args.redis_url:
+        parser.error("--processes needs --redis-url: the in-memory stand-in is not shared with other processes")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as workdir:
+        configure(workdir, args.redis_url)
+        report = run(args)
+
+    print_report(report["results"])
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
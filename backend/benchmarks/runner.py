@@ -0,0 +1,77 @@
+"""
+Run the benchmark suite and write the results as one JSON document.
+
+    python -m backend.benchmarks.runner [--quick] [--only export,db] [--out results.json]
+
+Every module named ``bench_*`` in this package exposes ``run(quick)``
+returning result rows. A module that fails is reported with its error instead of aborting the run;
+a case that cannot run here (missing ffmpeg, an optional dependency) comes
+back as a row with a ``skipped`` reason and no timings.
+"""
+
+import argparse
+import importlib
+import json
+import pkgutil
+import platform
+import subprocess
+import sys
+import time
+import traceback
+from pathlib import Path
+
+PACKAGE = "backend.benchmarks"
+
+
+def discover() -> list:
+    here = Path(__file__).parent
+    return sorted(m.name[len("bench_"):] for m in pkgutil.iter_modules([str(here)]) if m.name.startswith("bench_"))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_suite(names: list, quick: bool) -> dict:
+    results, errors = [], {}
+    for name in names:
+        start = time.perf_counter()
+        try:
+            module = importlib.import_module(f"{PACKAGE}.bench_{name}")
+            results.extend(module.run(quick=quick))
+        except Exception as e:
+            errors[name] = f"{type(e).__name__}: {e}"
+            traceback.print_exc(file=sys.stderr)
+        print(f"{name}: {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": quick,
+        "results": results,
+        "errors": errors,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for CI")
+    parser.add_argument("--only", help="comma-separated benchmark names")
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else discover()
+    report = run_suite(names, args.quick)
+    output = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from typing import Callable, Iterable, List, NamedTuple
+
+# Cascade mode drafts with the fastest model, then re-decodes only doubtful regions with the largest
+CASCADE_DRAFT_MODE = "cheetah"
+CASCADE_REFINE_MODE = "whale"
+
+
+class Segment(NamedTuple):
+    start: float
+    end: float
+    text: str
+    avg_logprob: float = 0.0
+    no_speech_prob: float = 0.0
+
+
+class Region(NamedTuple):
+    start: float
+    end: float
+    first: int  # index of the first draft segment replaced
+    last: int   # index of the last draft segment replaced (inclusive)
+
+
+def to_segments(segments: Iterable) -> List[Segment]:
+    """Copy model output into plain segments that can be shifted and spliced."""
+    return [
+        Segment(s.start, s.end, s.text, getattr(s, "avg_logprob", 0.0), getattr(s, "no_speech_prob", 0.0))
+        for s in segments
+    ]
+
+
+def needs_refinement(seg, logprob_threshold: float, no_speech_threshold: float) -> bool:
+    return seg.avg_logprob < logprob_threshold or seg.no_speech_prob > no_speech_threshold
+
+
+def plan_regions(
+    segments: List[Segment],
+    logprob_threshold: float,
+    no_speech_threshold: float,
+    merge_gap: float = 1.0,
+    pad: float = 0.5,
+) -> List[Region]:
+    """Group low-confidence draft segments into padded regions to re-decode.
+
+    Flagged segments closer than ``merge_gap`` seconds are decoded together
+    so the large model gets enough context and is not restarted per segment.
+    The padding stops at the draft segments kept on either side, whose words
+    would otherwise be decoded and transcribed a second time.
+    """
+    def window(first: int, last: int) -> tuple:
+        start = max(0.0, segments[first].start - pad)
+        if first > 0:
+            start = max(start, segments[first - 1].end)
+        end = segments[last].end + pad
+        if last + 1 < len(segments):
+            end = min(end, segments[last + 1].start)
+        # Draft segments may overlap their neighbours; never cut into the replaced ones
+        return min(start, segments[first].start), max(end, segments[last].end)
+
+    regions: List[Region] = []
+    for idx, seg in enumerate(segments):
+        if not needs_refinement(seg, logprob_threshold, no_speech_threshold):
+            continue
+        if regions and seg.start - segments[regions[-1].last].end <= merge_gap:
+            first = regions[-1].first
+            regions[-1] = Region(*window(first, idx), first, idx)
+        else:
+            regions.append(Region(*window(idx, idx), idx, idx))
+    return regions
+
+
+def splice(
+    segments: List[Segment],
+    regions: List[Region],
+    decode_region: Callable[[float, float], Iterable],
+) -> List[Segment]:
+    """Replace each region's draft segments with the refined decode of that region.
+
+    ``decode_region(start, end)`` returns segments with times relative to
+    ``start``; they are shifted back onto the file timeline here and kept
+    within the region, so they never overlap the draft segments around it.
+    """
+    result: List[Segment] = []
+    cursor = 0
+    for region in regions:
+        result.extend(segments[cursor:region.first])
+        for seg in to_segments(decode_region(region.start, region.end)):
+            start = seg.start + region.start
+            if start >= region.end:
+                continue
+            result.append(seg._replace(start=start, end=min(seg.end + region.start, region.end)))
+        cursor = region.last + 1
+    result.extend(segments[cursor:])
+    return result
+
+
+def refined_fraction(segments: List[Segment], regions: List[Region]) -> float:
+    """Share of the draft's speech duration that the cascade re-decoded.
+
+    Counts the replaced segments only, not the padding and gaps a region
+    spans between them, so the result stays within 0..1.
+    """
+    total = sum(s.end - s.start for s in segments)
+    if total <= 0:
+        return 0.0
+    refined = sum(s.end - s.start for r in regions for s in segments[r.first:r.last + 1])
+    return refined / total
@@ -0,0 +1,138 @@
+"""
+Checkpoints of in-progress transcriptions.
+
+Long jobs can be cut short by the job timeout, a worker recycle or a
+deploy. While Whisper yields segments, the worker saves the segments so
+far and the audio offset they reach, at most every
+``CHECKPOINT_INTERVAL_SECONDS``. A retried job decodes only the audio after
+that offset and keeps the saved segments. Diarization turns are saved as
+soon as that stage finishes, so a retry does not diarize again.
+
+Checkpoints sit next to the job's input in the upload store, gzip-compressed
+and Fernet-encrypted like the input, and are deleted with it. A checkpoint
+only applies to a run with the same settings (mode, task, language,
+restoration); anything else starts over.
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from typing import Iterable, List, Optional
+
+from .cascade import Segment
+from .config import settings
+from .storage import checkpoint_path
+from .utils import decrypt_bytes, encrypt_bytes
+
+logger = logging.getLogger("checkpoint")
+
+FORMAT_VERSION = 1
+
+
+class Checkpoint:
+    """Progress of one job, saved as it grows.
+
+    ``segments`` are draft segments in absolute time, ``offset`` the audio
+    second they cover up to, and ``complete`` whether the draft reached the
+    end of the audio.
+    """
+
+    def __init__(self, job_id: int, key: dict, interval: float = None):
+        self.job_id = job_id
+        self.key = key
+        self.interval = settings.checkpoint_interval_seconds if interval is None else interval
+        self.segments: List[Segment] = []
+        self.offset = 0.0
+        self.language: Optional[str] = None
+        self.complete = False
+        self.turns: Optional[list] = None
+        # Transcription and diarization run in separate threads
+        self._lock = threading.Lock()
+        self._saved_at = time.monotonic()
+        # Snapshots are numbered so a slower save of an older one never replaces a newer file
+        self._write_lock = threading.Lock()
+        self._snapshots = 0
+        self._written = 0
+
+    @classmethod
+    def load(cls, job_id: int, key: dict) -> "Checkpoint":
+        """The saved checkpoint for ``job_id`` if it was made with ``key``, else an empty one."""
+        checkpoint = cls(job_id, key)
+        try:
+            with open(checkpoint_path(job_id), "rb") as f:
+                data = json.loads(gzip.decompress(decrypt_bytes(f.read())))
+        except FileNotFoundError:
+            return checkpoint
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable checkpoint for job {job_id}: {e}")
+            return checkpoint
+        if data.get("version") != FORMAT_VERSION or data.get("key") != key:
+            logger.info(f"Ignoring checkpoint for job {job_id} made with other settings")
+            return checkpoint
+
+        checkpoint.segments = [Segment(*s) for s in data["segments"]]
+        checkpoint.offset = data["offset"]
+        checkpoint.language = data["language"]
+        checkpoint.complete = data["complete"]
+        checkpoint.turns = [tuple(t) for t in data["turns"]] if data["turns"] is not None else None
+        return checkpoint
+
+    @property
+    def resumed(self) -> bool:
+        return bool(self.segments or self.complete or self.turns is not None)
+
+    def save(self) -> None:
+        with self._lock:
+            self._snapshots += 1
+            snapshot = self._snapshots
+            data = {
+                "version": FORMAT_VERSION,
+                "key": self.key,
+                "segments": [list(s) for s in self.segments],
+                "offset": self.offset,
+                "language": self.language,
+                "complete": self.complete,
+                "turns": self.turns,
+            }
+            self._saved_at = time.monotonic()
+        body = encrypt_bytes(gzip.compress(json.dumps(data, ensure_ascii=False).encode(), compresslevel=1))
+        path = checkpoint_path(self.job_id)
+        with self._write_lock:
+            if snapshot < self._written:
+                return
+            tmp_path = f"{path}.{threading.get_ident()}.part"
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+            self._written = snapshot
+
+    def consume(self, segments: Iterable, offset: float) -> None:
+        """Append model output decoded from ``offset`` seconds on, saving as it goes."""
+        for s in segments:
+            segment = Segment(
+                s.start + offset, s.end + offset, s.text,
+                getattr(s, "avg_logprob", 0.0), getattr(s, "no_speech_prob", 0.0),
+            )
+            with self._lock:
+                self.segments.append(segment)
+                self.offset = segment.end
+                due = time.monotonic() - self._saved_at >= self.interval
+            if due:
+                self.save()
+        with self._lock:
+            self.complete = True
+        self.save()
+
+    def set_turns(self, turns: list) -> None:
+        with self._lock:
+            self.turns = turns
+        self.save()
+
+    def clear(self) -> None:
+        try:
+            os.remove(checkpoint_path(self.job_id))
+        except FileNotFoundError:
+            pass
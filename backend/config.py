@@ -15,7 +15,72 @@ class Settings(BaseSettings):
     stripe_webhook_secret: str = os.getenv("STRIPE_WEBHOOK_SECRET", "whsec_dummy")
     google_client_id: str = os.getenv("GOOGLE_CLIENT_ID", "")
     google_client_secret: str = os.getenv("GOOGLE_CLIENT_SECRET", "")
+    # Decoded audio longer than this is memory-mapped from disk instead of held in RAM
+    pcm_mmap_min_seconds: float = float(os.getenv("PCM_MMAP_MIN_SECONDS", "600"))
+    # CPU budgets for the concurrent transcription and diarization stages (0 = library default)
+    whisper_cpu_threads: int = int(os.getenv("WHISPER_CPU_THREADS", "0"))
+    diarization_cpu_threads: int = int(os.getenv("DIARIZATION_CPU_THREADS", "0"))
+    # Cascade mode re-decodes draft segments below/above these Whisper confidence thresholds
+    cascade_logprob_threshold: float = float(os.getenv("CASCADE_LOGPROB_THRESHOLD", "-1.0"))
+    cascade_no_speech_threshold: float = float(os.getenv("CASCADE_NO_SPEECH_THRESHOLD", "0.6"))
+    # Worker and API Prometheus endpoints (internal ports, not the public API; 0 disables the
+    # API's) and how many per-job traces to keep in Redis
+    worker_metrics_port: int = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+    api_metrics_port: int = int(os.getenv("API_METRICS_PORT", "9101"))
+    trace_history: int = int(os.getenv("TRACE_HISTORY", "1000"))
+    # Comma-separated emails allowed to use the /admin endpoints
+    admin_emails: str = os.getenv("ADMIN_EMAILS", "")
+    # Upload store location and the retention reaper's schedule and I/O budget
+    upload_dir: str = os.getenv("UPLOAD_DIR", "uploads")
+    upload_retention_hours: float = float(os.getenv("UPLOAD_RETENTION_HOURS", "168"))
+    reaper_interval_seconds: float = float(os.getenv("REAPER_INTERVAL_SECONDS", "600"))
+    reaper_batch_size: int = int(os.getenv("REAPER_BATCH_SIZE", "500"))
+    reaper_max_bytes_per_second: int = int(os.getenv("REAPER_MAX_BYTES_PER_SECOND", str(200 * 1024 * 1024)))
+    reaper_orphan_grace_seconds: float = float(os.getenv("REAPER_ORPHAN_GRACE_SECONDS", "3600"))
+    # Reverse proxies in front of the API whose X-Forwarded-For entries are trusted, and the
+    # comma-separated networks they connect from (the header is ignored from anywhere else)
+    trusted_proxy_hops: int = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+    trusted_proxy_cidrs: str = os.getenv("TRUSTED_PROXY_CIDRS", "")
+    # How long nginx and browsers may reuse a completed transcript before revalidating it
+    transcript_cache_seconds: int = int(os.getenv("TRANSCRIPT_CACHE_SECONDS", "60"))
+    # HMAC key for the search index's word hashes (derived from FERNET_KEY when empty)
+    search_index_key: str = os.getenv("SEARCH_INDEX_KEY", "")
+    # Worker layout written by `python -m backend.autotune` and applied at worker startup
+    cpu_profile_path: str = os.getenv("CPU_PROFILE_PATH", "cpu_profile.json")
+    # Model-affinity routing: pinned home modes (comma-separated; default spreads workers over
+    # modes), max home modes per worker, backlog per home worker before others help, and
+    # how often idle workers re-plan and how long a worker's home modes stay advertised
+    worker_modes: str = os.getenv("WORKER_MODES", "")
+    affinity_max_modes: int = int(os.getenv("AFFINITY_MAX_MODES", "2"))
+    affinity_rebalance_depth: int = int(os.getenv("AFFINITY_REBALANCE_DEPTH", "2"))
+    affinity_poll_seconds: int = int(os.getenv("AFFINITY_POLL_SECONDS", "5"))
+    affinity_ttl_seconds: int = int(os.getenv("AFFINITY_TTL_SECONDS", "90"))
+    # Jobs a worker process runs before it is replaced (0: never); a replacement keeps the
+    # home modes its predecessor had adopted but has to load their models again
+    worker_max_jobs: int = int(os.getenv("WORKER_MAX_JOBS", "500"))
+    # Per-attempt time limit, retries with exponential backoff, and how often long jobs checkpoint
+    job_timeout_seconds: int = int(os.getenv("JOB_TIMEOUT_SECONDS", "3600"))
+    job_max_retries: int = int(os.getenv("JOB_MAX_RETRIES", "3"))
+    job_retry_backoff_seconds: int = int(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "60"))
+    checkpoint_interval_seconds: float = float(os.getenv("CHECKPOINT_INTERVAL_SECONDS", "60"))
+    # Chunked uploads: default and largest chunk a client may send, and how long an idle session lives
+    upload_chunk_size: int = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+    upload_max_chunk_size: int = int(os.getenv("UPLOAD_MAX_CHUNK_SIZE", str(64 * 1024 * 1024)))
+    upload_session_hours: float = float(os.getenv("UPLOAD_SESSION_HOURS", "24"))
+    # Upload sessions a user may have open at once
+    upload_max_sessions: int = int(os.getenv("UPLOAD_MAX_SESSIONS", "5"))
+    # How long a job's cached status lives without a new transition (it is re-read from the DB after)
+    status_cache_seconds: int = int(os.getenv("STATUS_CACHE_SECONDS", "900"))
+    # Stripe webhooks: how long event IDs are remembered to drop redeliveries (Stripe retries for
+    # three days), events per processing batch, and how long a dead worker's batch waits to be taken over
+    stripe_event_ttl_hours: float = float(os.getenv("STRIPE_EVENT_TTL_HOURS", "96"))
+    stripe_batch_size: int = int(os.getenv("STRIPE_BATCH_SIZE", "500"))
+    stripe_claim_seconds: int = int(os.getenv("STRIPE_CLAIM_SECONDS", "60"))
     fernet_key: str = os.getenv("FERNET_KEY", Fernet.generate_key().decode())
 
+    @property
+    def admin_email_list(self) -> set:
+        return {e.strip().lower() for e in self.admin_emails.split(",") if e.strip()}
+
 
 settings = Settings()
@@ -1,3 +1,4 @@
+import os
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .config import settings
@@ -7,6 +8,10 @@ engine = create_engine(settings.database_url, connect_args={"check_same_thread":
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# The worker supervisor uses the database in background threads and forks
+# worker processes; a child must open its own connections instead of sharing the parent's
+os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
 
 def get_db():
     db = SessionLocal()
@@ -1,9 +1,10 @@
 from __future__ import annotations
-from io import BytesIO
-from typing import List, Tuple
+from io import BytesIO, StringIO
+from typing import Tuple
 import csv
 from docx import Document
 from fpdf import FPDF
+from .segments import SegmentRow, SegmentTable, as_table
 
 
 def _format_ts(seconds: float, sep: str) -> str:
@@ -14,52 +15,45 @@ def _format_ts(seconds: float, sep: str) -> str:
     return f"{hours:02d}:{minutes:02d}:{int(secs):02d}{sep}{millis:03d}"
 
 
-def _line(segment: dict) -> str:
-    start = _format_ts(segment["start"], ":")
-    end = _format_ts(segment["end"], ":")
-    speaker = segment.get("speaker", "Speaker")
-    text = segment.get("text", "")
-    return f"[{start} - {end}] {speaker}: {text}"
+def _line(segment: SegmentRow) -> str:
+    start = _format_ts(segment.start, ":")
+    end = _format_ts(segment.end, ":")
+    return f"[{start} - {end}] {segment.speaker}: {segment.text}"
 
 
-def segments_to_txt(segments: List[dict]) -> BytesIO:
+def segments_to_txt(segments: SegmentTable) -> BytesIO:
     content = "\n".join(_line(s) for s in segments)
     return BytesIO(content.encode())
 
 
-def segments_to_csv(segments: List[dict]) -> BytesIO:
-    buf = BytesIO()
-    writer = csv.writer(buf)
+def segments_to_csv(segments: SegmentTable) -> BytesIO:
+    text = StringIO()
+    writer = csv.writer(text)
     writer.writerow(["start", "end", "speaker", "text"])
     for s in segments:
-        writer.writerow([_format_ts(s["start"], ":"), _format_ts(s["end"], ":"), s.get("speaker", ""), s.get("text", "")])
-    buf.seek(0)
-    return buf
+        writer.writerow([_format_ts(s.start, ":"), _format_ts(s.end, ":"), s.speaker, s.text])
+    return BytesIO(text.getvalue().encode())
 
 
-def segments_to_srt(segments: List[dict]) -> BytesIO:
+def segments_to_srt(segments: SegmentTable) -> BytesIO:
     lines = []
     for idx, s in enumerate(segments, 1):
-        start = _format_ts(s["start"], ",")
-        end = _format_ts(s["end"], ",")
-        speaker = s.get("speaker", "Speaker")
-        text = s.get("text", "")
-        lines.extend([str(idx), f"{start} --> {end}", f"{speaker}: {text}", ""])
+        start = _format_ts(s.start, ",")
+        end = _format_ts(s.end, ",")
+        lines.extend([str(idx), f"{start} --> {end}", f"{s.speaker}: {s.text}", ""])
     return BytesIO("\n".join(lines).encode())
 
 
-def segments_to_vtt(segments: List[dict]) -> BytesIO:
+def segments_to_vtt(segments: SegmentTable) -> BytesIO:
     lines = ["WEBVTT", ""]
     for s in segments:
-        start = _format_ts(s["start"], ".")
-        end = _format_ts(s["end"], ".")
-        speaker = s.get("speaker", "Speaker")
-        text = s.get("text", "")
-        lines.extend([f"{start} --> {end}", f"{speaker}: {text}", ""])
+        start = _format_ts(s.start, ".")
+        end = _format_ts(s.end, ".")
+        lines.extend([f"{start} --> {end}", f"{s.speaker}: {s.text}", ""])
     return BytesIO("\n".join(lines).encode())
 
 
-def segments_to_docx(segments: List[dict]) -> BytesIO:
+def segments_to_docx(segments: SegmentTable) -> BytesIO:
     doc = Document()
     for s in segments:
         doc.add_paragraph(_line(s))
@@ -69,17 +63,15 @@ def segments_to_docx(segments: List[dict]) -> BytesIO:
     return buf
 
 
-def segments_to_pdf(segments: List[dict]) -> BytesIO:
+def segments_to_pdf(segments: SegmentTable) -> BytesIO:
     pdf = FPDF()
     pdf.add_page()
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.set_font("Arial", size=12)
     for s in segments:
         pdf.multi_cell(0, 10, _line(s))
-    buf = BytesIO()
-    pdf.output(buf)
-    buf.seek(0)
-    return buf
+    # PyFPDF writes to a file name; dest="S" returns the document as a latin-1 string
+    return BytesIO(pdf.output(dest="S").encode("latin-1"))
 
 
 EXPORTERS = {
@@ -92,9 +84,10 @@ EXPORTERS = {
 }
 
 
-def export_segments(segments: List[dict], fmt: str) -> Tuple[BytesIO, str, str]:
+def export_segments(segments, fmt: str) -> Tuple[BytesIO, str, str]:
+    """Render a ``SegmentTable`` (or the older list of dicts) in ``fmt``."""
     fmt = fmt.lower()
     if fmt not in EXPORTERS:
         raise ValueError("Unsupported format")
     func, media, ext = EXPORTERS[fmt]
-    return func(segments), media, ext
+    return func(as_table(segments)), media, ext
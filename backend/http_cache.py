@@ -0,0 +1,122 @@
+"""
+Conditional GET support: ETag / Last-Modified validators and 304 responses.
+
+Validators are derived from ``TranscriptionJob.version``, which SQLAlchemy
+bumps on every update of the row, so a handler can answer 304 from a
+cheap metadata query without decrypting or re-serializing anything.
+
+ETags are weak: a PDF export embeds its render time, so two renders of the
+same transcript version are equivalent but not byte-identical.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional
+
+from fastapi import Request, Response
+
+# Job state moves while a job runs: clients may store it but must revalidate
+REVALIDATE = "private, no-cache"
+
+
+def job_etag(job, *variant) -> str:
+    """Validator for one job representation; ``variant`` tells formats apart."""
+    return 'W/"' + "-".join(str(part) for part in (job.id, job.version, *variant)) + '"'
+
+
+def list_etag(jobs: Iterable) -> str:
+    """Validator for a job list: changes when any job changes, appears or goes away."""
+    digest = hashlib.sha1()
+    for job in jobs:
+        digest.update(f"{job.id}:{job.version};".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def body_etag(body: bytes) -> str:
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def http_date(dt: datetime) -> str:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def is_fresh(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Whether the client's cached copy is current (If-None-Match wins over If-Modified-Since)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def accepts_encoding(request: Request, coding: str) -> bool:
+    """Whether Accept-Encoding allows ``coding`` (explicitly or via ``*``) with a non-zero q."""
+    accepted = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    return accepted.get(coding, accepted.get("*", 0.0)) > 0
+
+
+def validators(
+    etag: str,
+    cache_control: str,
+    last_modified: Optional[datetime] = None,
+    vary: Optional[str] = "Authorization",
+) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    if vary:
+        headers["Vary"] = vary
+    return headers
+
+
+def conditional(
+    request: Request,
+    response: Response,
+    etag: str,
+    cache_control: str,
+    last_modified: Optional[datetime] = None,
+    vary: Optional[str] = "Authorization",
+) -> Optional[Response]:
+    """Put validators on ``response``; return a 304 to send instead if the client is current."""
+    headers = validators(etag, cache_control, last_modified, vary)
+    if is_fresh(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
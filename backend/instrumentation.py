@@ -0,0 +1,140 @@
+"""
+Per-request latency metrics with DB and Redis time attribution for the API.
+
+``MetricsMiddleware`` times each request and labels it with the matched
+route template, so ``/jobs/1`` and ``/jobs/2`` share one series. While a
+request is in flight, SQLAlchemy cursor events and Redis connections
+created by ``timed_redis`` add their time to that request.
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Optional
+from urllib.parse import urlparse
+
+from redis import Redis
+from redis.connection import Connection, SSLConnection, UnixDomainSocketConnection
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .metrics import HTTP_IN_PROGRESS, HTTP_REQUEST_DB_SECONDS, HTTP_REQUEST_REDIS_SECONDS, HTTP_REQUEST_SECONDS
+
+
+class RequestTimings:
+    __slots__ = ("db_seconds", "db_queries", "redis_seconds", "redis_commands")
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.redis_seconds = 0.0
+        self.redis_commands = 0
+
+
+# Holds a mutable object so time spent in threadpool-run dependencies,
+# which see a copy of the context, still lands on the request
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Attribute SQL execution time to the request that issued it."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        timings = _current.get()
+        if timings is not None:
+            timings.db_seconds += elapsed
+            timings.db_queries += 1
+
+
+class _TimedMixin:
+    """Adds socket time for every command to the current request."""
+
+    def send_packed_command(self, command, check_health=True):
+        start = time.perf_counter()
+        try:
+            return super().send_packed_command(command, check_health)
+        finally:
+            timings = _current.get()
+            if timings is not None:
+                timings.redis_seconds += time.perf_counter() - start
+                timings.redis_commands += 1
+
+    def read_response(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().read_response(*args, **kwargs)
+        finally:
+            timings = _current.get()
+            if timings is not None:
+                timings.redis_seconds += time.perf_counter() - start
+
+
+class TimedConnection(_TimedMixin, Connection):
+    pass
+
+
+class TimedSSLConnection(_TimedMixin, SSLConnection):
+    pass
+
+
+class TimedUnixDomainSocketConnection(_TimedMixin, UnixDomainSocketConnection):
+    pass
+
+
+def timed_redis(url: str) -> Redis:
+    """``Redis.from_url`` with connections that report their time per request."""
+    scheme = urlparse(url).scheme
+    connection_class = {
+        "rediss": TimedSSLConnection,
+        "unix": TimedUnixDomainSocketConnection,
+    }.get(scheme, TimedConnection)
+    return Redis.from_url(url, connection_class=connection_class)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so it adds no extra task or body buffering per request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        in_progress = HTTP_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_progress.dec()
+            _current.reset(token)
+            # The router stores the matched route in the scope; unmatched
+            # paths share one label to keep cardinality bounded
+            route = scope.get("route")
+            template = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(method, template, str(status)).observe(elapsed)
+            HTTP_REQUEST_DB_SECONDS.labels(template).observe(timings.db_seconds)
+            HTTP_REQUEST_REDIS_SECONDS.labels(template).observe(timings.redis_seconds)
@@ -1,42 +1,56 @@
 import os
+import gzip
 import json
 import logging
+from contextlib import asynccontextmanager
 from io import BytesIO
 from typing import List, Optional
 from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Request, Response
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from zipfile import ZipFile
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer, load_only
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
 from fastapi.middleware.cors import CORSMiddleware
+from .config import settings
 from .database import Base, engine, get_db
 from . import models, schemas, auth, payments
-from .tasks import paid_q, free_q, transcribe_job
-from .utils import decrypt, encrypt_bytes
+from .producer import enqueue_transcription, redis_conn
+from .ratelimit import RateLimiter, execute_with_limits
+from .utils import encrypt_bytes
 from .export_utils import export_segments
+from .http_cache import REVALIDATE, accepts_encoding, body_etag, conditional, is_fresh, job_etag, list_etag
+from .transcripts import load_transcript, transcript_body
+from .search import get_index
+from .storage import delete_input, save_input
+from . import uploads, status_cache
+from .instrumentation import MetricsMiddleware, instrument_engine
+from .metrics import start_shared_metrics_server
+from .profiler import ProfilerBusy, folded, sample_stacks
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
+# Initialize rate limiter (shared by all API processes through Redis)
+limiter = RateLimiter(redis_conn)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Prometheus metrics for this API deployment, on an internal port rather than the public API
+    if settings.api_metrics_port:
+        start_shared_metrics_server(settings.api_metrics_port)
+    yield
 
 # Create FastAPI app
 app = FastAPI(
     title="TranscribeAI API",
     description="AI-powered transcription platform with GPU acceleration",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add middleware
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, lambda request, exc: JSONResponse(status_code=429, content={"detail": "Rate limit exceeded"}))
-app.add_middleware(SlowAPIMiddleware)
 app.add_middleware(HTTPSRedirectMiddleware)
 
 # Add CORS middleware for development
@@ -48,6 +62,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so latency covers every other middleware
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+
 # Include routers
 app.include_router(payments.router)
 
@@ -56,22 +74,27 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("api")
 
 # Create uploads directory
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(settings.upload_dir, exist_ok=True)
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logger.info("%s %s", request.method, request.url.path)
-    response = await call_next(request)
-    logger.info("%s %s -> %s", request.method, request.url.path, response.status_code)
-    return response
+# Whisper and translation language codes. The response never changes, so it
+# is serialized once and served with a long-lived, content-hashed validator.
+LANGUAGES = [
+    "en", "es", "fr", "de", "it", "pt", "ru", "ja", "ko", "zh", "ar", "hi", "nl", "sv", "no", "da",
+    "fi", "pl", "tr", "he", "th", "vi", "id", "ms", "tl", "bn", "ur", "fa", "ps", "ku", "si", "my",
+    "km", "lo", "ne", "ta", "te", "kn", "ml", "gu", "pa", "or", "as", "mr", "sa", "jv", "su",
+    "ceb", "war", "hil", "bcl", "pam", "bik", "pag", "tsg", "kng", "cbk", "krj", "mdh", "mrw",
+    "sjb", "atd", "ctd", "bln", "fbl", "lbl", "ubl", "rbl", "kbl", "abl", "tbl", "sbl", "mbl",
+    "nbl", "pbl", "qbl", "vbl", "wbl", "xbl", "ybl", "zbl",
+]
+LANGUAGES_BODY = json.dumps({"transcription_languages": LANGUAGES, "translation_languages": LANGUAGES}).encode()
+LANGUAGES_ETAG = body_etag(LANGUAGES_BODY)
+LANGUAGES_HEADERS = {"ETag": LANGUAGES_ETAG, "Cache-Control": "public, max-age=86400"}
 
 @app.get("/")
 async def root():
     return {"message": "TranscribeAI API - AI-powered transcription platform"}
 
-@app.post("/auth/register", response_model=schemas.UserOut)
-@limiter.limit("5/minute")
+@app.post("/auth/register", response_model=schemas.UserOut, dependencies=[Depends(limiter.limit("5/minute"))])
 async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     """Register a new user"""
     if auth.get_user(db, user.email):
@@ -84,8 +107,7 @@ async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db.refresh(db_user)
     return db_user
 
-@app.post("/auth/login", response_model=schemas.Token)
-@limiter.limit("10/minute")
+@app.post("/auth/login", response_model=schemas.Token, dependencies=[Depends(limiter.limit("10/minute"))])
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """Login user and return JWT token"""
     user = auth.authenticate_user(db, form_data.username, form_data.password)
@@ -105,8 +127,94 @@ async def get_current_user_info(current_user: models.User = Depends(auth.get_cur
     """Get current user information"""
     return current_user
 
-@app.post("/jobs/upload")
-@limiter.limit("10/minute")
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024 * 1024
+SUPPORTED_FORMATS = {".mp3", ".wav", ".m4a", ".mp4", ".flac", ".aac", ".ogg", ".avi", ".mov", ".mkv"}
+# Job IDs one bulk status request may ask about
+MAX_STATUS_JOBS = 1000
+
+def check_usage_limit(user: models.User, files: int) -> None:
+    """Raise 403 if ``user`` may not queue ``files`` more files."""
+    if user.is_paid:
+        limit = 100  # Unlimited for paid users
+    else:
+        limit = 3  # 3 files per day for free users
+        if user.usage_count >= limit:
+            raise HTTPException(status_code=403, detail=f"Free tier limit reached. Upgrade to unlimited for $10/month.")
+    
+    if user.usage_count + files > limit:
+        raise HTTPException(status_code=403, detail=f"Usage limit exceeded. You can upload {limit - user.usage_count} more files.")
+
+def check_upload(filename: str, size: int) -> None:
+    # Validate file size (5GB limit)
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=400, detail=f"File {filename} too large. Maximum size is 5GB.")
+    
+    # Validate file type
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in SUPPORTED_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {ext}. Supported formats: {', '.join(SUPPORTED_FORMATS)}")
+
+def queue_job(
+    db: Session,
+    user: models.User,
+    filename: str,
+    mode: schemas.Mode,
+    language: Optional[str],
+    target_language: Optional[str],
+    restore_audio: bool,
+    speaker_recognition: bool,
+    store_input,
+) -> int:
+    """Create the job, store its encrypted input with ``store_input(job_id)`` and enqueue it.
+    
+    The job is committed only once its input is stored, so a failure leaves
+    neither a job without input nor a used-up upload behind.
+    """
+    db_job = models.TranscriptionJob(
+        user_id=user.id,
+        filename=filename,
+        mode=mode.value,
+        language=language,
+        target_language=target_language,
+        restore_audio=restore_audio,
+        speaker_recognition=speaker_recognition
+    )
+    db.add(db_job)
+    user.usage_count += 1
+    try:
+        # Assigns the job ID the input is keyed by
+        db.flush()
+        job_id = db_job.id
+        enc_path = store_input(job_id)
+    except Exception:
+        db.rollback()
+        raise
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        delete_input(job_id)
+        raise
+    db.refresh(db_job)
+    
+    # Cached before the worker can pick the job up and publish newer states
+    status_cache.publish(redis_conn, status_cache.CachedStatus.of(db_job))
+    
+    # Add to appropriate queue (paid users get priority)
+    enqueue_transcription(
+        user.is_paid,
+        db_job.id,
+        enc_path,
+        mode.value,
+        language,
+        target_language,
+        restore_audio,
+        speaker_recognition
+    )
+    
+    return db_job.id
+
+@app.post("/jobs/upload", dependencies=[Depends(limiter.limit("10/minute"))])
 async def upload_files(
     files: List[UploadFile] = File(...),
     mode: schemas.Mode = schemas.Mode.dolphin,
@@ -117,125 +225,294 @@ async def upload_files(
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Upload audio/video files for transcription"""
+    """Upload audio/video files for transcription (see /uploads for large files)"""
     user = current_user
     
     # Check usage limits
-    if user.is_paid:
-        limit = 100  # Unlimited for paid users
-    else:
-        limit = 3  # 3 files per day for free users
-        if user.usage_count >= limit:
-            raise HTTPException(status_code=403, detail=f"Free tier limit reached. Upgrade to unlimited for $10/month.")
-    
-    if user.usage_count + len(files) > limit:
-        raise HTTPException(status_code=403, detail=f"Usage limit exceeded. You can upload {limit - user.usage_count} more files.")
+    check_usage_limit(user, len(files))
     
     job_ids = []
     
     for file in files:
-        # Validate file size (5GB limit)
         contents = await file.read()
-        if len(contents) > 5 * 1024 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail=f"File {file.filename} too large. Maximum size is 5GB.")
-        
-        # Validate file type
-        ext = os.path.splitext(file.filename)[1].lower()
-        supported_formats = {".mp3", ".wav", ".m4a", ".mp4", ".flac", ".aac", ".ogg", ".avi", ".mov", ".mkv"}
-        if ext not in supported_formats:
-            raise HTTPException(status_code=400, detail=f"Unsupported file type: {ext}. Supported formats: {', '.join(supported_formats)}")
-        
-        # Encrypt and save file
-        enc_path = os.path.join(UPLOAD_DIR, f"{file.filename}.enc")
-        with open(enc_path, "wb") as f:
-            f.write(encrypt_bytes(contents))
-        
-        # Create transcription job
-        db_job = models.TranscriptionJob(
-            user_id=user.id,
-            filename=file.filename,
-            mode=mode.value,
-            language=language,
-            target_language=target_language,
-            restore_audio=restore_audio,
-            speaker_recognition=speaker_recognition
-        )
-        db.add(db_job)
-        db.commit()
-        db.refresh(db_job)
-        
-        # Add to appropriate queue (paid users get priority)
-        queue = paid_q if user.is_paid else free_q
-        queue.enqueue(
-            transcribe_job,
-            db_job.id,
-            enc_path,
-            mode.value,
-            language,
-            target_language,
-            restore_audio,
-            speaker_recognition
-        )
+        check_upload(file.filename, len(contents))
         
-        job_ids.append(db_job.id)
-        user.usage_count += 1
+        job_ids.append(queue_job(
+            db, user, file.filename, mode, language, target_language, restore_audio, speaker_recognition,
+            lambda job_id: save_input(job_id, encrypt_bytes(contents)),
+        ))
     
-    db.commit()
     return {"job_ids": job_ids, "message": f"Successfully queued {len(files)} file(s) for transcription"}
 
+def upload_status(session: uploads.UploadSession) -> schemas.UploadStatus:
+    received = uploads.received_chunks(redis_conn, session) if session.job_id is None else set(range(session.chunks))
+    offset, missing = uploads.progress(session, received)
+    return schemas.UploadStatus(
+        upload_id=session.upload_id,
+        filename=session.filename,
+        size=session.size,
+        chunk_size=session.chunk_size,
+        chunks=session.chunks,
+        offset=offset,
+        missing=missing,
+        job_id=session.job_id,
+    )
+
+def get_upload(upload_id: str, user: models.User) -> uploads.UploadSession:
+    session = uploads.get_session(redis_conn, upload_id, user.id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+@app.post("/uploads", response_model=schemas.UploadStatus, status_code=201, dependencies=[Depends(limiter.limit("10/minute"))])
+async def create_upload(
+    upload: schemas.UploadCreate,
+    response: Response,
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    """Start a resumable upload; PUT its chunks to /uploads/{upload_id}/chunks/{index}, then finalize"""
+    check_usage_limit(current_user, 1)
+    check_upload(upload.filename, upload.size)
+    if upload.size <= 0:
+        raise HTTPException(status_code=400, detail="File is empty")
+    
+    options = upload.dict(exclude={"filename", "size", "chunk_size"})
+    try:
+        session = uploads.create_session(redis_conn, current_user.id, upload.filename, upload.size, upload.chunk_size, options)
+    except uploads.UploadConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers["Location"] = f"/uploads/{session.upload_id}"
+    return upload_status(session)
+
+@app.put("/uploads/{upload_id}/chunks/{index}", status_code=204, dependencies=[Depends(limiter.limit("600/minute"))])
+async def put_upload_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    """Store one chunk; chunks may be sent in parallel, in any order, and again after a failure"""
+    session = get_upload(upload_id, current_user)
+    try:
+        await uploads.write_chunk(redis_conn, session, index, request.stream())
+    except uploads.UploadConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(status_code=204)
+
+@app.api_route("/uploads/{upload_id}", methods=["GET", "HEAD"], response_model=schemas.UploadStatus, dependencies=[Depends(limiter.limit("120/minute"))])
+async def get_upload_status(
+    upload_id: str,
+    response: Response,
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    """Chunks still missing, and the contiguous offset as Upload-Offset for tus-style clients"""
+    status = upload_status(get_upload(upload_id, current_user))
+    response.headers["Upload-Offset"] = str(status.offset)
+    response.headers["Upload-Length"] = str(status.size)
+    response.headers["Cache-Control"] = "no-store"
+    return status
+
+# A plain def, so assembling a multi-GB input runs in the threadpool
+@app.post("/uploads/{upload_id}/finalize", dependencies=[Depends(limiter.limit("10/minute"))])
+def finalize_upload(
+    upload_id: str,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Assemble a complete upload and queue it for transcription, like /jobs/upload"""
+    session = get_upload(upload_id, current_user)
+    if session.job_id is not None:
+        # Repeated finalize, e.g. after the response to the first one was lost
+        return {"job_ids": [session.job_id], "message": "Upload already finalized"}
+    
+    _, missing = uploads.progress(session, uploads.received_chunks(redis_conn, session))
+    if missing:
+        raise HTTPException(status_code=409, detail={"message": "Upload is incomplete", "missing": missing})
+    check_usage_limit(current_user, 1)
+    try:
+        uploads.claim_finalize(redis_conn, session)
+    except uploads.UploadConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    try:
+        options = session.options
+        job_id = queue_job(
+            db, current_user, session.filename, schemas.Mode(options["mode"]), options["language"],
+            options["target_language"], options["restore_audio"], options["speaker_recognition"],
+            lambda job_id: uploads.assemble(session, job_id),
+        )
+    except Exception:
+        uploads.release_finalize(redis_conn, session)
+        raise
+    try:
+        uploads.mark_finalized(redis_conn, session, job_id)
+    except Exception:
+        # The job is committed; repeated finalize calls must find it rather than the claim
+        uploads.record_job(redis_conn, session, job_id)
+        raise
+    return {"job_ids": [job_id], "message": "Successfully queued 1 file(s) for transcription"}
+
+@app.delete("/uploads/{upload_id}", status_code=204, dependencies=[Depends(limiter.limit("10/minute"))])
+async def abort_upload(
+    upload_id: str,
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    """Abandon an upload and delete its chunks"""
+    session = get_upload(upload_id, current_user)
+    if session.job_id is None:
+        uploads.discard(redis_conn, session)
+    return Response(status_code=204)
+
 @app.get("/jobs/{job_id}", response_model=schemas.JobStatus)
-@limiter.limit("30/minute")
 async def get_job_status(
     job_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    request: Request,
+    response: Response,
+    email: str = Depends(auth.get_token_subject),
     db: Session = Depends(get_db)
 ):
     """Get transcription job status"""
-    job = db.query(models.TranscriptionJob).filter_by(id=job_id, user_id=current_user.id).first()
+    # Pollers mostly revalidate; a current validator is answered from the status cache,
+    # read in the same round trip as the rate limit and the caller's user ID
+    pipe = redis_conn.pipeline(transaction=False)
+    enforce = limiter.queue_limit(pipe, request, "30/minute")
+    parse_user_id = auth.queue_user_id(pipe, email)
+    parse = status_cache.queue_read(pipe, [job_id])
+    replies = execute_with_limits(pipe)
+    enforce(replies[0])
+    user_id = auth.resolve_user_id(db, redis_conn, email, parse_user_id(replies[1]))
+    cached = parse(replies[2:]).get(job_id)
+    if cached is not None and cached.user_id == user_id and is_fresh(request, job_etag(cached), cached.updated_at):
+        return conditional(request, response, job_etag(cached), REVALIDATE, cached.updated_at)
+    
+    job = db.query(models.TranscriptionJob).options(
+        defer(models.TranscriptionJob.transcript_encrypted)
+    ).filter_by(id=job_id, user_id=user_id).first()
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
+    if cached is None:
+        # The next poll is answered from the cache
+        status_cache.backfill(redis_conn, [status_cache.CachedStatus.of(job)])
+    
+    not_modified = conditional(request, response, job_etag(job), REVALIDATE, job.updated_at or job.created_at)
+    return not_modified or job
+
+@app.post("/jobs/status", response_model=List[schemas.JobStatusSummary])
+async def bulk_job_status(
+    req: schemas.BulkStatusRequest,
+    request: Request,
+    email: str = Depends(auth.get_token_subject),
+    db: Session = Depends(get_db)
+):
+    """Statuses of many jobs in one request, read from the status cache in one Redis round trip"""
+    job_ids = list(dict.fromkeys(req.job_ids))
+    if len(job_ids) > MAX_STATUS_JOBS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_STATUS_JOBS} job IDs per request")
+    
+    pipe = redis_conn.pipeline(transaction=False)
+    enforce = limiter.queue_limit(pipe, request, "60/minute")
+    parse_user_id = auth.queue_user_id(pipe, email)
+    parse = status_cache.queue_read(pipe, job_ids)
+    replies = execute_with_limits(pipe)
+    enforce(replies[0])
+    user_id = auth.resolve_user_id(db, redis_conn, email, parse_user_id(replies[1]))
+    cached = parse(replies[2:])
+    # Jobs of other users and unknown IDs are left out, as in bulk export
+    entries = {job_id: entry for job_id, entry in cached.items() if entry.user_id == user_id}
+    missing = [job_id for job_id in job_ids if job_id not in cached]
+    if missing:
+        jobs = db.query(models.TranscriptionJob).options(load_only(
+            models.TranscriptionJob.id,
+            models.TranscriptionJob.user_id,
+            models.TranscriptionJob.status,
+            models.TranscriptionJob.version,
+            models.TranscriptionJob.updated_at,
+        )).filter(
+            models.TranscriptionJob.id.in_(missing),
+            models.TranscriptionJob.user_id == user_id
+        ).all()
+        found = [status_cache.CachedStatus.of(job) for job in jobs]
+        status_cache.backfill(redis_conn, found)
+        entries.update((entry.id, entry) for entry in found)
     
-    return job
+    return [
+        schemas.JobStatusSummary(id=job_id, status=entries[job_id].status, updated_at=entries[job_id].updated_at)
+        for job_id in job_ids if job_id in entries
+    ]
 
-@app.get("/jobs", response_model=List[schemas.JobStatus])
-@limiter.limit("30/minute")
+@app.get("/jobs", response_model=List[schemas.JobStatus], dependencies=[Depends(limiter.limit("30/minute"))])
 async def get_user_jobs(
+    request: Request,
+    response: Response,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get all transcription jobs for current user"""
-    jobs = db.query(models.TranscriptionJob).filter_by(user_id=current_user.id).order_by(models.TranscriptionJob.created_at.desc()).all()
-    return jobs
+    jobs = db.query(models.TranscriptionJob).options(
+        defer(models.TranscriptionJob.transcript_encrypted)
+    ).filter_by(user_id=current_user.id).order_by(models.TranscriptionJob.created_at.desc()).all()
+    
+    # No Last-Modified: deleting a job changes the list without a newer timestamp
+    not_modified = conditional(request, response, list_etag(jobs), REVALIDATE)
+    return not_modified or jobs
 
-@app.get("/jobs/{job_id}/transcript")
-@limiter.limit("20/minute")
+@app.get("/jobs/{job_id}/transcript", dependencies=[Depends(limiter.limit("20/minute"))])
 async def get_transcript(
     job_id: int,
+    request: Request,
+    response: Response,
     format: str = "txt",
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Download transcript in specified format"""
-    job = db.query(models.TranscriptionJob).filter_by(id=job_id, user_id=current_user.id).first()
+    # The ciphertext is only loaded once we know the client needs the body
+    job = db.query(models.TranscriptionJob).options(
+        defer(models.TranscriptionJob.transcript_encrypted)
+    ).filter_by(id=job_id, user_id=current_user.id).first()
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    if job.status != "completed":
+    # Cascade jobs serve their draft while the refinement pass runs
+    if job.status not in ("completed", "refining"):
         raise HTTPException(status_code=400, detail="Job not completed yet")
     
+    # A completed transcript never changes, so nginx may keep it (per token,
+    # via Vary) and revalidate cheaply; a draft must be revalidated every time
+    if job.status == "completed":
+        cache_control = f"public, max-age={settings.transcript_cache_seconds}, must-revalidate"
+    else:
+        cache_control = REVALIDATE
+    # JSON is stored gzip-compressed and sent as stored to clients that accept it
+    gzip_ok = format == "json" and accepts_encoding(request, "gzip")
+    etag = job_etag(job, format, "gz") if gzip_ok else job_etag(job, format)
+    vary = "Authorization, Accept-Encoding" if format == "json" else "Authorization"
+    not_modified = conditional(request, response, etag, cache_control, job.updated_at or job.created_at, vary)
+    if not_modified:
+        return not_modified
+    
     if not job.transcript_encrypted:
         raise HTTPException(status_code=404, detail="Transcript not available")
     
-    # Decrypt transcript
-    data = decrypt(job.transcript_encrypted)
-    
     if format == "json":
-        return json.loads(data)
+        body, encoding = transcript_body(job.transcript_encrypted)
+        if encoding == "gzip" and not gzip_ok:
+            body, encoding = gzip.decompress(body), None
+        elif encoding is None and gzip_ok:
+            # Columnar rows written before the JSON stream was stored; a fast level keeps this cheap
+            body, encoding = gzip.compress(body, compresslevel=1), "gzip"
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=dict(response.headers))
     
-    # Parse segments for other formats
+    # Other formats render straight from the segment columns
     try:
-        segments = json.loads(data)["segments"]
-    except (json.JSONDecodeError, KeyError):
+        segments = load_transcript(job.transcript_encrypted).segments
+    except (ValueError, KeyError):
         raise HTTPException(status_code=500, detail="Invalid transcript format")
     
     # Export in requested format
@@ -245,12 +522,11 @@ async def get_transcript(
         raise HTTPException(status_code=400, detail=f"Format '{format}' not supported")
     
     filename = f"{job.filename}.{ext}"
-    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    headers = {"Content-Disposition": f"attachment; filename={filename}", **response.headers}
     
     return StreamingResponse(buf, media_type=media, headers=headers)
 
-@app.post("/jobs/export")
-@limiter.limit("5/minute")
+@app.post("/jobs/export", dependencies=[Depends(limiter.limit("5/minute"))])
 async def bulk_export(
     req: schemas.BulkExportRequest,
     current_user: models.User = Depends(auth.get_current_user),
@@ -260,7 +536,7 @@ async def bulk_export(
     jobs = db.query(models.TranscriptionJob).filter(
         models.TranscriptionJob.id.in_(req.job_ids),
         models.TranscriptionJob.user_id == current_user.id,
-        models.TranscriptionJob.status == "completed"
+        models.TranscriptionJob.status.in_(("completed", "refining"))
     ).all()
     
     if not jobs:
@@ -274,7 +550,7 @@ async def bulk_export(
                 continue
             
             try:
-                segments = json.loads(decrypt(job.transcript_encrypted))["segments"]
+                segments = load_transcript(job.transcript_encrypted).segments
                 buf, _, ext = export_segments(segments, req.format)
                 zf.writestr(f"{job.filename}.{ext}", buf.getvalue())
             except Exception as e:
@@ -285,8 +561,7 @@ async def bulk_export(
     headers = {"Content-Disposition": "attachment; filename=transcripts.zip"}
     return StreamingResponse(mem, media_type="application/zip", headers=headers)
 
-@app.delete("/jobs/{job_id}", status_code=204)
-@limiter.limit("5/minute")
+@app.delete("/jobs/{job_id}", status_code=204, dependencies=[Depends(limiter.limit("5/minute"))])
 async def delete_job(
     job_id: int,
     current_user: models.User = Depends(auth.get_current_user),
@@ -298,32 +573,84 @@ async def delete_job(
         raise HTTPException(status_code=404, detail="Job not found")
     
     # Remove encrypted file
-    enc_path = os.path.join(UPLOAD_DIR, f"{job.filename}.enc")
-    if os.path.exists(enc_path):
-        try:
-            os.remove(enc_path)
-        except OSError:
-            pass
+    try:
+        delete_input(job.id)
+    except OSError:
+        pass
+    
+    get_index().delete_job(job.id)
     
     # Delete from database
     db.delete(job)
     db.commit()
+    status_cache.forget(redis_conn, job_id)
     
     return Response(status_code=204)
 
+@app.get("/search", response_model=List[schemas.SearchResult], dependencies=[Depends(limiter.limit("30/minute"))])
+async def search_transcripts(
+    q: str,
+    limit: int = 50,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Search the current user's transcripts; segment hits are grouped by job, best job first"""
+    if not 1 <= limit <= 200:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 200")
+    
+    hits = get_index().search(current_user.id, q, limit)
+    if not hits:
+        return []
+    
+    jobs = {job.id: job for job in db.query(models.TranscriptionJob).filter(
+        models.TranscriptionJob.id.in_({hit.job_id for hit in hits}),
+        models.TranscriptionJob.user_id == current_user.id
+    )}
+    
+    # Only the transcripts that matched are decrypted, to fill in segment text
+    results, texts = {}, {}
+    for hit in hits:
+        job = jobs.get(hit.job_id)
+        if job is None:
+            continue
+        if job.id not in results:
+            results[job.id] = {"job_id": job.id, "filename": job.filename, "score": hit.score, "segments": []}
+            try:
+                texts[job.id] = load_transcript(job.transcript_encrypted).segments.texts()
+            except Exception as e:
+                logger.error(f"Could not read transcript of job {job.id} for search: {e}")
+                texts[job.id] = []
+        text = texts[job.id][hit.segment] if hit.segment < len(texts[job.id]) else None
+        results[job.id]["segments"].append({"segment": hit.segment, "start": hit.start, "end": hit.end, "text": text})
+    
+    return list(results.values())
+
 @app.get("/languages")
-async def get_supported_languages():
+async def get_supported_languages(request: Request):
     """Get list of supported languages for transcription and translation"""
-    return {
-        "transcription_languages": [
-            "en", "es", "fr", "de", "it", "pt", "ru", "ja", "ko", "zh", "ar", "hi", "nl", "sv", "no", "da", "fi", "pl", "tr", "he", "th", "vi", "id", "ms", "tl", "bn", "ur", "fa", "ps", "ku", "si", "my", "km", "lo", "ne", "ta", "te", "kn", "ml", "gu", "pa", "or", "as", "bn", "mr", "sa", "hi", "ur", "ne", "si", "my", "km", "lo", "th", "vi", "id", "ms", "tl", "jv", "su", "ceb", "war", "hil", "bcl", "pam", "bik", "pag", "tsg", "kng", "cbk", "krj", "mdh", "mrw", "sjb", "atd", "ctd", "bln", "fbl", "lbl", "ubl", "rbl", "kbl", "abl", "tbl", "sbl", "mbl", "nbl", "pbl", "qbl", "rbl", "sbl", "tbl", "ubl", "vbl", "wbl", "xbl", "ybl", "zbl"
-        ],
-        "translation_languages": [
-            "en", "es", "fr", "de", "it", "pt", "ru", "ja", "ko", "zh", "ar", "hi", "nl", "sv", "no", "da", "fi", "pl", "tr", "he", "th", "vi", "id", "ms", "tl", "bn", "ur", "fa", "ps", "ku", "si", "my", "km", "lo", "ne", "ta", "te", "kn", "ml", "gu", "pa", "or", "as", "bn", "mr", "sa", "hi", "ur", "ne", "si", "my", "km", "lo", "th", "vi", "id", "ms", "tl", "jv", "su", "ceb", "war", "hil", "bcl", "pam", "bik", "pag", "tsg", "kng", "cbk", "krj", "mdh", "mrw", "sjb", "atd", "ctd", "bln", "fbl", "lbl", "ubl", "rbl", "kbl", "abl", "tbl", "sbl", "mbl", "nbl", "pbl", "qbl", "rbl", "sbl", "tbl", "ubl", "vbl", "wbl", "xbl", "ybl", "zbl"
-        ]
-    }
+    if is_fresh(request, LANGUAGES_ETAG):
+        return Response(status_code=304, headers=LANGUAGES_HEADERS)
+    return Response(content=LANGUAGES_BODY, media_type="application/json", headers=LANGUAGES_HEADERS)
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "TranscribeAI API"}
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = 10,
+    interval_ms: float = 10,
+    admin: models.User = Depends(auth.get_current_admin)
+):
+    """Sample this API process for N seconds and return folded stacks for a flamegraph"""
+    if not 0 < seconds <= 60 or not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="seconds must be in (0, 60] and interval_ms in [1, 1000]")
+    
+    logger.info(f"Profiling for {seconds}s at {interval_ms}ms, requested by {admin.email}")
+    try:
+        # Sample from a worker thread so the event loop keeps serving (and is profiled)
+        stacks = await run_in_threadpool(sample_stacks, seconds, interval_ms / 1000)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(folded(stacks))
@@ -0,0 +1,242 @@
+"""
+Prometheus metrics for the API and the transcription worker, and per-job traces.
+
+The worker supervisor runs several worker processes and the API may run
+several uvicorn workers, so metrics are collected in prometheus_client's
+multiprocess mode when PROMETHEUS_MULTIPROC_DIR is set before this module
+is imported. worker.py sets and clears it for the worker; the API needs it
+set to an empty directory before it starts (docker-compose.yml uses a
+tmpfs), otherwise each API process reports only its own requests.
+
+    python -m backend.metrics dump-traces [--out traces.jsonl]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client import REGISTRY, multiprocess, start_http_server
+
+from .config import settings
+
+logger = logging.getLogger("metrics")
+
+TRACES_KEY = "transcription:traces"
+
+STAGE_SECONDS = Histogram(
+    "transcription_stage_seconds",
+    "Wall time spent in each transcription job stage",
+    ["stage", "mode"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+AUDIO_SECONDS = Counter(
+    "transcription_audio_seconds_total",
+    "Seconds of audio processed",
+    ["mode"],
+)
+REAL_TIME_FACTOR = Histogram(
+    "transcription_real_time_factor",
+    "Job processing time divided by audio duration",
+    ["mode"],
+    buckets=(0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5),
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "transcription_queue_wait_seconds",
+    "Time between enqueueing a job and a worker starting it",
+    ["queue"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+JOBS = Counter(
+    "transcription_jobs_total",
+    "Finished transcription jobs",
+    ["mode", "status"],
+)
+STRIPE_EVENTS = Counter(
+    "stripe_webhook_events_total",
+    "Verified Stripe webhook deliveries, queued or dropped as redeliveries",
+    ["type", "outcome"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "API request latency by route template and status",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+HTTP_REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds",
+    "Time each API request spent executing SQL",
+    ["route"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+HTTP_REQUEST_REDIS_SECONDS = Histogram(
+    "http_request_redis_seconds",
+    "Time each API request spent talking to Redis",
+    ["route"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+HTTP_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "API requests currently being served",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+
+
+class JobTrace:
+    """Per-stage timings for one job, kept as offsets from the job start.
+
+    Stages may run concurrently (see ``pipeline.run_concurrently``); each
+    one is recorded as its own span and observed in ``STAGE_SECONDS``.
+    """
+
+    def __init__(self, job_id: int, mode: str):
+        self.job_id = job_id
+        self.mode = mode
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans: list = []
+        self.audio_seconds: Optional[float] = None
+        self.queue: Optional[str] = None
+        self.queue_wait_seconds: Optional[float] = None
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.spans.append({"stage": name, "offset": start - self._t0, "seconds": elapsed})
+            STAGE_SECONDS.labels(name, self.mode).observe(elapsed)
+
+    def timed(self, name: str, fn: Callable[[], Any]) -> Callable[[], Any]:
+        """Wrap a zero-argument stage function so its run is recorded as ``name``."""
+        def run():
+            with self.stage(name):
+                return fn()
+        return run
+
+    def set_queue_wait(self, queue: str, enqueued_at: Optional[datetime]) -> None:
+        if enqueued_at is None:
+            return
+        if enqueued_at.tzinfo is None:
+            enqueued_at = enqueued_at.replace(tzinfo=timezone.utc)
+        self.queue = queue
+        self.queue_wait_seconds = max(0.0, self.started_at - enqueued_at.timestamp())
+        QUEUE_WAIT_SECONDS.labels(queue).observe(self.queue_wait_seconds)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._t0
+
+    def summary(self) -> dict:
+        """Compact timing summary stored in the transcript metadata."""
+        stages: dict = {}
+        for span in self.spans:
+            stages[span["stage"]] = stages.get(span["stage"], 0.0) + span["seconds"]
+        processing_time = self.elapsed
+        return {
+            "processing_time": processing_time,
+            "stage_seconds": stages,
+            "audio_seconds": self.audio_seconds,
+            "real_time_factor": processing_time / self.audio_seconds if self.audio_seconds else None,
+            "queue_wait_seconds": self.queue_wait_seconds,
+        }
+
+    def finish(self, status: str) -> dict:
+        """Observe job-level metrics and return the full trace."""
+        JOBS.labels(self.mode, status).inc()
+        summary = self.summary()
+        if status == "completed" and self.audio_seconds:
+            AUDIO_SECONDS.labels(self.mode).inc(self.audio_seconds)
+            REAL_TIME_FACTOR.labels(self.mode).observe(summary["real_time_factor"])
+        return {
+            "job_id": self.job_id,
+            "mode": self.mode,
+            "status": status,
+            "started_at": self.started_at,
+            "queue": self.queue,
+            "spans": self.spans,
+            **summary,
+        }
+
+
+def push_trace(redis_conn, trace: dict) -> None:
+    """Keep the most recent job traces in a capped Redis list for offline analysis."""
+    try:
+        pipe = redis_conn.pipeline()
+        pipe.lpush(TRACES_KEY, json.dumps(trace))
+        pipe.ltrim(TRACES_KEY, 0, settings.trace_history - 1)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Failed to record trace for job {trace.get('job_id')}: {e}")
+
+
+def dump_traces(redis_conn, out) -> int:
+    """Write stored traces as JSON lines, oldest first."""
+    traces = redis_conn.lrange(TRACES_KEY, 0, -1)
+    for raw in reversed(traces):
+        out.write(raw.decode() if isinstance(raw, bytes) else raw)
+        out.write("\n")
+    return len(traces)
+
+
+def registry() -> CollectorRegistry:
+    """The registry to expose: aggregated across processes when multiprocess mode is on."""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+def start_metrics_server(port: int) -> None:
+    start_http_server(port, registry=registry())
+    logger.info(f"Serving Prometheus metrics on :{port}/metrics")
+
+
+def start_shared_metrics_server(port: int) -> bool:
+    """Serve metrics on ``port`` unless another process of the deployment already does.
+
+    In multiprocess mode any one process serves the metrics of all of them,
+    so of several API processes the first to bind the port serves it.
+    Without PROMETHEUS_MULTIPROC_DIR it serves only its own.
+    """
+    try:
+        start_metrics_server(port)
+    except OSError as e:
+        logger.info(f"Prometheus metrics port {port} already served by another process: {e}")
+        return False
+    return True
+
+
+def main(argv=None) -> None:
+    from redis import Redis
+
+    parser = argparse.ArgumentParser(description="Transcription worker metrics tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    dump = sub.add_parser("dump-traces", help="write recorded job traces as JSON lines")
+    dump.add_argument("--out", help="file to write (default: stdout)")
+    args = parser.parse_args(argv)
+
+    redis_conn = Redis.from_url(settings.redis_url)
+    if args.out:
+        with open(args.out, "w") as f:
+            count = dump_traces(redis_conn, f)
+    else:
+        count = dump_traces(redis_conn, sys.stdout)
+    logger.info(f"Dumped {count} trace(s)")
+
+
+if __name__ == "__main__":
+    main()
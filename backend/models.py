@@ -12,6 +12,8 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     is_paid = Column(Boolean, default=False)
     usage_count = Column(Integer, default=0)
+    # Creation time of the last Stripe event applied to is_paid; older ones are ignored
+    stripe_event_at = Column(Integer, nullable=True)
 
     jobs = relationship("TranscriptionJob", back_populates="owner")
 
@@ -30,5 +32,10 @@ class TranscriptionJob(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     transcript_encrypted = Column(Text)
     transcript_format = Column(String, default="txt")
+    # Bumped by SQLAlchemy on every update; HTTP validators are built from it
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     owner = relationship("User", back_populates="jobs")
+
+    __mapper_args__ = {"version_id_col": version}
@@ -1,9 +1,12 @@
 import stripe
 from fastapi import APIRouter, HTTPException, Depends, Request
+from redis.exceptions import RedisError
 from sqlalchemy.orm import Session
 from .config import settings
 from .database import get_db
-from . import models, auth
+from .metrics import STRIPE_EVENTS
+from .producer import redis_conn
+from . import models, auth, webhooks
 import logging
 
 # Setup logging
@@ -52,8 +55,8 @@ async def create_checkout_session(
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/webhook")
-async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
-    """Handle Stripe webhooks for subscription events"""
+async def stripe_webhook(request: Request):
+    """Verify a Stripe event and queue it for the workers (see webhooks.py)"""
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
     
@@ -69,61 +72,18 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
         logger.error(f"Invalid signature: {e}")
         raise HTTPException(status_code=400, detail="Invalid signature")
     
-    # Handle the event
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-        await handle_checkout_completed(session, db)
-    elif event["type"] == "customer.subscription.deleted":
-        subscription = event["data"]["object"]
-        await handle_subscription_deleted(subscription, db)
-    elif event["type"] == "invoice.payment_failed":
-        invoice = event["data"]["object"]
-        await handle_payment_failed(invoice, db)
-    
-    return {"status": "success"}
-
-async def handle_checkout_completed(session: dict, db: Session):
-    """Handle successful checkout completion"""
-    try:
-        user_id = int(session["metadata"]["user_id"])
-        user = db.query(models.User).filter(models.User.id == user_id).first()
-        
-        if user:
-            user.is_paid = True
-            db.commit()
-            logger.info(f"User {user.email} subscription activated")
-        else:
-            logger.error(f"User {user_id} not found for subscription activation")
-            
-    except Exception as e:
-        logger.error(f"Error handling checkout completion: {e}")
-
-async def handle_subscription_deleted(subscription: dict, db: Session):
-    """Handle subscription cancellation"""
+    # Acknowledge as soon as the event is queued; Stripe redelivers it on an error
     try:
-        customer_email = subscription.get("customer_email")
-        if customer_email:
-            user = db.query(models.User).filter(models.User.email == customer_email).first()
-            if user:
-                user.is_paid = False
-                db.commit()
-                logger.info(f"User {user.email} subscription cancelled")
-                
-    except Exception as e:
-        logger.error(f"Error handling subscription deletion: {e}")
-
-async def handle_payment_failed(invoice: dict, db: Session):
-    """Handle failed payment"""
-    try:
-        customer_email = invoice.get("customer_email")
-        if customer_email:
-            user = db.query(models.User).filter(models.User.email == customer_email).first()
-            if user:
-                # You might want to send an email notification here
-                logger.warning(f"Payment failed for user {user.email}")
-                
-    except Exception as e:
-        logger.error(f"Error handling payment failure: {e}")
+        queued = webhooks.enqueue_event(redis_conn, event["id"], event["type"], payload)
+    except RedisError as e:
+        logger.error(f"Could not queue Stripe event {event['id']}: {e}")
+        raise HTTPException(status_code=503, detail="Event not queued, retry later")
+    
+    STRIPE_EVENTS.labels(event["type"], "queued" if queued else "duplicate").inc()
+    if not queued:
+        logger.info(f"Ignoring redelivered Stripe event {event['id']}")
+        return {"status": "duplicate"}
+    return {"status": "queued"}
 
 @router.get("/subscription-status")
 async def get_subscription_status(
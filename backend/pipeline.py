@@ -0,0 +1,45 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+logger = logging.getLogger("pipeline")
+
+
+class StageResult(NamedTuple):
+    value: Any = None
+    error: Optional[BaseException] = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _timed(fn: Callable[[], Any]) -> StageResult:
+    start = time.perf_counter()
+    try:
+        value = fn()
+    except Exception as e:
+        return StageResult(error=e, seconds=time.perf_counter() - start)
+    return StageResult(value=value, seconds=time.perf_counter() - start)
+
+
+def run_concurrently(stages: Dict[str, Callable[[], Any]]) -> Dict[str, StageResult]:
+    """Run independent stages on their own threads and wait for all of them.
+
+    A failing stage never cancels the others; its exception is returned in
+    its ``StageResult`` so the caller decides how to fall back. CTranslate2
+    and torch release the GIL during inference, so threads give real overlap.
+    """
+    if len(stages) == 1:
+        name, fn = next(iter(stages.items()))
+        return {name: _timed(fn)}
+
+    with ThreadPoolExecutor(max_workers=len(stages), thread_name_prefix="stage") as pool:
+        futures = {name: pool.submit(_timed, fn) for name, fn in stages.items()}
+        results = {name: future.result() for name, future in futures.items()}
+
+    for name, result in results.items():
+        logger.info(f"Stage {name} finished in {result.seconds:.2f}s ({'ok' if result.ok else 'failed'})")
+    return results
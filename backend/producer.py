@@ -0,0 +1,61 @@
+"""
+Producer side of the transcription queues.
+
+The API enqueues jobs by dotted function path, so it never imports
+``tasks`` and with it torch, faster_whisper, pyannote or googletrans.
+Workers resolve the path when they pick the job up.
+"""
+
+from rq import Callback, Queue, Retry
+
+from .config import settings
+from .instrumentation import timed_redis
+from .routing import queue_name
+
+TRANSCRIBE_JOB = "backend.tasks.transcribe_job"
+ON_FAILURE = Callback("backend.tasks.on_job_failure")
+
+# Failed, timed-out and abandoned jobs are retried with exponential backoff;
+# each attempt resumes from the job's checkpoint
+RETRY = Retry(
+    max=settings.job_max_retries,
+    interval=[settings.job_retry_backoff_seconds * 4 ** i for i in range(settings.job_max_retries)],
+) if settings.job_max_retries > 0 else None
+
+# Redis connection and queues
+redis_conn = timed_redis(settings.redis_url)
+_queues: dict = {}
+
+
+def get_queue(name: str) -> Queue:
+    if name not in _queues:
+        _queues[name] = Queue(name, connection=redis_conn)
+    return _queues[name]
+
+
+def enqueue_transcription(
+    is_paid: bool,
+    job_id: int,
+    encrypted_file_path: str,
+    mode: str,
+    language,
+    target_language,
+    restore_audio: bool,
+    speaker_recognition: bool,
+):
+    """Queue a transcription job on its tier and mode's sub-queue (see routing.py)."""
+    queue = get_queue(queue_name("paid" if is_paid else "free", mode))
+    return queue.enqueue(
+        TRANSCRIBE_JOB,
+        job_id,
+        encrypted_file_path,
+        mode,
+        language,
+        target_language,
+        restore_audio,
+        speaker_recognition,
+        job_timeout=settings.job_timeout_seconds,
+        result_ttl=86400,  # Keep results for 24 hours
+        retry=RETRY,
+        on_failure=ON_FAILURE,
+    )
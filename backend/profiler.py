@@ -0,0 +1,56 @@
+"""
+In-process sampling profiler for the live API.
+
+Samples every thread's Python stack at a fixed interval and aggregates
+them in the folded-stack format understood by flamegraph.pl, speedscope
+and inferno. Nothing is installed into the interpreter, so sampling costs
+nothing when no profile is running.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+_running = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # ';' separates frames in the folded format
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})".replace(";", ":")
+
+
+def sample_stacks(seconds: float, interval: float) -> Counter:
+    """Sample all threads except the sampler for ``seconds`` and count unique stacks."""
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        stacks: Counter = Counter()
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(_frame_label(frame))
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, f"thread-{thread_id}"))
+                stacks[";".join(reversed(frames))] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _running.release()
+
+
+def folded(stacks: Counter) -> str:
+    """One ``frame;frame;frame count`` line per unique stack, heaviest first."""
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
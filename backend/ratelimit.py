@@ -0,0 +1,261 @@
+"""
+Rate limiting shared by every API process through Redis.
+
+Limits use GCRA (a token bucket stored as a single timestamp per key) in
+one Lua script, so a check is atomic and costs one round-trip. The script
+can also be queued on a caller's pipeline to share that round-trip with
+other per-request Redis work. If Redis is unreachable the same algorithm
+runs in process memory, so limits degrade to per-process instead of
+disappearing.
+
+Every request counts against a bucket for its real client IP, and requests
+with a valid bearer token also against one for their user; it is allowed
+only if both have room. The IP is taken from X-Forwarded-For, skipping
+``TRUSTED_PROXY_HOPS`` proxies, only when the request comes from an address
+in ``TRUSTED_PROXY_CIDRS``; anyone else could pick their own header. Users
+behind one NAT address share its buckets.
+"""
+
+import ipaddress
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Callable, List, NamedTuple, Tuple
+
+from fastapi import HTTPException, Request
+from jose import JWTError, jwt
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import NoScriptError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+
+from .config import settings
+
+logger = logging.getLogger("ratelimit")
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# KEYS: one bucket per limit. ARGV: emission interval and burst window (ms) per key.
+# Nothing is consumed unless every limit allows the request.
+GCRA_SCRIPT = """
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local allowed = 1
+local retry_after = 0
+local tats = {}
+for i, key in ipairs(KEYS) do
+    local interval = tonumber(ARGV[2 * i - 1])
+    local period = tonumber(ARGV[2 * i])
+    local tat = tonumber(redis.call('GET', key) or now)
+    if tat < now then tat = now end
+    local new_tat = tat + interval
+    local allow_at = new_tat - period
+    if allow_at > now then
+        allowed = 0
+        retry_after = math.max(retry_after, allow_at - now)
+    end
+    tats[i] = new_tat
+end
+if allowed == 1 then
+    for i, key in ipairs(KEYS) do
+        redis.call('SET', key, tats[i], 'PX', math.ceil(tats[i] - now))
+    end
+end
+return {allowed, retry_after}
+"""
+
+
+class Rule(NamedTuple):
+    count: int
+    period: int  # seconds
+
+    @property
+    def interval_ms(self) -> float:
+        return self.period * 1000 / self.count
+
+    @classmethod
+    def parse(cls, spec: str) -> "Rule":
+        """Parse slowapi-style specs such as ``"10/minute"``."""
+        count, _, unit = spec.partition("/")
+        return cls(int(count), PERIODS[unit.strip().rstrip("s")])
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    retry_after: float  # seconds
+
+
+@lru_cache(maxsize=4)
+def _networks(cidrs: str) -> tuple:
+    return tuple(ipaddress.ip_network(cidr.strip(), strict=False) for cidr in cidrs.split(",") if cidr.strip())
+
+
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in _networks(settings.trusted_proxy_cidrs))
+
+
+def client_ip(request: Request) -> str:
+    """The address of the client, skipping our own trusted reverse proxies."""
+    peer = request.client.host if request.client else "unknown"
+    hops = settings.trusted_proxy_hops
+    forwarded = request.headers.get("x-forwarded-for")
+    if hops > 0 and forwarded and _is_trusted_proxy(peer):
+        chain = [part.strip() for part in forwarded.split(",") if part.strip()]
+        if len(chain) >= hops:
+            return chain[-hops]
+    return peer
+
+
+def client_identities(request: Request) -> List[str]:
+    """``ip:<address>``, preceded by ``user:<email>`` for a valid bearer token."""
+    identities = [f"ip:{client_ip(request)}"]
+    header = request.headers.get("authorization", "")
+    if header.lower().startswith("bearer "):
+        try:
+            payload = jwt.decode(header[7:], settings.secret_key, algorithms=[settings.algorithm])
+            if payload.get("sub"):
+                identities.insert(0, f"user:{payload['sub']}")
+        except JWTError:
+            pass
+    return identities
+
+
+def execute_with_limits(pipe) -> list:
+    """Execute a pipeline carrying queued limits (see ``RateLimiter.queue_limit``).
+
+    Failed commands come back as their reply instead of raising; if Redis is
+    unreachable every reply is None.
+    """
+    count = len(pipe)
+    try:
+        return pipe.execute(raise_on_error=False)
+    except (RedisConnectionError, RedisTimeoutError):
+        return [None] * count
+
+
+class _LocalBuckets:
+    """In-process GCRA used while Redis is unavailable."""
+
+    def __init__(self):
+        self._tats: dict = {}
+        self._lock = threading.Lock()
+
+    def hit(self, keys: list, rules: list) -> Decision:
+        now = time.monotonic() * 1000
+        with self._lock:
+            new_tats, retry_after = [], 0.0
+            for key, rule in zip(keys, rules):
+                tat = max(self._tats.get(key, now), now)
+                new_tat = tat + rule.interval_ms
+                retry_after = max(retry_after, new_tat - rule.period * 1000 - now)
+                new_tats.append(new_tat)
+            if retry_after > 0:
+                return Decision(False, retry_after / 1000)
+            self._tats.update(zip(keys, new_tats))
+            if len(self._tats) > 100_000:
+                self._tats = {k: v for k, v in self._tats.items() if v > now}
+            return Decision(True, 0.0)
+
+
+class RateLimiter:
+    def __init__(self, redis_conn, prefix: str = "rl"):
+        self.redis = redis_conn
+        self.prefix = prefix
+        self._script = redis_conn.register_script(GCRA_SCRIPT)
+        self._local = _LocalBuckets()
+        self._degraded = False
+
+    def _keys(self, scope: str, identities: List[str], rules: list) -> Tuple[list, list]:
+        """One bucket per identity and rule, and the rule of each bucket."""
+        keys, key_rules = [], []
+        for identity in identities:
+            for rule in rules:
+                keys.append(f"{self.prefix}:{scope}:{identity}:{rule.count}/{rule.period}")
+                key_rules.append(rule)
+        return keys, key_rules
+
+    @staticmethod
+    def _args(rules: list) -> list:
+        args = []
+        for rule in rules:
+            args.extend([rule.interval_ms, rule.period * 1000])
+        return args
+
+    @staticmethod
+    def _decision(result) -> Decision:
+        allowed, retry_after_ms = result
+        return Decision(bool(allowed), float(retry_after_ms) / 1000)
+
+    @staticmethod
+    def _scope(request: Request) -> str:
+        # Dependencies run after routing, so the route template is known
+        route = request.scope.get("route")
+        return f"{request.method}:{getattr(route, 'path', request.url.path)}"
+
+    @staticmethod
+    def _enforce(decision: Decision) -> None:
+        if not decision.allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(max(1, round(decision.retry_after)))},
+            )
+
+    def _local_check(self, keys: list, rules: list, error) -> Decision:
+        if not self._degraded:
+            self._degraded = True
+            logger.warning(f"Redis unavailable for rate limiting, using local limits: {error}")
+        return self._local.hit(keys, rules)
+
+    def _check(self, keys: list, rules: list) -> Decision:
+        try:
+            decision = self._decision(self._script(keys=keys, args=self._args(rules)))
+        except (RedisConnectionError, RedisTimeoutError) as e:
+            return self._local_check(keys, rules, e)
+        if self._degraded:
+            self._degraded = False
+            logger.info("Redis available again for rate limiting")
+        return decision
+
+    def hit(self, scope: str, identities: List[str], rules: list) -> Decision:
+        return self._check(*self._keys(scope, identities, rules))
+
+    def limit(self, *specs: str):
+        """FastAPI dependency enforcing all of ``specs`` for the route it guards."""
+        rules = [Rule.parse(spec) for spec in specs]
+
+        def dependency(request: Request) -> None:
+            self._enforce(self.hit(self._scope(request), client_identities(request), rules))
+
+        return dependency
+
+    def queue_limit(self, pipe, request: Request, *specs: str) -> Callable[[Any], None]:
+        """Queue a route's check on a pipeline the handler is about to execute anyway.
+
+        Execute the pipeline with ``execute_with_limits`` and call the returned function
+        with this check's reply; it raises 429 when the request is over its
+        limit.
+        """
+        rules = [Rule.parse(spec) for spec in specs]
+        keys, key_rules = self._keys(self._scope(request), client_identities(request), rules)
+        # EVALSHA rather than the Script object, which would add a SCRIPT EXISTS
+        # round trip to every execution of the pipeline
+        pipe.evalsha(self._script.sha, len(keys), *keys, *self._args(key_rules))
+
+        def enforce(result) -> None:
+            if result is None:
+                decision = self._local_check(keys, key_rules, "pipeline failed")
+            elif isinstance(result, Exception):
+                # NoScriptError the first time on a Redis server: run it on its own, which loads it
+                if not isinstance(result, NoScriptError):
+                    logger.warning(f"Queued rate limit check failed, checking again: {result}")
+                decision = self._check(keys, key_rules)
+            else:
+                decision = self._decision(result)
+            self._enforce(decision)
+
+        return enforce
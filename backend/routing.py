@@ -0,0 +1,216 @@
+"""
+Model-affinity routing of transcription jobs.
+
+Jobs are queued per tier and mode (``paid:whale``, ``free:cheetah``, ...)
+instead of one queue per tier. Each worker has *home* modes whose models it
+keeps loaded for the jobs it runs, and it listens on those sub-queues. It
+takes jobs of other modes only when queue depth calls for it: the mode has a
+backlog and no live worker has it at home, or its backlog reaches
+``AFFINITY_REBALANCE_DEPTH`` jobs per home worker. Taking such a job adopts
+the mode; past ``AFFINITY_MAX_MODES`` the least recently served home mode is
+dropped and its model unloaded.
+
+Workers advertise their home modes in one sorted set per mode, scored by
+expiry and refreshed with the rq heartbeat, so a worker that dies stops
+counting after ``AFFINITY_TTL_SECONDS``. Supervised workers also record their
+home modes under their slot, so the worker that replaces one after
+``WORKER_MAX_JOBS`` jobs (or a crash) starts with the modes its
+predecessor had adopted rather than its initial ones. Tier priority is unchanged: paid
+sub-queues, including ones being helped, come before any free sub-queue.
+"""
+
+import socket
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from rq import Queue
+
+from .cascade import CASCADE_DRAFT_MODE, CASCADE_REFINE_MODE
+from .config import settings
+from .schemas import Mode
+
+TIERS = ("paid", "free")
+MODES = tuple(mode.value for mode in Mode)
+# Whisper model behind each mode; unknown modes run on the default model
+DEFAULT_MODE = Mode.dolphin.value
+# Single-model modes, which workers are spread over at startup
+MODEL_MODES = tuple(mode for mode in MODES if mode != Mode.cascade.value)
+
+HOME_KEY = "routing:home:{mode}"
+# Slots are numbered per host (by the supervisor running there)
+SLOT_HOME_KEY = "routing:slot:{host}:{slot}:home"
+
+
+def queue_name(tier: str, mode: str) -> str:
+    return f"{tier}:{mode if mode in MODES else DEFAULT_MODE}"
+
+
+def tier_of(name: str) -> str:
+    """``paid`` or ``free`` for a sub-queue (or a tier queue from before routing)."""
+    return name.split(":", 1)[0]
+
+
+def mode_of(name: str) -> Optional[str]:
+    return name.split(":", 1)[1] if ":" in name else None
+
+
+def required_modes(mode: str) -> tuple:
+    """The single-model modes whose models a job of ``mode`` uses."""
+    if mode == Mode.cascade.value:
+        return (CASCADE_DRAFT_MODE, CASCADE_REFINE_MODE)
+    return (mode if mode in MODEL_MODES else DEFAULT_MODE,)
+
+
+def served_modes(home: Iterable[str]) -> List[str]:
+    """Modes whose models are all loaded by a worker with ``home`` modes (e.g. cascade with cheetah and whale)."""
+    home = list(home)
+    loaded = {model for mode in home for model in required_modes(mode)}
+    return home + [mode for mode in MODES if mode not in home and set(required_modes(mode)) <= loaded]
+
+
+def all_queue_names() -> List[str]:
+    """Every sub-queue in priority order, then the tier queues jobs were queued on before routing."""
+    return [queue_name(tier, mode) for tier in TIERS for mode in MODES] + list(TIERS)
+
+
+def plan(home: Iterable[str], depths: Dict[str, int], home_counts: Dict[str, int], rebalance_depth: int) -> List[str]:
+    """Queues a worker with ``home`` modes should listen on, in order.
+
+    ``depths`` maps queue names to waiting jobs and ``home_counts`` modes to
+    the live workers that have them at home.
+    """
+    home = served_modes(home)
+    helping = []
+    for mode in MODES:
+        if mode in home:
+            continue
+        backlog = sum(depths.get(queue_name(tier, mode), 0) for tier in TIERS)
+        homes = home_counts.get(mode, 0)
+        if backlog and (homes == 0 or backlog >= rebalance_depth * homes):
+            helping.append((backlog, mode))
+    # Deepest backlog first
+    helping = [mode for _, mode in sorted(helping, key=lambda item: -item[0])]
+
+    names = []
+    for tier in TIERS:
+        names += [queue_name(tier, mode) for mode in home + helping]
+        # Drain jobs queued before routing
+        names.append(tier)
+    return names
+
+
+def _slot_key(slot: int) -> str:
+    return SLOT_HOME_KEY.format(host=socket.gethostname(), slot=slot)
+
+
+class HomeModes:
+    """A worker's home modes, least recently served first."""
+
+    def __init__(self, modes: Iterable[str] = (), max_modes: int = 2):
+        self.max_modes = max(1, max_modes)
+        self._modes: "OrderedDict[str, None]" = OrderedDict((mode, None) for mode in modes)
+
+    def __iter__(self):
+        return iter(self._modes)
+
+    def __contains__(self, mode: str) -> bool:
+        return mode in self._modes
+
+    def __len__(self) -> int:
+        return len(self._modes)
+
+    def serves(self, mode: str) -> bool:
+        return mode in served_modes(self._modes)
+
+    def adopt(self, mode: str) -> List[str]:
+        """Mark ``mode`` as just served; returns the modes dropped to stay within ``max_modes``."""
+        needed = set(required_modes(mode))
+        if mode not in self._modes and self.serves(mode):
+            # Served by other home modes' models: refresh those instead of adding one
+            for home in [home for home in self._modes if needed & set(required_modes(home))]:
+                self._modes.move_to_end(home)
+            return []
+        self._modes[mode] = None
+        self._modes.move_to_end(mode)
+        dropped = []
+        while len(self._modes) > self.max_modes:
+            dropped.append(self._modes.popitem(last=False)[0])
+        return dropped
+
+
+class Affinity:
+    """One worker's home modes, advertised to and planned against the other workers through Redis."""
+
+    def __init__(self, redis_conn, name: str, home: Iterable[str] = (), slot: Optional[int] = None):
+        self.redis = redis_conn
+        self.name = name
+        self.slot = slot
+        self.home = HomeModes(home, settings.affinity_max_modes)
+        self._keys = {
+            queue: Queue.redis_queue_namespace_prefix + queue
+            for queue in (queue_name(tier, mode) for tier in TIERS for mode in MODES)
+        }
+
+    def register(self, ttl: Optional[int] = None) -> None:
+        """Advertise the home modes until the next heartbeat is due (``ttl`` seconds while busy)."""
+        ttl = max(ttl or 0, settings.affinity_ttl_seconds)
+        now = time.time()
+        served = served_modes(self.home)
+        pipe = self.redis.pipeline(transaction=False)
+        for mode in MODES:
+            key = HOME_KEY.format(mode=mode)
+            if mode in served:
+                pipe.zadd(key, {self.name: now + ttl})
+            else:
+                pipe.zrem(key, self.name)
+            pipe.zremrangebyscore(key, "-inf", now)
+        self._remember(pipe, ttl)
+        pipe.execute()
+
+    def _remember(self, pipe, ttl: Optional[int] = None) -> None:
+        if self.slot is not None:
+            # Least recently served first, as HomeModes keeps them
+            pipe.set(_slot_key(self.slot), ",".join(self.home), ex=ttl or settings.affinity_ttl_seconds)
+
+    def leave(self) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        for mode in MODES:
+            pipe.zrem(HOME_KEY.format(mode=mode), self.name)
+        pipe.execute()
+
+    def queues(self) -> List[str]:
+        """Plan the next dequeue from live queue depths and home counts (one round trip)."""
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        for key in self._keys.values():
+            pipe.llen(key)
+        for mode in MODES:
+            pipe.zcount(HOME_KEY.format(mode=mode), now, "+inf")
+        replies = pipe.execute()
+        depths = dict(zip(self._keys, replies))
+        home_counts = dict(zip(MODES, replies[len(self._keys):]))
+        return plan(self.home, depths, home_counts, settings.affinity_rebalance_depth)
+
+    def adopt(self, mode: str) -> List[str]:
+        changed = not self.home.serves(mode)
+        dropped = self.home.adopt(mode)
+        if changed:
+            self.register()
+        elif self.slot is not None:
+            pipe = self.redis.pipeline(transaction=False)
+            self._remember(pipe)
+            pipe.execute()
+        return dropped
+
+
+def initial_home(index: int) -> List[str]:
+    """Home mode of the ``index``-th supervised worker, unless ``WORKER_MODES`` pins them."""
+    configured = [mode.strip() for mode in settings.worker_modes.split(",") if mode.strip() in MODES]
+    return configured or [MODEL_MODES[index % len(MODEL_MODES)]]
+
+
+def last_home(redis_conn, slot: int) -> List[str]:
+    """Home modes last recorded by the worker in ``slot``; empty if none is recent enough."""
+    recorded = redis_conn.get(_slot_key(slot))
+    return [mode for mode in recorded.decode().split(",") if mode in MODES] if recorded else []
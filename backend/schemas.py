@@ -43,15 +43,62 @@ class JobStatus(BaseModel):
         orm_mode = True
 
 
+class SearchSegment(BaseModel):
+    segment: int
+    start: float
+    end: float
+    text: Optional[str] = None
+
+
+class SearchResult(BaseModel):
+    job_id: int
+    filename: str
+    score: float
+    segments: List[SearchSegment]
+
+
 class BulkExportRequest(BaseModel):
     job_ids: List[int]
     format: str
 
 
+class BulkStatusRequest(BaseModel):
+    job_ids: List[int]
+
+
+class JobStatusSummary(BaseModel):
+    id: int
+    status: str
+    updated_at: Optional[datetime] = None
+
+
 class Mode(str, Enum):
     cheetah = "cheetah"
     dolphin = "dolphin"
     whale = "whale"
+    cascade = "cascade"
+
+
+class UploadCreate(BaseModel):
+    filename: str
+    size: int
+    chunk_size: Optional[int] = None
+    mode: Mode = Mode.dolphin
+    language: Optional[str] = None
+    target_language: Optional[str] = None
+    restore_audio: bool = False
+    speaker_recognition: bool = False
+
+
+class UploadStatus(BaseModel):
+    upload_id: str
+    filename: str
+    size: int
+    chunk_size: int
+    chunks: int
+    offset: int
+    missing: List[int]
+    job_id: Optional[int] = None
 
 
 class TranscriptionRequest(BaseModel):
@@ -0,0 +1,285 @@
+"""
+Full-text search over transcripts, one row per segment.
+
+The index is SQLite FTS5 or a Postgres ``tsvector`` column with a GIN
+index, picked from the database URL; both sit behind ``SearchIndex``. On any
+other database search is off: nothing is indexed and nothing matches. The
+worker indexes a transcript when its job completes and the API drops a
+job's rows when the job is deleted, so queries never touch the encrypted
+transcripts.
+
+Protection at rest: the index never stores transcript text. Each word is
+replaced by a keyed hash, ``HMAC(key, user_id + word)``, truncated to 80
+bits, and queries hash their terms the same way. Without the key a stolen
+database shows which segments share a word within one user's jobs, but not
+the word, and identical words of different users look unrelated. The key
+is ``SEARCH_INDEX_KEY`` (derived from ``FERNET_KEY`` when unset); rotating
+it means running ``reindex``. The trade-off is that only whole words and
+phrases match: no prefix or fuzzy search, and no stemming. Snippet text is
+recovered by decrypting only the transcripts that matched.
+
+    python -m backend.search reindex [--batch-size 200]
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import logging
+import re
+import unicodedata
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from .config import settings
+from .segments import SegmentTable
+
+logger = logging.getLogger("search")
+
+TABLE = "transcript_search"
+# FTS5 rows are addressed as job_id << SEGMENT_BITS | segment, so dropping a
+# job is a rowid range delete instead of a scan; segments past the first
+# 2**SEGMENT_BITS of a transcript are not indexed there
+SEGMENT_BITS = 20
+MAX_QUERY_TERMS = 16
+
+_WORD = re.compile(r"\w+")
+_PHRASE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+class SearchHit(NamedTuple):
+    job_id: int
+    segment: int
+    start: float
+    end: float
+    score: float
+
+
+def _index_key() -> bytes:
+    if settings.search_index_key:
+        return settings.search_index_key.encode()
+    return hmac.new(settings.fernet_key.encode(), b"transcript-search-index", hashlib.sha256).digest()
+
+
+def words(value: str) -> List[str]:
+    return _WORD.findall(unicodedata.normalize("NFKC", value).casefold())
+
+
+def parse_query(query: str) -> List[List[str]]:
+    """Split a query into phrases: ``"quoted words"`` stay together, bare words stand alone."""
+    phrases = []
+    for quoted, bare in _PHRASE.findall(query):
+        phrase = words(quoted if quoted else bare)
+        if phrase:
+            phrases.append(phrase)
+    return phrases
+
+
+class SearchIndex:
+    """Dialect-neutral half: token hashing, query shaping and the write path."""
+
+    DDL: tuple = ()
+    INSERT: str = ""
+    MAX_SEGMENTS: Optional[int] = None
+
+    def __init__(self, engine: Engine, key: Optional[bytes] = None):
+        self.engine = engine
+        self.key = key or _index_key()
+        self._schema_ready = False
+
+    def token(self, user_id: int, word: str) -> str:
+        digest = hmac.new(self.key, f"{user_id}\x00{word}".encode(), hashlib.sha256).digest()
+        return base64.b32encode(digest[:10]).decode().lower()
+
+    def tokens(self, user_id: int, value: str) -> str:
+        return " ".join(self.token(user_id, word) for word in words(value))
+
+    def ensure_schema(self) -> None:
+        if self._schema_ready:
+            return
+        with self.engine.begin() as conn:
+            for statement in self.DDL:
+                conn.execute(text(statement))
+        self._schema_ready = True
+
+    def index_job(self, job_id: int, user_id: int, segments: SegmentTable) -> int:
+        """Replace a job's rows with ``segments``; returns the number of segments indexed."""
+        self.ensure_schema()
+        rows = [
+            {
+                "user_id": user_id,
+                "job_id": job_id,
+                "segment": i,
+                "start_time": start,
+                "end_time": end,
+                "tokens": self.tokens(user_id, text),
+            }
+            for i, (start, end, text) in enumerate(zip(segments.starts, segments.ends, segments.texts()))
+        ]
+        if self.MAX_SEGMENTS is not None and len(rows) > self.MAX_SEGMENTS:
+            logger.warning(f"Job {job_id} has {len(rows)} segments; indexing only the first {self.MAX_SEGMENTS}")
+            rows = rows[:self.MAX_SEGMENTS]
+        with self.engine.begin() as conn:
+            self._delete(conn, job_id)
+            if rows:
+                conn.execute(text(self.INSERT), rows)
+        return len(rows)
+
+    def delete_job(self, job_id: int) -> None:
+        self.ensure_schema()
+        with self.engine.begin() as conn:
+            self._delete(conn, job_id)
+
+    def search(self, user_id: int, query: str, limit: int = 50) -> List[SearchHit]:
+        """Segments of ``user_id``'s jobs containing every word and phrase of ``query``, best first."""
+        phrases = parse_query(query)[:MAX_QUERY_TERMS]
+        if not phrases:
+            return []
+        self.ensure_schema()
+        hashed = [[self.token(user_id, word) for word in phrase] for phrase in phrases]
+        with self.engine.connect() as conn:
+            return self._search(conn, user_id, hashed, limit)
+
+
+class SQLiteSearchIndex(SearchIndex):
+    DDL = (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+        "tokens, user_id UNINDEXED, start_time UNINDEXED, end_time UNINDEXED, "
+        "tokenize = 'ascii', detail = 'full')",
+    )
+    INSERT = (
+        f"INSERT INTO {TABLE} (rowid, tokens, user_id, start_time, end_time) "
+        f"VALUES ((:job_id << {SEGMENT_BITS}) | :segment, :tokens, :user_id, :start_time, :end_time)"
+    )
+    MAX_SEGMENTS = 1 << SEGMENT_BITS
+
+    def _delete(self, conn, job_id: int) -> None:
+        conn.execute(
+            text(f"DELETE FROM {TABLE} WHERE rowid >= :lo AND rowid < :hi"),
+            {"lo": job_id << SEGMENT_BITS, "hi": (job_id + 1) << SEGMENT_BITS},
+        )
+
+    def _search(self, conn, user_id: int, hashed: list, limit: int) -> List[SearchHit]:
+        match = " AND ".join('"' + " ".join(phrase) + '"' for phrase in hashed)
+        rows = conn.execute(
+            text(
+                f"SELECT rowid, start_time, end_time, bm25({TABLE}) AS rank FROM {TABLE} "
+                f"WHERE {TABLE} MATCH :match AND user_id = :user_id ORDER BY rank LIMIT :limit"
+            ),
+            {"match": match, "user_id": user_id, "limit": limit},
+        )
+        mask = (1 << SEGMENT_BITS) - 1
+        # bm25() is lower-is-better; flip it so both backends rank higher-is-better
+        return [SearchHit(rowid >> SEGMENT_BITS, rowid & mask, start, end, -rank) for rowid, start, end, rank in rows]
+
+
+class PostgresSearchIndex(SearchIndex):
+    DDL = (
+        f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+        "job_id INTEGER NOT NULL, segment INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+        "start_time DOUBLE PRECISION NOT NULL, end_time DOUBLE PRECISION NOT NULL, "
+        "tokens TSVECTOR NOT NULL, PRIMARY KEY (job_id, segment))",
+        f"CREATE INDEX IF NOT EXISTS {TABLE}_tokens_idx ON {TABLE} USING GIN (tokens)",
+    )
+    INSERT = (
+        f"INSERT INTO {TABLE} (job_id, segment, user_id, start_time, end_time, tokens) "
+        "VALUES (:job_id, :segment, :user_id, :start_time, :end_time, to_tsvector('simple', :tokens))"
+    )
+
+    def _delete(self, conn, job_id: int) -> None:
+        conn.execute(text(f"DELETE FROM {TABLE} WHERE job_id = :job_id"), {"job_id": job_id})
+
+    def _search(self, conn, user_id: int, hashed: list, limit: int) -> List[SearchHit]:
+        tsquery = " & ".join("(" + " <-> ".join(phrase) + ")" for phrase in hashed)
+        rows = conn.execute(
+            text(
+                f"SELECT job_id, segment, start_time, end_time, ts_rank(tokens, q) AS rank "
+                f"FROM {TABLE}, to_tsquery('simple', :tsquery) q "
+                "WHERE user_id = :user_id AND tokens @@ q ORDER BY rank DESC LIMIT :limit"
+            ),
+            {"tsquery": tsquery, "user_id": user_id, "limit": limit},
+        )
+        return [SearchHit(*row) for row in rows]
+
+
+class DisabledSearchIndex(SearchIndex):
+    """Stands in on databases without full-text search, so indexing and deleting jobs still work."""
+
+    def index_job(self, job_id: int, user_id: int, segments: SegmentTable) -> int:
+        return 0
+
+    def delete_job(self, job_id: int) -> None:
+        pass
+
+    def search(self, user_id: int, query: str, limit: int = 50) -> List[SearchHit]:
+        return []
+
+
+def create_index(engine: Engine, key: Optional[bytes] = None) -> SearchIndex:
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        return SQLiteSearchIndex(engine, key)
+    if dialect == "postgresql":
+        return PostgresSearchIndex(engine, key)
+    logger.warning(f"Full-text search is not supported on {dialect}; transcripts will not be searchable")
+    return DisabledSearchIndex(engine, key)
+
+
+_index: Optional[SearchIndex] = None
+
+
+def get_index() -> SearchIndex:
+    global _index
+    if _index is None:
+        from .database import engine
+        _index = create_index(engine)
+    return _index
+
+
+def reindex(batch_size: int = 200) -> int:
+    """Rebuild the index from stored transcripts, e.g. after rotating the key."""
+    from .database import SessionLocal
+    from .models import TranscriptionJob
+    from .transcripts import load_transcript
+
+    index = get_index()
+    db = SessionLocal()
+    count = 0
+    try:
+        # IDs first, then small batches, so no read cursor stays open while
+        # the index is written (SQLite would block the writes)
+        job_ids = [job_id for (job_id,) in db.query(TranscriptionJob.id).filter(
+            TranscriptionJob.status == "completed", TranscriptionJob.transcript_encrypted.isnot(None)
+        ).order_by(TranscriptionJob.id)]
+        for i in range(0, len(job_ids), batch_size):
+            batch = db.query(TranscriptionJob.id, TranscriptionJob.user_id, TranscriptionJob.transcript_encrypted).filter(
+                TranscriptionJob.id.in_(job_ids[i:i + batch_size])
+            ).all()
+            db.rollback()
+            for job_id, user_id, stored in batch:
+                try:
+                    index.index_job(job_id, user_id, load_transcript(stored).segments)
+                    count += 1
+                except Exception as e:
+                    logger.error(f"Could not index job {job_id}: {e}")
+    finally:
+        db.close()
+    return count
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Transcript search index tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("reindex", help="rebuild the index from every completed transcript")
+    rebuild.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    count = reindex(args.batch_size)
+    logger.info(f"Indexed {count} transcript(s)")
+
+
+if __name__ == "__main__":
+    main()
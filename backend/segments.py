@@ -0,0 +1,214 @@
+"""
+Columnar container for transcript segments.
+
+A ``SegmentTable`` holds start and end times in ``array('d')``, speakers as
+``uint16`` IDs into a small label list, and all segment text as one UTF-8
+buffer with offsets, instead of one dict (and one speaker string) per
+segment. Tables are immutable; operations that change a column return a
+new table that shares the other columns.
+
+``to_bytes``/``from_bytes`` is the binary form used for storage: a fixed
+header followed by the raw column buffers, so parsing is a handful of
+``array.frombytes`` calls rather than building 100k dicts.
+"""
+
+import struct
+import sys
+from array import array
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+MAGIC = b"SEGT"
+FORMAT_VERSION = 1
+DEFAULT_SPEAKER = "Speaker 1"
+
+_HEADER = struct.Struct("<4sBBII")  # magic, version, flags, segments, speakers
+_HAS_ORIGINAL = 1
+
+
+class SegmentRow(NamedTuple):
+    start: float
+    end: float
+    speaker: str
+    text: str
+
+
+def _encode_texts(texts: Iterable[str]) -> tuple:
+    offsets = array("I", [0])
+    buf = bytearray()
+    for text in texts:
+        buf += (text or "").encode()
+        offsets.append(len(buf))
+    return offsets, bytes(buf)
+
+
+def _le(column: array) -> memoryview:
+    """Column bytes in little-endian order, whatever the host (without a copy on little-endian hosts)."""
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return memoryview(column).cast("B")
+
+
+def _read_column(typecode: str, data: memoryview, pos: int, count: int) -> tuple:
+    column = array(typecode)
+    size = column.itemsize * count
+    column.frombytes(data[pos:pos + size])
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column, pos + size
+
+
+class SegmentTable:
+    __slots__ = ("starts", "ends", "speaker_ids", "speakers", "_offsets", "_text", "_original_offsets", "_original")
+
+    def __init__(
+        self,
+        starts: array,
+        ends: array,
+        speaker_ids: array,
+        speakers: List[str],
+        offsets: array,
+        text: bytes,
+        original_offsets: Optional[array] = None,
+        original: Optional[bytes] = None,
+    ):
+        self.starts = starts
+        self.ends = ends
+        self.speaker_ids = speaker_ids
+        self.speakers = speakers
+        self._offsets = offsets
+        self._text = text
+        self._original_offsets = original_offsets
+        self._original = original
+
+    @classmethod
+    def from_columns(
+        cls,
+        starts: Sequence[float],
+        ends: Sequence[float],
+        speakers: Sequence[str],
+        texts: Sequence[str],
+        originals: Optional[Sequence[str]] = None,
+    ) -> "SegmentTable":
+        """Build a table from parallel columns, interning speaker labels."""
+        labels: dict = {}
+        speaker_ids = array("H", (labels.setdefault(s, len(labels)) for s in speakers))
+        if len(labels) > 0xFFFF:
+            raise ValueError("Too many distinct speakers")
+        offsets, text = _encode_texts(texts)
+        original_offsets, original = _encode_texts(originals) if originals is not None else (None, None)
+        return cls(array("d", starts), array("d", ends), speaker_ids, list(labels), offsets, text, original_offsets, original)
+
+    @classmethod
+    def from_dicts(cls, segments: Sequence[dict]) -> "SegmentTable":
+        """From the ``{"start", "end", "speaker", "text"}`` dicts of older transcripts."""
+        originals = [s.get("original_text", "") for s in segments] if any("original_text" in s for s in segments) else None
+        return cls.from_columns(
+            [s["start"] for s in segments],
+            [s["end"] for s in segments],
+            [s.get("speaker", DEFAULT_SPEAKER) for s in segments],
+            [s.get("text", "") for s in segments],
+            originals,
+        )
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def text(self, i: int) -> str:
+        return self._text[self._offsets[i]:self._offsets[i + 1]].decode()
+
+    def speaker(self, i: int) -> str:
+        return self.speakers[self.speaker_ids[i]]
+
+    def texts(self) -> List[str]:
+        text, offsets = self._text, self._offsets
+        return [text[offsets[i]:offsets[i + 1]].decode() for i in range(len(self))]
+
+    def original_texts(self) -> Optional[List[str]]:
+        if self._original is None:
+            return None
+        text, offsets = self._original, self._original_offsets
+        return [text[offsets[i]:offsets[i + 1]].decode() for i in range(len(self))]
+
+    def __iter__(self) -> Iterator[SegmentRow]:
+        speakers = [self.speakers[i] for i in self.speaker_ids]
+        return map(SegmentRow, self.starts, self.ends, speakers, self.texts())
+
+    def with_texts(self, texts: Sequence[str], keep_original: bool = True) -> "SegmentTable":
+        """Replace the text column (e.g. after translation), keeping the current text as the original."""
+        if len(texts) != len(self):
+            raise ValueError("Expected one text per segment")
+        offsets, text = _encode_texts(texts)
+        if keep_original and self._original is None:
+            original_offsets, original = self._offsets, self._text
+        else:
+            original_offsets, original = self._original_offsets, self._original
+        return SegmentTable(self.starts, self.ends, self.speaker_ids, self.speakers, offsets, text, original_offsets, original)
+
+    def to_dicts(self) -> List[dict]:
+        """The JSON shape of the API: one dict per segment."""
+        return list(self.iter_dicts())
+
+    def iter_dicts(self) -> Iterator[dict]:
+        """``to_dicts`` one segment at a time, for streaming writers."""
+        originals = self.original_texts()
+        for i, (start, end, speaker, text) in enumerate(self):
+            row = {"start": start, "end": end, "speaker": speaker, "text": text}
+            if originals is not None:
+                row["original_text"] = originals[i]
+            yield row
+
+    def to_bytes(self) -> bytes:
+        return b"".join(self.iter_bytes())
+
+    def iter_bytes(self) -> Iterator:
+        """The binary form piece by piece, as views of the columns where possible, for streaming writers."""
+        flags = _HAS_ORIGINAL if self._original is not None else 0
+        labels = "\0".join(self.speakers).encode()
+        yield _HEADER.pack(MAGIC, FORMAT_VERSION, flags, len(self), len(self.speakers))
+        yield _le(self.starts)
+        yield _le(self.ends)
+        yield _le(self.speaker_ids)
+        yield struct.pack("<I", len(labels))
+        yield labels
+        yield _le(self._offsets)
+        yield self._text
+        if flags & _HAS_ORIGINAL:
+            yield _le(self._original_offsets)
+            yield self._original
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SegmentTable":
+        table, _ = cls.read(data)
+        return table
+
+    @classmethod
+    def read(cls, data: bytes, pos: int = 0) -> tuple:
+        """Parse a table at ``pos`` of ``data``; returns it and the position after it."""
+        view = memoryview(data)
+        magic, version, flags, n, n_speakers = _HEADER.unpack_from(view, pos)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Not a segment table")
+        pos += _HEADER.size
+        starts, pos = _read_column("d", view, pos, n)
+        ends, pos = _read_column("d", view, pos, n)
+        speaker_ids, pos = _read_column("H", view, pos, n)
+        (labels_size,) = struct.unpack_from("<I", view, pos)
+        pos += 4
+        labels = bytes(view[pos:pos + labels_size]).decode()
+        speakers = labels.split("\0") if n_speakers else []
+        pos += labels_size
+        offsets, pos = _read_column("I", view, pos, n + 1)
+        text = bytes(view[pos:pos + offsets[-1]])
+        pos += offsets[-1]
+        original_offsets = original = None
+        if flags & _HAS_ORIGINAL:
+            original_offsets, pos = _read_column("I", view, pos, n + 1)
+            original = bytes(view[pos:pos + original_offsets[-1]])
+            pos += original_offsets[-1]
+        return cls(starts, ends, speaker_ids, speakers, offsets, text, original_offsets, original), pos
+
+
+def as_table(segments) -> SegmentTable:
+    """Accept a ``SegmentTable`` or the list-of-dicts form."""
+    return segments if isinstance(segments, SegmentTable) else SegmentTable.from_dicts(segments)
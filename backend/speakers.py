@@ -0,0 +1,24 @@
+from typing import Optional
+
+from .segments import DEFAULT_SPEAKER, SegmentTable
+
+
+def assign_speakers(segments, turns: Optional[list]) -> SegmentTable:
+    """Map transcription segments onto diarization turns, defaulting to a single speaker."""
+    speakers = []
+    for seg in segments:
+        speaker = DEFAULT_SPEAKER
+
+        # Find which speaker turn this transcription segment belongs to
+        for turn_start, turn_end, label in turns or ():
+            if seg.start >= turn_start and seg.end <= turn_end:
+                speaker = label
+                break
+
+        speakers.append(speaker)
+    return SegmentTable.from_columns(
+        [seg.start for seg in segments],
+        [seg.end for seg in segments],
+        speakers,
+        [seg.text for seg in segments],
+    )
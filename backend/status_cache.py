@@ -0,0 +1,147 @@
+"""
+Job status cache in Redis for polling clients.
+
+A job's status changes a handful of times (queued, processing, refining,
+completed or failed, back to queued before a retry) while clients poll it
+every few seconds. Whoever moves a job writes the new status to a small
+per-job Redis hash right after committing it: the API when it queues the
+job, the worker on every transition.
+
+The database stays the source of truth. Entries carry the row's version and
+never replace a newer one, expire after ``STATUS_CACHE_SECONDS``, and a
+missing entry (or an unavailable Redis) falls back to the database, which
+then backfills the cache. A write lost to a Redis error can leave an entry
+behind by one transition until it expires.
+"""
+
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from redis.exceptions import RedisError, WatchError
+
+from .config import settings
+
+logger = logging.getLogger("status_cache")
+
+KEY = "job:{job_id}:status"
+FIELDS = ("user_id", "status", "version", "updated_at")
+
+
+class CachedStatus(NamedTuple):
+    # Named like the model's columns, so http_cache.job_etag accepts it
+    id: int
+    user_id: int
+    status: str
+    version: int
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def of(cls, job) -> "CachedStatus":
+        """Snapshot a job row (after a flush, so ``version`` is the new one)."""
+        return cls(job.id, job.user_id, job.status, job.version, job.updated_at)
+
+
+def _key(job_id: int) -> str:
+    return KEY.format(job_id=job_id)
+
+
+def _mapping(entry: CachedStatus) -> dict:
+    return {
+        "user_id": entry.user_id,
+        "status": entry.status,
+        "version": entry.version,
+        "updated_at": entry.updated_at.isoformat() if entry.updated_at else "",
+    }
+
+
+def publish(redis_conn, entry: CachedStatus) -> None:
+    """Cache a status just committed, unless a newer version is cached already; never raises."""
+    key = _key(entry.id)
+
+    def write(pipe):
+        cached = pipe.hget(key, "version")
+        if cached is not None and int(cached) > entry.version:
+            return
+        pipe.multi()
+        pipe.hset(key, mapping=_mapping(entry))
+        pipe.expire(key, settings.status_cache_seconds)
+
+    try:
+        redis_conn.transaction(write, key)
+    except RedisError as e:
+        logger.warning(f"Could not cache status of job {entry.id}: {e}")
+
+
+def backfill(redis_conn, entries: List[CachedStatus]) -> None:
+    """Cache statuses read from the database for jobs that had no entry.
+
+    Skipped if any of them gained an entry meanwhile: that one came from a
+    writer and may be newer than what was read.
+    """
+    if not entries:
+        return
+    keys = [_key(entry.id) for entry in entries]
+    try:
+        with redis_conn.pipeline() as pipe:
+            pipe.watch(*keys)
+            if pipe.exists(*keys):
+                return
+            pipe.multi()
+            for key, entry in zip(keys, entries):
+                pipe.hset(key, mapping=_mapping(entry))
+                pipe.expire(key, settings.status_cache_seconds)
+            pipe.execute()
+    except WatchError:
+        pass
+    except RedisError as e:
+        logger.warning(f"Could not backfill job statuses: {e}")
+
+
+def queue_read(pipe, job_ids: Iterable[int]) -> Callable[[list], Dict[int, CachedStatus]]:
+    """Queue the reads of ``job_ids`` on ``pipe``; the returned function parses their replies.
+
+    Replies that are errors, or None from a pipeline that failed, count as
+    missing entries.
+    """
+    job_ids = list(job_ids)
+    for job_id in job_ids:
+        pipe.hmget(_key(job_id), *FIELDS)
+
+    def parse(replies: list) -> Dict[int, CachedStatus]:
+        entries = {}
+        for job_id, reply in zip(job_ids, replies):
+            if not isinstance(reply, list):
+                continue
+            user_id, status, version, updated_at = reply
+            if user_id is None or status is None or version is None:
+                continue
+            entries[job_id] = CachedStatus(
+                job_id,
+                int(user_id),
+                status.decode(),
+                int(version),
+                datetime.fromisoformat(updated_at.decode()) if updated_at else None,
+            )
+        return entries
+
+    return parse
+
+
+def read(redis_conn, job_ids: Iterable[int]) -> Dict[int, CachedStatus]:
+    """Cached entries for ``job_ids`` in one round trip; jobs without one (all, if Redis is down) are left out."""
+    pipe = redis_conn.pipeline(transaction=False)
+    parse = queue_read(pipe, job_ids)
+    try:
+        replies = pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Status cache unavailable, reading from the database: {e}")
+        return {}
+    return parse(replies)
+
+
+def forget(redis_conn, job_id: int) -> None:
+    try:
+        redis_conn.delete(_key(job_id))
+    except RedisError as e:
+        logger.warning(f"Could not drop cached status of job {job_id}: {e}")
@@ -0,0 +1,263 @@
+"""
+Encrypted upload store keyed by job ID, plus the retention reaper.
+
+Inputs live at ``uploads/ab/cd/<job_id>.enc``, where ``abcd`` are the first
+hex digits of a hash of the job ID. Keying by job ID means two users can
+upload ``audio.mp3`` without clobbering each other, and the two-level
+fan-out keeps every directory small however many uploads accumulate.
+
+An input is either one Fernet token (``POST /jobs/upload``) or, for chunked
+uploads, ``CHUNKED_MAGIC`` followed by length-prefixed tokens, one per
+chunk, so neither side ever holds the whole file. Chunks of unfinished
+upload sessions wait under ``uploads/sessions/<upload_id>/``.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, NamedTuple
+
+from prometheus_client import Counter, Gauge
+
+from .config import settings
+from .database import SessionLocal
+from .models import TranscriptionJob
+from .utils import decrypt_bytes
+
+logger = logging.getLogger("storage")
+
+REAPER_LOCK_KEY = "storage:reaper"
+SESSIONS_DIR = "sessions"
+
+# Cannot start a Fernet token, which is URL-safe base64
+CHUNKED_MAGIC = b"\x00SCI1"
+_TOKEN_LENGTH = struct.Struct(">I")
+
+STORE_BYTES = Gauge("upload_store_bytes", "Bytes held in the upload store", multiprocess_mode="livemax")
+STORE_FILES = Gauge("upload_store_files", "Files held in the upload store", multiprocess_mode="livemax")
+REAPED_FILES = Counter("upload_store_reaped_files_total", "Inputs deleted by the reaper", ["reason"])
+REAPED_BYTES = Counter("upload_store_reaped_bytes_total", "Bytes deleted by the reaper")
+
+
+class StoredInput(NamedTuple):
+    job_id: int
+    path: str
+    size: int
+    mtime: float
+
+
+def input_path(job_id: int) -> str:
+    digest = hashlib.sha1(str(job_id).encode()).hexdigest()
+    return os.path.join(settings.upload_dir, digest[:2], digest[2:4], f"{job_id}.enc")
+
+
+def checkpoint_path(job_id: int) -> str:
+    """Where a partly transcribed job keeps its progress (see checkpoint.py)."""
+    return input_path(job_id)[:-len(".enc")] + ".ckpt"
+
+
+def save_input(job_id: int, encrypted: bytes) -> str:
+    """Write an encrypted input atomically and return its path."""
+    path = input_path(job_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(encrypted)
+    os.replace(tmp_path, path)
+    return path
+
+
+def save_chunked_input(job_id: int, token_paths: Iterable[str]) -> str:
+    """Concatenate encrypted chunk files, in order, into a job's input and return its path.
+
+    The tokens are copied as they are, so nothing is decrypted or held in memory.
+    """
+    path = input_path(job_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".part"
+    with open(tmp_path, "wb") as out:
+        out.write(CHUNKED_MAGIC)
+        for token_path in token_paths:
+            out.write(_TOKEN_LENGTH.pack(os.path.getsize(token_path)))
+            with open(token_path, "rb") as f:
+                shutil.copyfileobj(f, out, 1024 * 1024)
+    os.replace(tmp_path, path)
+    return path
+
+
+def iter_input(path: str) -> Iterator[bytes]:
+    """The decrypted contents of a stored input, one chunk at a time."""
+    with open(path, "rb") as f:
+        if f.read(len(CHUNKED_MAGIC)) != CHUNKED_MAGIC:
+            f.seek(0)
+            yield decrypt_bytes(f.read())
+            return
+        while True:
+            header = f.read(_TOKEN_LENGTH.size)
+            if not header:
+                return
+            (size,) = _TOKEN_LENGTH.unpack(header)
+            yield decrypt_bytes(f.read(size))
+
+
+def session_dir(upload_id: str) -> str:
+    return os.path.join(settings.upload_dir, SESSIONS_DIR, upload_id)
+
+
+def delete_input(job_id: int) -> bool:
+    """Delete a job's input and any checkpoint made from it."""
+    try:
+        os.remove(checkpoint_path(job_id))
+    except FileNotFoundError:
+        pass
+    try:
+        os.remove(input_path(job_id))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def iter_inputs() -> Iterator[StoredInput]:
+    """Walk the sharded store lazily, one directory at a time."""
+    if not os.path.isdir(settings.upload_dir):
+        return
+    for level1 in os.scandir(settings.upload_dir):
+        if not (level1.is_dir() and len(level1.name) == 2):
+            continue
+        for level2 in os.scandir(level1.path):
+            if not level2.is_dir():
+                continue
+            for entry in os.scandir(level2.path):
+                name, ext = os.path.splitext(entry.name)
+                if ext != ".enc" or not name.isdigit():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield StoredInput(int(name), entry.path, stat.st_size, stat.st_mtime)
+
+
+class Reaper:
+    """Deletes inputs that are no longer needed, in batches under an I/O budget.
+
+    Inputs of completed jobs and of deleted jobs go right away. Anything
+    else (failed, stuck) is kept for the retention window so it can still
+    be retried, then removed. An input without a job is left alone for a
+    grace period after it was last written, since a new job's input is
+    stored before its row is committed.
+    """
+
+    def __init__(
+        self,
+        retention: timedelta = timedelta(hours=settings.upload_retention_hours),
+        batch_size: int = settings.reaper_batch_size,
+        max_bytes_per_second: int = settings.reaper_max_bytes_per_second,
+        orphan_grace_seconds: float = settings.reaper_orphan_grace_seconds,
+    ):
+        self.retention = retention
+        self.batch_size = batch_size
+        self.max_bytes_per_second = max_bytes_per_second
+        self.orphan_grace_seconds = orphan_grace_seconds
+
+    def run_once(self) -> dict:
+        """One full pass over the store; also refreshes the disk-usage gauges."""
+        stats = {"files": 0, "bytes": 0, "reaped_files": 0, "reaped_bytes": 0}
+        batch = []
+        for stored in iter_inputs():
+            stats["files"] += 1
+            stats["bytes"] += stored.size
+            batch.append(stored)
+            if len(batch) >= self.batch_size:
+                self._reap_batch(batch, stats)
+                batch = []
+        if batch:
+            self._reap_batch(batch, stats)
+        stats["reaped_sessions"] = self._reap_sessions()
+
+        STORE_FILES.set(stats["files"] - stats["reaped_files"])
+        STORE_BYTES.set(stats["bytes"] - stats["reaped_bytes"])
+        logger.info(f"Reaper pass: {stats}")
+        return stats
+
+    def _reap_sessions(self) -> int:
+        """Remove chunks of upload sessions abandoned for longer than a session lives."""
+        root = os.path.join(settings.upload_dir, SESSIONS_DIR)
+        if not os.path.isdir(root):
+            return 0
+        expired_before = time.time() - settings.upload_session_hours * 3600
+        reaped = 0
+        for entry in os.scandir(root):
+            try:
+                if entry.is_dir() and entry.stat().st_mtime < expired_before:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    reaped += 1
+            except FileNotFoundError:
+                continue
+        return reaped
+
+    def _reap_batch(self, batch: list, stats: dict) -> None:
+        db = SessionLocal()
+        try:
+            rows = db.query(TranscriptionJob.id, TranscriptionJob.status).filter(
+                TranscriptionJob.id.in_([s.job_id for s in batch])
+            ).all()
+        finally:
+            db.close()
+        statuses = dict(rows)
+        expired_before = (datetime.utcnow() - self.retention).timestamp()
+        orphaned_before = time.time() - self.orphan_grace_seconds
+
+        for stored in batch:
+            status = statuses.get(stored.job_id)
+            if status is None:
+                if stored.mtime >= orphaned_before:
+                    # Possibly a job still being created
+                    continue
+                reason = "orphaned"
+            elif status == "completed":
+                reason = "completed"
+            elif stored.mtime < expired_before:
+                reason = "expired"
+            else:
+                continue
+
+            start = time.monotonic()
+            if not delete_input(stored.job_id):
+                continue
+            REAPED_FILES.labels(reason).inc()
+            REAPED_BYTES.inc(stored.size)
+            stats["reaped_files"] += 1
+            stats["reaped_bytes"] += stored.size
+
+            # Stay under the I/O budget so reaping never competes with live jobs
+            if self.max_bytes_per_second > 0:
+                budget = stored.size / self.max_bytes_per_second
+                time.sleep(max(0.0, budget - (time.monotonic() - start)))
+
+
+def start_reaper(redis_conn, interval: float = settings.reaper_interval_seconds) -> threading.Thread:
+    """Run the reaper periodically in a daemon thread.
+
+    Every worker process starts one, but a Redis lock lets only one of
+    them do a pass per interval.
+    """
+    reaper = Reaper()
+
+    def loop():
+        while True:
+            try:
+                if redis_conn.set(REAPER_LOCK_KEY, os.getpid(), nx=True, ex=int(interval)):
+                    reaper.run_once()
+            except Exception as e:
+                logger.error(f"Reaper pass failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="upload-reaper", daemon=True)
+    thread.start()
+    return thread
@@ -1,38 +1,36 @@
-import json
 import os
 import logging
-from typing import Optional
-from redis import Redis
-from rq import Queue
-from faster_whisper import WhisperModel
-import torch
-from googletrans import Translator, LANGUAGES
-from pydub import AudioSegment, effects
+from typing import TYPE_CHECKING, Optional
+from rq import get_current_job
+import numpy as np
 
-# Optional speaker diarization
-try:
-    from pyannote.audio import Pipeline
-    diarization_pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization")
-    SPEAKER_RECOGNITION_AVAILABLE = True
-except Exception as e:
-    logging.warning(f"Speaker recognition not available: {e}")
-    diarization_pipeline = None
-    SPEAKER_RECOGNITION_AVAILABLE = False
+# The ML stack (torch, faster_whisper, pyannote, googletrans) is imported
+# lazily so only processes that actually run jobs pay for it. Workers call
+# warm_up() before their first job, and jobs run in the worker process.
+if TYPE_CHECKING:
+    from faster_whisper import WhisperModel
 
 from .config import settings
 from .database import SessionLocal
 from .models import TranscriptionJob
-from .utils import encrypt, decrypt_bytes
+from .storage import iter_input
+from .audio import SAMPLE_RATE, decode_pcm, restore_pcm
+from .pipeline import run_concurrently
+from .speakers import assign_speakers
+from .segments import SegmentTable
+from .metrics import JobTrace, push_trace
+from .cascade import CASCADE_DRAFT_MODE, CASCADE_REFINE_MODE, plan_regions, refined_fraction, splice
+from .checkpoint import Checkpoint
+from .producer import redis_conn
+from .status_cache import CachedStatus, publish as publish_status
+from .transcripts import pack_transcript
+from .search import get_index
+from .routing import required_modes, tier_of
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("transcription")
 
-# Redis connection and queues
-redis_conn = Redis.from_url(settings.redis_url)
-paid_q = Queue("paid", connection=redis_conn)
-free_q = Queue("free", connection=redis_conn)
-
 # Model configurations for different processing modes
 MODEL_SIZES = {
     "cheetah": "tiny",      # Fastest, ~95% accuracy
@@ -40,80 +38,194 @@ MODEL_SIZES = {
     "whale": "large"        # Most accurate, ~99.8% accuracy
 }
 
-# Initialize translator
-translator = Translator()
+# CPU compute type per mode; the worker supervisor overrides these from the
+# autotuned CPU profile (see autotune.py)
+CPU_COMPUTE_TYPES = {mode: "int8" for mode in MODEL_SIZES}
 
 # Model cache to avoid reloading
-MODEL_CACHE: dict[str, WhisperModel] = {}
+MODEL_CACHE: dict[str, "WhisperModel"] = {}
+
+_translator = None
+_diarization_pipeline = None
+_diarization_checked = False
+
+def get_translator():
+    global _translator
+    if _translator is None:
+        from googletrans import Translator
+        _translator = Translator()
+    return _translator
+
+def get_diarization_pipeline():
+    """Load the optional pyannote pipeline once; None if it is not available."""
+    global _diarization_pipeline, _diarization_checked
+    if not _diarization_checked:
+        _diarization_checked = True
+        try:
+            from pyannote.audio import Pipeline
+            _diarization_pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization")
+        except Exception as e:
+            logger.warning(f"Speaker recognition not available: {e}")
+    return _diarization_pipeline
+
+def speaker_recognition_available() -> bool:
+    return get_diarization_pipeline() is not None
 
-def get_model(mode: str) -> WhisperModel:
+def get_model(mode: str) -> "WhisperModel":
     """Lazily load Whisper models on first use and reuse them across jobs."""
+    import torch
+    from faster_whisper import WhisperModel
+    
     size = MODEL_SIZES.get(mode.lower(), "base")
     
     if size not in MODEL_CACHE:
-        logger.info(f"Loading Whisper model: {size}")
+        cuda = torch.cuda.is_available()
+        compute_type = "float16" if cuda else CPU_COMPUTE_TYPES.get(mode.lower(), "int8")
+        logger.info(f"Loading Whisper model: {size} ({compute_type}, {settings.whisper_cpu_threads or 'default'} threads)")
         MODEL_CACHE[size] = WhisperModel(
             size,
-            device="cuda" if torch.cuda.is_available() else "cpu",
-            compute_type="float16" if torch.cuda.is_available() else "int8",
+            device="cuda" if cuda else "cpu",
+            compute_type=compute_type,
+            cpu_threads=settings.whisper_cpu_threads,
         )
         logger.info(f"Model {size} loaded successfully")
     
     return MODEL_CACHE[size]
 
-def restore_audio(file_path: str) -> str:
-    """Apply audio restoration to improve transcription quality."""
-    try:
-        audio = AudioSegment.from_file(file_path)
-        # Normalize audio levels
-        normalized = effects.normalize(audio)
-        
-        # Apply additional restoration if needed
-        # You can add more audio processing here (noise reduction, etc.)
-        
-        restored_path = file_path + ".restored.wav"
-        normalized.export(restored_path, format="wav")
-        logger.info(f"Audio restored and saved to: {restored_path}")
-        return restored_path
-    except Exception as e:
-        logger.error(f"Audio restoration failed: {e}")
-        return file_path
+def warm_up(modes=()) -> None:
+    """Import the ML stack and load models up front (called by workers before their first job)."""
+    import torch  # noqa: F401
+    import faster_whisper  # noqa: F401
+    
+    get_diarization_pipeline()
+    for mode in modes:
+        get_model(mode)
+
+def keep_models(modes) -> None:
+    """Hold exactly the models ``modes`` need in this process, the worker that runs the jobs."""
+    needed = [model for mode in modes for model in required_modes(mode)]
+    sizes = {MODEL_SIZES[mode] for mode in needed}
+    for size in [size for size in MODEL_CACHE if size not in sizes]:
+        logger.info(f"Unloading Whisper model: {size}")
+        del MODEL_CACHE[size]
+    for mode in needed:
+        get_model(mode)
+
+def diarize(pcm: np.ndarray) -> list:
+    """Run speaker diarization over decoded PCM and return (start, end, speaker) turns."""
+    import torch
+    
+    if settings.diarization_cpu_threads > 0:
+        torch.set_num_threads(settings.diarization_cpu_threads)
+    
+    # Feed the already-decoded buffer so pyannote does not decode the file again
+    waveform = torch.from_numpy(pcm).unsqueeze(0)
+    diarization = get_diarization_pipeline()({"waveform": waveform, "sample_rate": SAMPLE_RATE})
+    return [
+        (turn.start, turn.end, f"Speaker {label}")
+        for turn, _, label in diarization.itertracks(yield_label=True)
+    ]
 
-def recognize_speakers(audio_path: str, segments) -> list:
+def recognize_speakers(pcm: np.ndarray, segments) -> SegmentTable:
     """Apply speaker diarization to identify different speakers."""
-    if not SPEAKER_RECOGNITION_AVAILABLE:
+    if not speaker_recognition_available():
         logger.warning("Speaker recognition not available")
-        return [{"start": seg.start, "end": seg.end, "speaker": "Speaker 1", "text": seg.text} for seg in segments]
+        return assign_speakers(segments, None)
     
     try:
         logger.info("Starting speaker recognition...")
-        diarization = diarization_pipeline(audio_path)
-        
-        # Map segments to speakers
-        result_segments = []
-        for seg in segments:
-            speaker = "Speaker 1"  # Default speaker
-            
-            # Find which speaker segment this transcription segment belongs to
-            for turn, _, label in diarization.itertracks(yield_label=True):
-                if seg.start >= turn.start and seg.end <= turn.end:
-                    speaker = f"Speaker {label}"
-                    break
-            
-            result_segments.append({
-                "start": seg.start,
-                "end": seg.end,
-                "speaker": speaker,
-                "text": seg.text
-            })
-        
+        result_segments = assign_speakers(segments, diarize(pcm))
         logger.info(f"Speaker recognition completed for {len(result_segments)} segments")
         return result_segments
         
     except Exception as e:
         logger.error(f"Speaker recognition failed: {e}")
         # Fallback to single speaker
-        return [{"start": seg.start, "end": seg.end, "speaker": "Speaker 1", "text": seg.text} for seg in segments]
+        return assign_speakers(segments, None)
+
+def refine_segments(pcm: np.ndarray, segments: list, language: Optional[str], task: str) -> list:
+    """Re-decode low-confidence draft regions with the large model (cascade mode)."""
+    regions = plan_regions(
+        segments,
+        settings.cascade_logprob_threshold,
+        settings.cascade_no_speech_threshold,
+    )
+    if not regions:
+        logger.info("Cascade draft is confident everywhere, nothing to refine")
+        return segments
+    
+    logger.info(
+        f"Refining {len(regions)} region(s), {refined_fraction(segments, regions):.1%} of the draft, "
+        f"with Whisper model: {MODEL_SIZES[CASCADE_REFINE_MODE]}"
+    )
+    model = get_model(CASCADE_REFINE_MODE)
+    
+    def decode_region(start: float, end: float):
+        refined, _ = model.transcribe(
+            pcm[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)],
+            language=language,
+            task=task,
+            beam_size=5,
+            best_of=5,
+        )
+        return refined
+    
+    return splice(segments, regions, decode_region)
+
+def commit_status(db, job: TranscriptionJob) -> None:
+    """Commit the job's new status, then publish it to the status cache pollers read."""
+    db.flush()
+    entry = CachedStatus.of(job)
+    db.commit()
+    publish_status(redis_conn, entry)
+
+def model_summary(model_size: str, info, language: Optional[str]) -> dict:
+    """The JSON-serializable part of a run's ``TranscriptionInfo`` kept in the transcript metadata
+    
+    ``info`` is None when a retry resumed from a finished draft; the
+    language then comes from the checkpoint.
+    """
+    return {
+        "model": model_size,
+        "language": info.language if info is not None else language,
+        "language_probability": info.language_probability if info is not None else None,
+    }
+
+def save_transcript(db, job: TranscriptionJob, segments: SegmentTable, metadata: dict, status: str, trace: JobTrace) -> None:
+    """Serialize, compress and encrypt the transcript, store it on the job and move the job to ``status``."""
+    with trace.stage("encryption"):
+        # Compressed and encrypted piece by piece (see transcripts.TranscriptWriter)
+        encrypted_transcript = pack_transcript(segments, {**metadata, **trace.summary()})
+    
+    with trace.stage("db_commit"):
+        job.status = status
+        job.transcript_encrypted = encrypted_transcript
+        commit_status(db, job)
+
+def set_job_status(job_id: int, status: str) -> None:
+    db = SessionLocal()
+    try:
+        job = db.query(TranscriptionJob).get(job_id)
+        if job:
+            job.status = status
+            commit_status(db, job)
+    except Exception as e:
+        logger.error(f"Failed to update job status: {e}")
+    finally:
+        db.close()
+
+def on_job_failure(rq_job, connection, exc_type, exc_value, tb) -> None:
+    """rq failure callback, also run for jobs abandoned by a worker that died.
+    
+    Jobs with retries left go back to ``queued``; the retry resumes from the
+    job's checkpoint.
+    """
+    job_id = rq_job.args[0]
+    if rq_job.retries_left:
+        logger.info(f"Job {job_id} will be retried ({rq_job.retries_left} attempt(s) left)")
+        set_job_status(job_id, "queued")
+    else:
+        set_job_status(job_id, "failed")
 
 def transcribe_job(
     job_id: int,
@@ -130,13 +242,17 @@ def transcribe_job(
     Args:
         job_id: Database ID of the transcription job
         encrypted_file_path: Path to the encrypted audio/video file
-        mode: Processing mode (cheetah/dolphin/whale)
+        mode: Processing mode (cheetah/dolphin/whale/cascade)
         language: Source language for transcription
         target_language: Target language for translation
         restore_audio: Whether to apply audio restoration
         speaker_recognition: Whether to identify different speakers
     """
     logger.info(f"Starting transcription job {job_id} with mode: {mode}")
+    trace = JobTrace(job_id, mode)
+    rq_job = get_current_job()
+    if rq_job is not None:
+        trace.set_queue_wait(tier_of(rq_job.origin), rq_job.enqueued_at)
     
     try:
         # Get database session
@@ -149,117 +265,171 @@ def transcribe_job(
         
         # Update job status
         job.status = "processing"
-        db.commit()
+        commit_status(db, job)
         
         # Decrypt the file
         logger.info(f"Decrypting file: {encrypted_file_path}")
-        with open(encrypted_file_path, "rb") as f:
-            encrypted_data = f.read()
+        with trace.stage("decrypt"):
+            # Create temporary file for processing, decrypting chunk by chunk
+            temp_path = encrypted_file_path.replace(".enc", ".temp")
+            with open(temp_path, "wb") as f:
+                for block in iter_input(encrypted_file_path):
+                    f.write(block)
         
-        decrypted_data = decrypt_bytes(encrypted_data)
-        
-        # Create temporary file for processing
-        temp_path = encrypted_file_path.replace(".enc", ".temp")
-        with open(temp_path, "wb") as f:
-            f.write(decrypted_data)
+        # Decode once to 16 kHz mono PCM. Whisper and the diarization
+        # pipeline both consume this buffer instead of decoding the file again.
+        pcm_path = temp_path + ".pcm"
+        with trace.stage("decode"):
+            pcm = decode_pcm(temp_path, pcm_path, settings.pcm_mmap_min_seconds)
+        trace.audio_seconds = len(pcm) / SAMPLE_RATE
         
         # Apply audio restoration if requested
         if restore_audio:
             logger.info("Applying audio restoration...")
-            processed_path = restore_audio(temp_path)
-        else:
-            processed_path = temp_path
+            try:
+                with trace.stage("restore"):
+                    restore_pcm(pcm)
+            except Exception as e:
+                logger.error(f"Audio restoration failed: {e}")
         
-        # Get the appropriate Whisper model
-        model = get_model(mode)
-        logger.info(f"Using Whisper model: {MODEL_SIZES[mode]}")
+        # Get the appropriate Whisper model. Cascade jobs draft with the fast model.
+        cascade = mode == "cascade"
+        draft_mode = CASCADE_DRAFT_MODE if cascade else mode
+        with trace.stage("model_load"):
+            model = get_model(draft_mode)
+        logger.info(f"Using Whisper model: {MODEL_SIZES[draft_mode]}")
         
         # Determine task type
         task = "translate" if target_language else "transcribe"
         logger.info(f"Task: {task}")
         
-        # Perform transcription
-        logger.info("Starting transcription...")
-        segments, info = model.transcribe(
-            processed_path,
-            language=language,
-            task=task,
-            beam_size=5 if mode == "whale" else 1,  # Higher beam size for accuracy
-            best_of=5 if mode == "whale" else 1     # Higher best_of for accuracy
-        )
+        # Pick up where an earlier attempt of this job stopped
+        checkpoint = Checkpoint.load(job_id, {
+            "mode": mode,
+            "task": task,
+            "language": language,
+            "restore_audio": restore_audio,
+        })
+        if checkpoint.resumed:
+            logger.info(
+                f"Resuming job {job_id} from checkpoint at {checkpoint.offset:.1f}s "
+                f"({len(checkpoint.segments)} segments, draft complete: {checkpoint.complete}, "
+                f"turns saved: {checkpoint.turns is not None})"
+            )
         
-        # Convert segments to list for processing
-        segments_list = list(segments)
-        logger.info(f"Transcription completed. {len(segments_list)} segments generated.")
+        def run_transcription():
+            if checkpoint.complete:
+                return list(checkpoint.segments), None
+            offset = checkpoint.offset
+            segments, info = model.transcribe(
+                pcm[int(offset * SAMPLE_RATE):],
+                # A resumed run keeps the language detected on the first attempt
+                language=language or checkpoint.language,
+                task=task,
+                beam_size=5 if draft_mode == "whale" else 1,  # Higher beam size for accuracy
+                best_of=5 if draft_mode == "whale" else 1     # Higher best_of for accuracy
+            )
+            checkpoint.language = info.language
+            # Consuming the generator is what actually runs inference
+            checkpoint.consume(segments, offset)
+            return list(checkpoint.segments), info
         
-        # Apply speaker recognition if requested
+        def run_diarization():
+            if checkpoint.turns is None:
+                checkpoint.set_turns(diarize(pcm))
+            return checkpoint.turns
+        
+        # Transcription and diarization only meet at the final merge, so run
+        # them side by side and wait for the longer of the two.
+        stages = {"transcribe": trace.timed("inference", run_transcription)}
         if speaker_recognition:
-            logger.info("Applying speaker recognition...")
-            result_segments = recognize_speakers(processed_path, segments_list)
-        else:
-            result_segments = [
-                {"start": seg.start, "end": seg.end, "speaker": "Speaker 1", "text": seg.text}
-                for seg in segments_list
-            ]
+            if speaker_recognition_available():
+                stages["diarize"] = trace.timed("diarization", run_diarization)
+            else:
+                logger.warning("Speaker recognition not available")
+        
+        logger.info(f"Starting stages: {', '.join(stages)}")
+        results = run_concurrently(stages)
+        
+        if not results["transcribe"].ok:
+            raise results["transcribe"].error
+        segments_list, info = results["transcribe"].value
+        logger.info(f"Transcription completed. {len(segments_list)} segments generated.")
+        
+        turns = None
+        if "diarize" in results:
+            if results["diarize"].ok:
+                turns = results["diarize"].value
+            else:
+                # Fallback to single speaker
+                logger.error(f"Speaker recognition failed: {results['diarize'].error}")
+        result_segments = assign_speakers(segments_list, turns)
+        
+        metadata = {
+            "mode": mode,
+            "language": language,
+            "target_language": target_language,
+            "restore_audio": restore_audio,
+            "speaker_recognition": speaker_recognition,
+            "model_info": model_summary(MODEL_SIZES[draft_mode], info, checkpoint.language),
+        }
+        
+        if cascade:
+            # Publish the draft straight away, then re-decode only the
+            # low-confidence regions with the large model and splice them in.
+            save_transcript(db, job, result_segments, {**metadata, "draft": True}, "refining", trace)
+            with trace.stage("refinement"):
+                segments_list = refine_segments(pcm, segments_list, checkpoint.language, task)
+            result_segments = assign_speakers(segments_list, turns)
         
         # Apply translation if target language specified
         if target_language:
             logger.info(f"Translating to {target_language}...")
             try:
-                for seg in result_segments:
-                    translated = translator.translate(seg["text"], dest=target_language.lower())
-                    seg["text"] = translated.text
-                    seg["original_text"] = seg["text"]  # Keep original for reference
+                with trace.stage("translation"):
+                    translator = get_translator()
+                    translated = [
+                        translator.translate(text, dest=target_language.lower()).text
+                        for text in result_segments.texts()
+                    ]
+                    # The source text is kept as original_text for reference
+                    result_segments = result_segments.with_texts(translated)
                 logger.info("Translation completed")
             except Exception as e:
                 logger.error(f"Translation failed: {e}")
                 # Continue with original text if translation fails
         
-        # Create final transcript
-        transcript_data = {
-            "segments": result_segments,
-            "metadata": {
-                "mode": mode,
-                "language": language,
-                "target_language": target_language,
-                "restore_audio": restore_audio,
-                "speaker_recognition": speaker_recognition,
-                "model_info": info,
-                "processing_time": None  # Could add timing info here
-            }
-        }
-        
-        # Encrypt and save transcript
-        transcript_json = json.dumps(transcript_data, ensure_ascii=False)
-        encrypted_transcript = encrypt(transcript_json)
+        save_transcript(db, job, result_segments, metadata, "completed", trace)
+        checkpoint.clear()
         
-        # Update job in database
-        job.status = "completed"
-        job.transcript_encrypted = encrypted_transcript
-        db.commit()
+        # Search only sees finished transcripts; failing to index must not fail the job
+        try:
+            with trace.stage("indexing"):
+                get_index().index_job(job.id, job.user_id, result_segments)
+        except Exception as e:
+            logger.error(f"Search indexing failed for job {job_id}: {e}")
         
-        logger.info(f"Job {job_id} completed successfully")
+        push_trace(redis_conn, trace.finish("completed"))
+        logger.info(f"Job {job_id} completed successfully in {trace.elapsed:.1f}s")
         
     except Exception as e:
         logger.error(f"Error processing job {job_id}: {e}")
+        push_trace(redis_conn, trace.finish("failed"))
         
-        # Update job status to failed
-        try:
-            if 'db' in locals() and db:
-                job = db.query(TranscriptionJob).get(job_id)
-                if job:
-                    job.status = "failed"
-                    db.commit()
-        except Exception as db_error:
-            logger.error(f"Failed to update job status: {db_error}")
+        # Under rq, on_job_failure sets the status once rq knows whether it will retry
+        if rq_job is not None:
+            raise
+        set_job_status(job_id, "failed")
     
     finally:
         # Cleanup temporary files
         try:
             if 'temp_path' in locals() and os.path.exists(temp_path):
                 os.remove(temp_path)
-            if 'processed_path' in locals() and processed_path != temp_path and os.path.exists(processed_path):
-                os.remove(processed_path)
+            if 'pcm' in locals():
+                del pcm
+            if 'pcm_path' in locals() and os.path.exists(pcm_path):
+                os.remove(pcm_path)
         except Exception as cleanup_error:
             logger.error(f"Cleanup failed: {cleanup_error}")
         
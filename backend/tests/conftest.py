@@ -0,0 +1,82 @@
+"""
+Shared fixtures for the backend tests.
+
+Settings are read from the environment when ``backend`` is first imported,
+so they are pointed at a throwaway SQLite database and upload store before
+that happens. Redis is one in-memory fakeredis, installed as the producer's
+connection before any module imports it and flushed for every test.
+"""
+
+import os
+import tempfile
+
+from cryptography.fernet import Fernet
+
+WORKDIR = tempfile.mkdtemp(prefix="transcribeai-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(WORKDIR, 'test.db')}",
+    "UPLOAD_DIR": os.path.join(WORKDIR, "uploads"),
+    "FERNET_KEY": Fernet.generate_key().decode(),
+    # Nothing connects to this; the producer's connection is replaced below
+    "REDIS_URL": "redis://127.0.0.1:1/0",
+    # Not served from tests
+    "API_METRICS_PORT": "0",
+})
+os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+import fakeredis
+import pytest
+
+from backend import auth, models, producer
+from backend.database import Base, SessionLocal, engine
+
+REDIS = fakeredis.FakeRedis()
+producer.redis_conn = REDIS
+
+
+@pytest.fixture
+def redis_conn():
+    REDIS.flushall()
+    return REDIS
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    yield session
+    session.close()
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+
+
+@pytest.fixture
+def lua():
+    """Skip tests that run the rate limiter's Lua script without fakeredis[lua]."""
+    pytest.importorskip("lupa", reason="the rate limiter's Lua script needs fakeredis[lua]")
+
+
+@pytest.fixture
+def client(redis_conn, db, lua):
+    """The API over HTTPS (it redirects plain HTTP)."""
+    # The rate limiter runs its GCRA script on every limited route
+    from fastapi.testclient import TestClient
+    from backend import main
+
+    with TestClient(main.app, base_url="https://testserver") as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def user(db):
+    account = models.User(email="user@example.com", hashed_password="x")
+    db.add(account)
+    db.commit()
+    db.refresh(account)
+    return account
+
+
+@pytest.fixture
+def auth_headers(user):
+    return {"Authorization": f"Bearer {auth.create_access_token({'sub': user.email})}"}
@@ -0,0 +1,17 @@
+import pytest
+
+from backend import autotune
+
+
+def test_tune_refuses_layouts_not_measured_for_every_mode(monkeypatch):
+    def measure(mode, compute_type, slots, clip, repeat, timeout):
+        if mode == "whale":
+            raise RuntimeError(f"{mode}/{compute_type} with {len(slots)} process(es) failed: no result after {timeout:.0f}s")
+        return {"throughput": 10.0 * len(slots), "latency_seconds": 1.0}
+
+    monkeypatch.setattr(autotune, "measure", measure)
+    with pytest.raises(RuntimeError, match="No layout could be measured for every mode"):
+        autotune.tune(["cheetah", "whale"], ["int8"], clip=None, repeat=1)
+
+    profile = autotune.tune(["cheetah"], ["int8"], clip=None, repeat=1)
+    assert profile["modes"]["cheetah"]["compute_type"] == "int8"
@@ -0,0 +1,57 @@
+import pytest
+
+from backend.cascade import Segment, plan_regions, refined_fraction, splice
+
+LOW = -2.0
+
+
+def draft(*spans) -> list:
+    """Segments from (start, end, flagged) spans."""
+    return [Segment(start, end, f"s{i}", LOW if flagged else 0.0) for i, (start, end, flagged) in enumerate(spans)]
+
+
+def plan(segments: list) -> list:
+    return plan_regions(segments, logprob_threshold=-1.0, no_speech_threshold=0.6)
+
+
+def test_padding_stops_at_kept_neighbours():
+    segments = draft((0.0, 2.0, False), (2.2, 4.0, True), (4.1, 6.0, False))
+    (region,) = plan(segments)
+    assert (region.start, region.end) == (2.0, 4.1)
+
+    segments = draft((0.0, 2.0, False), (3.0, 4.0, True), (6.0, 8.0, False))
+    (region,) = plan(segments)
+    assert (region.start, region.end) == (2.5, 4.5)
+
+
+def test_overlapping_draft_segments_keep_the_replaced_audio():
+    segments = draft((0.0, 2.5, False), (2.2, 4.0, True), (3.8, 6.0, False))
+    (region,) = plan(segments)
+    assert (region.start, region.end) == (2.2, 4.0)
+
+
+def test_merged_regions_cover_the_kept_segments_between_them():
+    segments = draft((0.0, 1.0, True), (1.2, 1.5, False), (2.0, 3.0, True), (3.1, 5.0, False))
+    (region,) = plan(segments)
+    assert (region.first, region.last, region.start, region.end) == (0, 2, 0.0, 3.1)
+
+
+def test_spliced_segments_stay_between_their_neighbours():
+    segments = draft((0.0, 2.0, False), (2.2, 4.0, True), (4.1, 6.0, False))
+    regions = plan(segments)
+
+    def decode(start, end):
+        # The model runs past the end of the clip and hallucinates a trailing segment
+        return [Segment(0.1, 1.2, "refined"), Segment(1.2, end - start + 0.3, "tail"), Segment(end - start + 0.5, end - start + 1.0, "ghost")]
+
+    result = splice(segments, regions, decode)
+    assert [s.text for s in result] == ["s0", "refined", "tail", "s2"]
+    assert all(a.end <= b.start + 1e-9 for a, b in zip(result, result[1:]))
+
+
+def test_refined_fraction_counts_refined_speech_only():
+    # Short flagged segments far apart: the padded region is mostly silence
+    segments = draft((0.0, 0.5, True), (5.0, 5.5, False), (9.0, 9.5, True))
+    regions = plan_regions(segments, logprob_threshold=-1.0, no_speech_threshold=0.6, merge_gap=10.0)
+    assert refined_fraction(segments, regions) == 1.0
+    assert refined_fraction(segments, plan(segments)) == pytest.approx(2 / 3)
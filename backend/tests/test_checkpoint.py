@@ -0,0 +1,84 @@
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from backend import checkpoint as checkpoint_module
+from backend.checkpoint import Checkpoint
+from backend.storage import checkpoint_path
+
+KEY = {"mode": "dolphin", "task": "transcribe", "language": None, "restore_audio": False}
+
+
+@pytest.fixture
+def job_id():
+    os.makedirs(os.path.dirname(checkpoint_path(7)), exist_ok=True)
+    yield 7
+    Checkpoint(7, KEY).clear()
+
+
+def model_output(*spans):
+    """Segments as the model yields them, in seconds from where decoding started."""
+    return [SimpleNamespace(start=start, end=end, text=f"{start}-{end}", avg_logprob=-0.1, no_speech_prob=0.0) for start, end in spans]
+
+
+def interrupted(segments):
+    """Model output cut short by the job timeout."""
+    yield from segments
+    raise TimeoutError
+
+
+def test_retry_resumes_from_the_saved_offset_in_absolute_time(job_id):
+    first = Checkpoint(job_id, KEY, interval=0)
+    first.language = "en"
+    with pytest.raises(TimeoutError):
+        first.consume(interrupted(model_output((0.0, 4.0), (4.0, 9.5))), offset=0.0)
+
+    retry = Checkpoint.load(job_id, KEY)
+    assert retry.resumed and not retry.complete
+    assert retry.offset == 9.5
+    assert retry.language == "en"
+
+    # The retry decodes the audio after the offset; its times start at zero again
+    retry.consume(model_output((0.0, 3.0), (3.0, 5.5)), offset=retry.offset)
+    assert [(s.start, s.end) for s in retry.segments] == [(0.0, 4.0), (4.0, 9.5), (9.5, 12.5), (12.5, 15.0)]
+    assert retry.offset == 15.0
+
+    done = Checkpoint.load(job_id, KEY)
+    assert done.complete
+    assert done.segments == retry.segments
+
+
+def test_checkpoint_of_other_settings_is_ignored(job_id):
+    Checkpoint(job_id, KEY, interval=0).consume(model_output((0.0, 4.0)), offset=0.0)
+    other = Checkpoint.load(job_id, {**KEY, "mode": "whale"})
+    assert not other.resumed
+    assert other.offset == 0.0
+
+
+def test_older_snapshot_never_replaces_a_newer_one(job_id, monkeypatch):
+    checkpoint = Checkpoint(job_id, KEY)
+    encrypt = checkpoint_module.encrypt_bytes
+    in_encrypt, release = threading.Event(), threading.Event()
+
+    def slow_first_encrypt(data):
+        if not in_encrypt.is_set():
+            in_encrypt.set()
+            release.wait(5)
+        return encrypt(data)
+
+    monkeypatch.setattr(checkpoint_module, "encrypt_bytes", slow_first_encrypt)
+    # Diarization saves its turns while the draft is still empty...
+    diarization = threading.Thread(target=checkpoint.set_turns, args=([(0.0, 1.0, "SPEAKER_00")],))
+    diarization.start()
+    assert in_encrypt.wait(5)
+    # ...and transcription saves a newer snapshot before that save is written
+    checkpoint.consume(model_output((0.0, 4.0)), offset=0.0)
+    release.set()
+    diarization.join()
+
+    saved = Checkpoint.load(job_id, KEY)
+    assert saved.complete
+    assert saved.turns == [(0.0, 1.0, "SPEAKER_00")]
+    assert len(saved.segments) == 1
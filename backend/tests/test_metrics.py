@@ -0,0 +1,23 @@
+import socket
+import urllib.request
+
+from backend.metrics import start_shared_metrics_server
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_metrics_are_not_served_on_the_api(client):
+    assert client.get("/metrics").status_code == 404
+
+
+def test_one_process_serves_the_metrics_port():
+    port = free_port()
+    assert start_shared_metrics_server(port)
+    # Another API process of the same deployment
+    assert not start_shared_metrics_server(port)
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        assert b"http_request_duration_seconds" in response.read()
@@ -0,0 +1,138 @@
+import pytest
+import redis
+from fastapi import HTTPException
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+from starlette.requests import Request
+
+from backend import auth, models
+from backend.config import settings
+from backend.ratelimit import RateLimiter, Rule, client_identities, client_ip, execute_with_limits
+
+PER_MINUTE = [Rule.parse("2/minute")]
+
+
+def request(peer: str = "203.0.113.5", forwarded: str = None, token: str = None) -> Request:
+    headers = []
+    if forwarded:
+        headers.append((b"x-forwarded-for", forwarded.encode()))
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    return Request({
+        "type": "http", "method": "GET", "path": "/jobs", "query_string": b"",
+        "headers": headers, "client": (peer, 50000), "server": ("testserver", 443), "scheme": "https",
+    })
+
+
+@pytest.fixture
+def behind_proxy(monkeypatch):
+    monkeypatch.setattr(settings, "trusted_proxy_hops", 1)
+    monkeypatch.setattr(settings, "trusted_proxy_cidrs", "10.0.0.0/8, 172.28.0.0/16")
+
+
+def test_rule_parse():
+    assert Rule.parse("10/minute") == Rule(10, 60)
+    assert Rule.parse("5/hours") == Rule(5, 3600)
+
+
+def test_forwarded_for_is_read_only_from_trusted_proxies(behind_proxy):
+    assert client_ip(request("10.1.2.3", forwarded="198.51.100.7")) == "198.51.100.7"
+    assert client_ip(request("10.1.2.3", forwarded="1.1.1.1, 198.51.100.7")) == "198.51.100.7"
+    # A client talking to the API directly picks its own header
+    assert client_ip(request("203.0.113.5", forwarded="198.51.100.7")) == "203.0.113.5"
+    assert client_ip(request("testclient", forwarded="198.51.100.7")) == "testclient"
+
+
+def test_forwarded_for_is_ignored_without_proxy_hops(monkeypatch):
+    monkeypatch.setattr(settings, "trusted_proxy_cidrs", "10.0.0.0/8")
+    assert client_ip(request("10.1.2.3", forwarded="198.51.100.7")) == "10.1.2.3"
+
+
+def test_identities_are_ip_and_user():
+    token = auth.create_access_token({"sub": "user@example.com"})
+    assert client_identities(request()) == ["ip:203.0.113.5"]
+    assert client_identities(request(token=token)) == ["user:user@example.com", "ip:203.0.113.5"]
+    assert client_identities(request(token="forged")) == ["ip:203.0.113.5"]
+
+
+def test_limit_is_shared_by_limiters_and_reports_retry_after(redis_conn, lua):
+    first, second = RateLimiter(redis_conn), RateLimiter(redis_conn)
+    assert first.hit("GET:/jobs", ["ip:a"], PER_MINUTE).allowed
+    assert second.hit("GET:/jobs", ["ip:a"], PER_MINUTE).allowed
+    denied = first.hit("GET:/jobs", ["ip:a"], PER_MINUTE)
+    assert not denied.allowed
+    assert 0 < denied.retry_after <= 30
+    assert second.hit("GET:/jobs", ["ip:b"], PER_MINUTE).allowed
+
+
+def test_user_and_ip_are_both_enforced(redis_conn, lua):
+    limiter = RateLimiter(redis_conn)
+    # One user spreading requests over addresses
+    assert limiter.hit("GET:/jobs", ["user:a", "ip:1"], PER_MINUTE).allowed
+    assert limiter.hit("GET:/jobs", ["user:a", "ip:2"], PER_MINUTE).allowed
+    assert not limiter.hit("GET:/jobs", ["user:a", "ip:3"], PER_MINUTE).allowed
+    # One address spreading requests over accounts
+    assert limiter.hit("GET:/jobs", ["user:b", "ip:4"], PER_MINUTE).allowed
+    assert limiter.hit("GET:/jobs", ["user:c", "ip:4"], PER_MINUTE).allowed
+    assert not limiter.hit("GET:/jobs", ["user:d", "ip:4"], PER_MINUTE).allowed
+    # A denied request consumes nothing
+    assert limiter.hit("GET:/jobs", ["user:d", "ip:5"], PER_MINUTE).allowed
+
+
+def test_unreachable_redis_falls_back_to_local_limits():
+    unreachable = redis.Redis(host="127.0.0.1", port=1, socket_connect_timeout=0.1, retry=Retry(NoBackoff(), 0))
+    limiter = RateLimiter(unreachable)
+    assert limiter.hit("GET:/jobs", ["ip:a"], PER_MINUTE).allowed
+    assert limiter.hit("GET:/jobs", ["ip:a"], PER_MINUTE).allowed
+    assert not limiter.hit("GET:/jobs", ["ip:a"], PER_MINUTE).allowed
+
+    pipe = limiter.redis.pipeline(transaction=False)
+    enforce = limiter.queue_limit(pipe, request(), "1/minute")
+    replies = execute_with_limits(pipe)
+    assert replies == [None]
+    enforce(replies[0])
+    with pytest.raises(HTTPException) as denied:
+        limiter.queue_limit(limiter.redis.pipeline(), request(), "1/minute")(None)
+    assert denied.value.status_code == 429
+
+
+def test_queued_limit_loads_its_script(redis_conn, lua):
+    redis_conn.script_flush()
+    limiter = RateLimiter(redis_conn)
+    pipe = redis_conn.pipeline(transaction=False)
+    enforce = limiter.queue_limit(pipe, request(), "1/minute")
+    replies = execute_with_limits(pipe)
+    assert isinstance(replies[0], redis.exceptions.NoScriptError)
+    enforce(replies[0])
+
+    pipe = redis_conn.pipeline(transaction=False)
+    enforce = limiter.queue_limit(pipe, request(), "1/minute")
+    with pytest.raises(HTTPException) as denied:
+        enforce(execute_with_limits(pipe)[0])
+    assert denied.value.headers["Retry-After"] == "60"
+
+
+def test_job_status_is_one_redis_round_trip(client, db, user, auth_headers, redis_conn, monkeypatch):
+    job = models.TranscriptionJob(user_id=user.id, filename="a.wav", status="queued")
+    db.add(job)
+    db.commit()
+    # The first request loads the script
+    assert client.get(f"/jobs/{job.id}", headers=auth_headers).status_code == 200
+
+    round_trips = []
+    pipeline_execute, execute_command = redis.client.Pipeline.execute, redis_conn.execute_command
+    monkeypatch.setattr(redis.client.Pipeline, "execute", lambda pipe, **kw: round_trips.append("pipeline") or pipeline_execute(pipe, **kw))
+    monkeypatch.setattr(redis_conn, "execute_command", lambda *args, **kw: round_trips.append(args[0]) or execute_command(*args, **kw))
+
+    assert client.get(f"/jobs/{job.id}", headers=auth_headers).status_code == 200
+    assert round_trips == ["pipeline"]
+
+
+def test_job_status_is_rate_limited(client, db, user, auth_headers):
+    job = models.TranscriptionJob(user_id=user.id, filename="a.wav", status="queued")
+    db.add(job)
+    db.commit()
+    statuses = [client.get(f"/jobs/{job.id}", headers=auth_headers).status_code for _ in range(31)]
+    assert statuses[:30] == [200] * 30
+    assert statuses[30] == 429
+
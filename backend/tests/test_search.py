@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+
+from backend import models, search
+from backend.search import DisabledSearchIndex, SQLiteSearchIndex, create_index
+from backend.segments import SegmentTable
+from backend.transcripts import pack_transcript
+
+
+def segments(*texts: str) -> SegmentTable:
+    return SegmentTable.from_dicts([{"start": float(i), "end": i + 1.0, "text": text} for i, text in enumerate(texts)])
+
+
+@pytest.fixture
+def index(tmp_path):
+    return SQLiteSearchIndex(create_engine(f"sqlite:///{tmp_path / 'search.db'}"), key=b"test-key")
+
+
+def found(hits) -> list:
+    return [(hit.job_id, hit.segment) for hit in hits]
+
+
+def test_words_and_phrases_match_within_segments(index):
+    assert index.index_job(1, 10, segments("The quick brown fox", "jumps over the lazy dog")) == 2
+    assert found(index.search(10, "QUICK")) == [(1, 0)]
+    assert found(index.search(10, '"brown fox"')) == [(1, 0)]
+    assert index.search(10, '"fox brown"') == []
+    # Every term must be in the same segment
+    assert index.search(10, "fox dog") == []
+    assert index.search(10, "qui") == []
+
+
+def test_users_only_match_their_own_tokens(index):
+    index.index_job(1, 10, segments("quick brown fox"))
+    index.index_job(2, 20, segments("quick red fox"))
+    assert found(index.search(10, "quick fox")) == [(1, 0)]
+    assert found(index.search(20, "quick fox")) == [(2, 0)]
+    assert index.search(20, "brown") == []
+    # Another user's token is just an unknown word
+    assert index.search(20, index.token(10, "brown")) == []
+
+
+def test_reindexing_a_job_replaces_it_and_deleting_drops_only_it(index):
+    index.index_job(1, 10, segments("old words"))
+    index.index_job(2, 10, segments("old words"))
+    index.index_job(1, 10, segments("new words"))
+    assert found(index.search(10, "old")) == [(2, 0)]
+    assert found(index.search(10, "new")) == [(1, 0)]
+
+    index.delete_job(1)
+    assert index.search(10, "new") == []
+    assert found(index.search(10, "words")) == [(2, 0)]
+
+
+def test_segments_past_the_rowid_range_are_not_indexed(index, monkeypatch):
+    monkeypatch.setattr(index, "MAX_SEGMENTS", 2)
+    assert index.index_job(1, 10, segments("one", "two", "three")) == 2
+    assert found(index.search(10, "two")) == [(1, 1)]
+    assert index.search(10, "three") == []
+    # The next job's rows are untouched
+    index.index_job(2, 10, segments("three"))
+    index.delete_job(1)
+    assert found(index.search(10, "three")) == [(2, 0)]
+
+
+def test_reindex_rebuilds_from_stored_transcripts(db, user, index, monkeypatch):
+    monkeypatch.setattr(search, "_index", index)
+    for status, text in (("completed", "indexed transcript"), ("failed", "partial transcript")):
+        db.add(models.TranscriptionJob(
+            user_id=user.id, filename="a.wav", status=status,
+            transcript_encrypted=pack_transcript(segments(text), {}),
+        ))
+    db.commit()
+
+    assert search.reindex(batch_size=1) == 1
+    assert len(index.search(user.id, "transcript")) == 1
+    assert index.search(user.id, "partial") == []
+
+
+def test_other_databases_get_a_disabled_index():
+    index = create_index(SimpleNamespace(dialect=SimpleNamespace(name="mysql")), key=b"test-key")
+    assert isinstance(index, DisabledSearchIndex)
+    assert index.index_job(1, 10, segments("quick brown fox")) == 0
+    index.delete_job(1)
+    assert index.search(10, "quick") == []
@@ -0,0 +1,95 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import event
+
+from backend import auth, models, status_cache
+from backend.database import engine
+from backend.status_cache import CachedStatus
+
+UPDATED = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def entry(job_id: int, version: int, status: str = "processing", user_id: int = 1) -> CachedStatus:
+    return CachedStatus(job_id, user_id, status, version, UPDATED)
+
+
+def test_publish_never_replaces_a_newer_version(redis_conn):
+    status_cache.publish(redis_conn, entry(1, 3, "completed"))
+    status_cache.publish(redis_conn, entry(1, 2, "processing"))
+    assert status_cache.read(redis_conn, [1, 2]) == {1: entry(1, 3, "completed")}
+
+    status_cache.publish(redis_conn, entry(1, 4, "queued"))
+    assert status_cache.read(redis_conn, [1])[1].status == "queued"
+
+
+def test_backfill_skips_jobs_a_writer_cached_meanwhile(redis_conn):
+    status_cache.publish(redis_conn, entry(1, 5, "completed"))
+    status_cache.backfill(redis_conn, [entry(1, 4), entry(2, 1)])
+    assert status_cache.read(redis_conn, [1, 2]) == {1: entry(1, 5, "completed")}
+
+    status_cache.backfill(redis_conn, [entry(2, 1)])
+    assert status_cache.read(redis_conn, [2]) == {2: entry(2, 1)}
+
+
+def add_job(db, user_id: int, status: str = "queued") -> models.TranscriptionJob:
+    job = models.TranscriptionJob(user_id=user_id, filename="a.wav", status=status)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def test_job_status_miss_is_backfilled_and_revalidated_from_the_cache(client, db, user, auth_headers, redis_conn):
+    job = add_job(db, user.id)
+    first = client.get(f"/jobs/{job.id}", headers=auth_headers)
+    assert first.status_code == 200
+    assert status_cache.read(redis_conn, [job.id])[job.id].version == job.version
+
+    # Answered from the cache alone: the row is no longer read
+    db.delete(job)
+    db.commit()
+    revalidated = client.get(f"/jobs/{job.id}", headers={**auth_headers, "If-None-Match": first.headers["ETag"]})
+    assert revalidated.status_code == 304
+
+
+def test_bulk_status_mixes_cached_and_database_jobs_of_the_caller_only(client, db, user, auth_headers, redis_conn):
+    other = models.User(email="other@example.com", hashed_password="x")
+    db.add(other)
+    db.commit()
+    cached, uncached, foreign = add_job(db, user.id, "completed"), add_job(db, user.id), add_job(db, other.id)
+    status_cache.publish(redis_conn, CachedStatus.of(cached))
+
+    response = client.post("/jobs/status", json={"job_ids": [uncached.id, cached.id, foreign.id, 999]}, headers=auth_headers)
+    assert response.status_code == 200
+    assert [(s["id"], s["status"]) for s in response.json()] == [(uncached.id, "queued"), (cached.id, "completed")]
+    assert uncached.id in status_cache.read(redis_conn, [uncached.id])
+
+
+@contextmanager
+def statements():
+    executed = []
+    listener = lambda conn, cursor, statement, *args: executed.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        yield executed
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+
+def test_cached_polls_do_not_touch_the_database(client, db, user, auth_headers):
+    job = add_job(db, user.id, "completed")
+    first = client.get(f"/jobs/{job.id}", headers=auth_headers)
+
+    with statements() as executed:
+        revalidated = client.get(f"/jobs/{job.id}", headers={**auth_headers, "If-None-Match": first.headers["ETag"]})
+        bulk = client.post("/jobs/status", json={"job_ids": [job.id]}, headers=auth_headers)
+    assert revalidated.status_code == 304
+    assert [s["status"] for s in bulk.json()] == ["completed"]
+    assert executed == []
+
+
+def test_status_of_a_token_without_an_account_is_unauthorized(client, db):
+    headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': 'nobody@example.com'})}"}
+    assert client.get("/jobs/1", headers=headers).status_code == 401
+    assert client.post("/jobs/status", json={"job_ids": [1]}, headers=headers).status_code == 401
@@ -0,0 +1,14 @@
+import os
+
+from backend.storage import Reaper, input_path, save_input
+
+
+def test_reaper_spares_inputs_of_jobs_being_created(db):
+    # Stored by queue_job before the job's row is committed
+    save_input(901, b"encrypted")
+    Reaper().run_once()
+    assert os.path.exists(input_path(901))
+
+    # Still without a job once the grace period is over
+    Reaper(orphan_grace_seconds=0).run_once()
+    assert not os.path.exists(input_path(901))
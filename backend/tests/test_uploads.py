@@ -0,0 +1,137 @@
+import os
+
+import pytest
+
+from backend import models, producer, uploads
+from backend.routing import queue_name
+from backend.config import settings
+from backend.storage import input_path, iter_input
+from backend.uploads import MIN_CHUNK_SIZE
+
+DATA = os.urandom(2 * MIN_CHUNK_SIZE + 1234)
+
+
+def create(client, auth_headers, size: int = len(DATA)) -> dict:
+    response = client.post("/uploads", json={"filename": "talk.wav", "size": size, "chunk_size": MIN_CHUNK_SIZE}, headers=auth_headers)
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def put(client, auth_headers, upload_id: str, index: int):
+    chunk = DATA[index * MIN_CHUNK_SIZE:(index + 1) * MIN_CHUNK_SIZE]
+    return client.put(f"/uploads/{upload_id}/chunks/{index}", content=chunk, headers=auth_headers)
+
+
+def jobs(db) -> list:
+    db.expire_all()
+    return db.query(models.TranscriptionJob).all()
+
+
+def test_chunks_in_any_order_are_assembled_into_one_queued_job(client, db, auth_headers):
+    upload = create(client, auth_headers)
+    assert upload["chunks"] == 3
+    for index in (2, 0):
+        assert put(client, auth_headers, upload["upload_id"], index).status_code == 204
+
+    status = client.get(f"/uploads/{upload['upload_id']}", headers=auth_headers)
+    assert status.json()["missing"] == [1]
+    assert status.headers["Upload-Offset"] == str(MIN_CHUNK_SIZE)
+    incomplete = client.post(f"/uploads/{upload['upload_id']}/finalize", headers=auth_headers)
+    assert incomplete.status_code == 409
+
+    assert put(client, auth_headers, upload["upload_id"], 1).status_code == 204
+    finalized = client.post(f"/uploads/{upload['upload_id']}/finalize", headers=auth_headers)
+    assert finalized.status_code == 200, finalized.text
+    (job_id,) = finalized.json()["job_ids"]
+    assert b"".join(iter_input(input_path(job_id))) == DATA
+    assert [job.id for job in jobs(db)] == [job_id]
+    assert len(producer.get_queue(queue_name("free", "dolphin"))) == 1
+
+    # The response to the first finalize was lost
+    again = client.post(f"/uploads/{upload['upload_id']}/finalize", headers=auth_headers)
+    assert again.json()["job_ids"] == [job_id]
+    assert len(jobs(db)) == 1
+
+
+def test_failed_assembly_leaves_no_job_and_can_be_retried(client, db, user, auth_headers, monkeypatch):
+    upload = create(client, auth_headers)
+    for index in range(upload["chunks"]):
+        put(client, auth_headers, upload["upload_id"], index)
+
+    assemble = uploads.assemble
+    monkeypatch.setattr(uploads, "assemble", lambda session, job_id: (_ for _ in ()).throw(OSError("disk full")))
+    with pytest.raises(OSError):
+        client.post(f"/uploads/{upload['upload_id']}/finalize", headers=auth_headers)
+    assert jobs(db) == []
+    assert db.get(models.User, user.id).usage_count == 0
+
+    monkeypatch.setattr(uploads, "assemble", assemble)
+    finalized = client.post(f"/uploads/{upload['upload_id']}/finalize", headers=auth_headers)
+    assert finalized.status_code == 200, finalized.text
+    assert len(jobs(db)) == 1
+    assert db.get(models.User, user.id).usage_count == 1
+
+
+def test_chunk_after_finalize_is_a_conflict(client, auth_headers):
+    upload = create(client, auth_headers)
+    for index in range(upload["chunks"]):
+        put(client, auth_headers, upload["upload_id"], index)
+    assert client.post(f"/uploads/{upload['upload_id']}/finalize", headers=auth_headers).status_code == 200
+
+    assert put(client, auth_headers, upload["upload_id"], 0).status_code == 409
+
+
+def test_chunk_racing_finalize_is_a_conflict(redis_conn, user):
+    session = uploads.create_session(redis_conn, user.id, "talk.wav", len(DATA), MIN_CHUNK_SIZE, {})
+    # A retry of a chunk read the session before finalize dropped its chunks
+    uploads.mark_finalized(redis_conn, session, 1)
+    with pytest.raises(uploads.UploadConflict):
+        uploads._store_chunk(session, 0, DATA[:MIN_CHUNK_SIZE])
+
+
+def test_open_sessions_are_capped_per_user(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "upload_max_sessions", 2)
+    first = create(client, auth_headers)
+    create(client, auth_headers)
+    response = client.post("/uploads", json={"filename": "talk.wav", "size": len(DATA)}, headers=auth_headers)
+    assert response.status_code == 409
+
+    # Aborting one frees its place
+    assert client.delete(f"/uploads/{first['upload_id']}", headers=auth_headers).status_code == 204
+    create(client, auth_headers)
+
+
+def test_chunk_while_finalizing_is_a_conflict(client, redis_conn, user, auth_headers):
+    upload = create(client, auth_headers)
+    session = uploads.get_session(redis_conn, upload["upload_id"], user.id)
+    uploads.claim_finalize(redis_conn, session)
+    assert put(client, auth_headers, upload["upload_id"], 0).status_code == 409
+
+
+def test_finalize_waits_for_chunks_being_stored(client, redis_conn, user, auth_headers):
+    upload = create(client, auth_headers)
+    for index in range(upload["chunks"]):
+        put(client, auth_headers, upload["upload_id"], index)
+    # A retry of chunk 0 is being written
+    session = uploads.get_session(redis_conn, upload["upload_id"], user.id)
+    lease = uploads._begin_store(redis_conn, session)
+    assert client.post(f"/uploads/{upload['upload_id']}/finalize", headers=auth_headers).status_code == 409
+
+    redis_conn.zrem(uploads.STORING_KEY.format(upload_id=upload["upload_id"]), lease)
+    assert client.post(f"/uploads/{upload['upload_id']}/finalize", headers=auth_headers).status_code == 200
+
+
+def test_failed_cleanup_after_commit_still_records_the_job(client, db, auth_headers, monkeypatch):
+    upload = create(client, auth_headers)
+    for index in range(upload["chunks"]):
+        put(client, auth_headers, upload["upload_id"], index)
+
+    mark_finalized = uploads.mark_finalized
+    monkeypatch.setattr(uploads, "mark_finalized", lambda *args: (_ for _ in ()).throw(ConnectionError("redis went away")))
+    with pytest.raises(ConnectionError):
+        client.post(f"/uploads/{upload['upload_id']}/finalize", headers=auth_headers)
+    monkeypatch.setattr(uploads, "mark_finalized", mark_finalized)
+
+    again = client.post(f"/uploads/{upload['upload_id']}/finalize", headers=auth_headers)
+    assert again.status_code == 200
+    assert again.json()["job_ids"] == [job.id for job in jobs(db)]
@@ -0,0 +1,167 @@
+import hashlib
+import hmac
+import json
+import random
+import time
+
+import pytest
+
+from backend import models, webhooks
+from backend.config import settings
+from backend.database import SessionLocal
+
+CREATED = 1_700_000_000
+
+
+def event(n: int, event_type: str, user: models.User, created: int) -> dict:
+    if event_type == "checkout.session.completed":
+        obj = {"metadata": {"user_id": str(user.id)}}
+    else:
+        obj = {"customer_email": user.email}
+    return {"id": f"evt_{n}", "type": event_type, "created": created, "data": {"object": obj}}
+
+
+def checkout(n, user, created):
+    return event(n, "checkout.session.completed", user, created)
+
+
+def cancellation(n, user, created):
+    return event(n, "customer.subscription.deleted", user, created)
+
+
+def queue(redis_conn, *events) -> None:
+    for e in events:
+        webhooks.enqueue_event(redis_conn, e["id"], e["type"], json.dumps(e))
+
+
+def processor(redis_conn, name: str = "test", batch_size: int = 100) -> webhooks.WebhookProcessor:
+    p = webhooks.WebhookProcessor(redis_conn, session_factory=SessionLocal, batch_size=batch_size, consumer=name)
+    p.ensure_group()
+    return p
+
+
+def drain(p: webhooks.WebhookProcessor) -> None:
+    while p.run_once(block_ms=0):
+        pass
+
+
+def is_paid(db, user) -> bool:
+    db.expire_all()
+    return db.get(models.User, user.id).is_paid
+
+
+@pytest.fixture
+def users(db):
+    accounts = [models.User(email=f"user{i}@example.com", hashed_password="x") for i in range(20)]
+    db.add_all(accounts)
+    db.commit()
+    return accounts
+
+
+def test_redelivered_event_is_queued_once(redis_conn):
+    payload = json.dumps({"id": "evt_1"})
+    assert webhooks.enqueue_event(redis_conn, "evt_1", "checkout.session.completed", payload)
+    assert not webhooks.enqueue_event(redis_conn, "evt_1", "checkout.session.completed", payload)
+    assert redis_conn.xlen(webhooks.STREAM_KEY) == 1
+
+
+def test_webhook_acknowledges_without_touching_the_database(client, redis_conn, user, db):
+    body = json.dumps(checkout("1", user, CREATED)).encode()
+    timestamp = int(time.time())
+    signature = hmac.new(settings.stripe_webhook_secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    headers = {"stripe-signature": f"t={timestamp},v1={signature}"}
+
+    assert client.post("/stripe/webhook", content=body, headers=headers).json() == {"status": "queued"}
+    assert client.post("/stripe/webhook", content=body, headers=headers).json() == {"status": "duplicate"}
+    assert client.post("/stripe/webhook", content=body, headers={"stripe-signature": "t=1,v1=00"}).status_code == 400
+    assert not is_paid(db, user)
+
+    drain(processor(redis_conn))
+    assert is_paid(db, user)
+
+
+def test_batch_applies_each_users_newest_event(redis_conn, db, users):
+    a, b = users[:2]
+    queue(
+        redis_conn,
+        checkout(1, a, CREATED),
+        cancellation(2, a, CREATED + 20),
+        # Delivered after the cancellation but created before it
+        checkout(3, a, CREATED + 10),
+        cancellation(4, b, CREATED),
+        checkout(5, b, CREATED + 5),
+    )
+    drain(processor(redis_conn))
+    assert not is_paid(db, a)
+    assert is_paid(db, b)
+
+
+def test_stale_event_in_a_later_batch_is_ignored(redis_conn, db, users):
+    a = users[0]
+    p = processor(redis_conn)
+    queue(redis_conn, checkout(1, a, CREATED), cancellation(2, a, CREATED + 20))
+    drain(p)
+    queue(redis_conn, checkout(3, a, CREATED + 10))
+    drain(p)
+    assert not is_paid(db, a)
+
+
+def test_dead_consumers_batch_is_claimed_without_undoing_newer_events(redis_conn, db, users, monkeypatch):
+    a = users[0]
+    dead, live = processor(redis_conn, "dead"), processor(redis_conn, "live")
+    queue(redis_conn, checkout(1, a, CREATED))
+    # The dead consumer read the checkout and never acknowledged it
+    assert len(dead.next_batch(block_ms=0)) == 1
+    queue(redis_conn, cancellation(2, a, CREATED + 20))
+    drain(live)
+    assert not is_paid(db, a)
+
+    monkeypatch.setattr(settings, "stripe_claim_seconds", 0)
+    assert live.run_once(block_ms=0) == 1
+    assert redis_conn.xpending(webhooks.STREAM_KEY, webhooks.GROUP)["pending"] == 0
+    assert not is_paid(db, a)
+
+
+def test_failed_batch_stays_pending_and_is_retried(redis_conn, db, users):
+    a = users[0]
+    failures = [RuntimeError("database unavailable")]
+
+    def session_factory():
+        if failures:
+            raise failures.pop()
+        return SessionLocal()
+
+    p = webhooks.WebhookProcessor(redis_conn, session_factory=session_factory, consumer="flaky")
+    p.ensure_group()
+    queue(redis_conn, checkout(1, a, CREATED))
+    with pytest.raises(RuntimeError):
+        p.run_once(block_ms=0)
+    assert redis_conn.xpending(webhooks.STREAM_KEY, webhooks.GROUP)["pending"] == 1
+
+    assert p.run_once(block_ms=0) == 1
+    assert is_paid(db, a)
+
+
+def test_burst_across_consumers_ends_on_each_users_newest_event(redis_conn, db, users, monkeypatch):
+    rng = random.Random(0)
+    events, expected = [], {}
+    for n in range(3000):
+        account, kind = rng.choice(users), rng.choice((checkout, cancellation))
+        events.append(kind(n, account, CREATED + n))
+        expected[account.id] = kind is checkout
+    # Out-of-order delivery with redeliveries
+    deliveries = events + rng.sample(events, 600)
+    rng.shuffle(deliveries)
+    queue(redis_conn, *deliveries)
+    assert redis_conn.xlen(webhooks.STREAM_KEY) == len(events)
+
+    consumers = [processor(redis_conn, f"worker-{i}", batch_size=rng.randint(20, 200)) for i in range(3)]
+    # One consumer dies holding a batch, which another takes over at the end
+    consumers[0].next_batch(block_ms=0)
+    while any([c.run_once(block_ms=0) for c in rng.sample(consumers[1:], 2)]):
+        pass
+    monkeypatch.setattr(settings, "stripe_claim_seconds", 0)
+    drain(consumers[1])
+
+    db.expire_all()
+    assert {account.id: account.is_paid for account in users if account.id in expected} == expected
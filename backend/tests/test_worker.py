@@ -0,0 +1,53 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from rq import Queue
+
+# Metrics are created before the worker module turns on multiprocess mode
+from backend import metrics, tasks  # noqa: F401
+from backend import worker
+from backend.routing import all_queue_names, queue_name
+
+os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+
+class KeptModel:
+    """Stands in for a WhisperModel: it owns a thread pool, as CTranslate2 does."""
+
+    def __init__(self, size: str):
+        self.size = size
+        self.pool = ThreadPoolExecutor(max_workers=2)
+        self.pool.submit(threading.get_ident).result()
+
+
+def transcribe_with_kept_model(size: str) -> tuple:
+    model = tasks.MODEL_CACHE[size]
+    # A forked child would inherit the pool but not its threads and hang here
+    return os.getpid(), id(model), model.pool.submit(sum, [1, 2, 3]).result(timeout=5)
+
+
+@pytest.fixture
+def models(monkeypatch):
+    monkeypatch.setattr(tasks, "MODEL_CACHE", {})
+    monkeypatch.setattr(tasks, "get_model", lambda mode: tasks.MODEL_CACHE.setdefault(tasks.MODEL_SIZES[mode], KeptModel(tasks.MODEL_SIZES[mode])))
+    return tasks.MODEL_CACHE
+
+
+def test_jobs_run_in_the_worker_against_its_kept_models(redis_conn, models):
+    queues = [Queue(name, connection=redis_conn) for name in all_queue_names()]
+    jobs = [
+        Queue(queue_name("free", "dolphin"), connection=redis_conn).enqueue(transcribe_with_kept_model, "base", job_timeout=30)
+        for _ in range(2)
+    ]
+
+    tasks.keep_models(["dolphin"])
+    kept = models["base"]
+    assert worker.AffinityWorker(queues, connection=redis_conn, home=["dolphin"]).work(burst=True)
+
+    for job in jobs:
+        job.refresh()
+        assert job.get_status() == "finished"
+        assert job.return_value() == (os.getpid(), id(kept), 6)
+    assert models == {"base": kept}
@@ -0,0 +1,156 @@
+"""
+Storage format of ``TranscriptionJob.transcript_encrypted``.
+
+New transcripts are stored as ``sc:<columns>|<json>``. ``<columns>`` is a
+binary ``SegmentTable`` followed by the metadata as JSON, and ``<json>`` the
+API's JSON of the transcript; each is gzip-compressed and Fernet-encrypted
+as ``<token>.<token>...``: the gzip stream is cut into ``TOKEN_BYTES``
+pieces encrypted one at a time, so ``TranscriptWriter`` compresses and
+encrypts as it goes instead of holding the serialized, compressed and
+encrypted transcript side by side. Exports read the columns straight back
+without parsing JSON; ``format=json`` sends the stored JSON stream to
+clients as-is. Rows written as a single token, and ``sc:`` rows from before
+the JSON stream was stored (no ``|<json>``), read the same way; the JSON of
+the latter is rebuilt from the columns. Two older formats still read:
+``gz:<token>`` (gzip JSON, also sent as stored) and untagged rows (plain
+JSON in Fernet).
+
+gzip rather than zstd: JSON downloads hand the stored stream to clients with ``Content-Encoding: gzip``, which every browser and
+proxy accepts, and it needs no new dependency.
+"""
+
+import gzip
+import json
+import struct
+import zlib
+from typing import List, NamedTuple, Optional, Tuple
+
+from .segments import SegmentTable
+from .utils import decrypt, decrypt_bytes, encrypt_bytes
+
+COLUMNAR_TAG = "sc:"
+GZIP_TAG = "gz:"
+# Transcripts are written once and read many times; level 6 is within a few
+# percent of 9 here at a fraction of the CPU
+GZIP_LEVEL = 6
+# Compressed bytes per Fernet token; Fernet has no streaming mode, so this
+# bounds what the writer holds besides the finished tokens
+TOKEN_BYTES = 256 * 1024
+# Neither is in the URL-safe base64 alphabet of a token
+TOKEN_SEPARATOR = "."
+SECTION_SEPARATOR = "|"
+# Segments per json.dumps call while writing the JSON stream
+JSON_BATCH = 1000
+
+
+class Transcript(NamedTuple):
+    segments: SegmentTable
+    metadata: dict
+
+
+class _SealedStream:
+    """A gzip stream encrypted as ``TOKEN_BYTES`` pieces while it is written."""
+
+    def __init__(self):
+        # wbits=31 writes a gzip stream (with mtime 0, so it is deterministic for a given transcript)
+        self._deflate = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        self._pending = bytearray()
+        self._tokens: List[str] = []
+
+    def write(self, data) -> None:
+        view = memoryview(data).cast("B")
+        for pos in range(0, len(view), TOKEN_BYTES):
+            self._pending += self._deflate.compress(view[pos:pos + TOKEN_BYTES])
+            while len(self._pending) >= TOKEN_BYTES:
+                self._seal(TOKEN_BYTES)
+
+    def finish(self) -> str:
+        self._pending += self._deflate.flush()
+        while self._pending:
+            self._seal(TOKEN_BYTES)
+        tokens, self._tokens = self._tokens, []
+        return TOKEN_SEPARATOR.join(tokens)
+
+    def _seal(self, size: int) -> None:
+        self._tokens.append(encrypt_bytes(bytes(self._pending[:size])).decode())
+        del self._pending[:size]
+
+
+def _dumps(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class TranscriptWriter:
+    """Serialize a transcript into its stored form, compressing and encrypting each piece as it is written.
+
+    Write the table, then the metadata.
+    """
+
+    def __init__(self):
+        self._columns = _SealedStream()
+        self._json = _SealedStream()
+
+    def write_table(self, segments: SegmentTable) -> None:
+        for part in segments.iter_bytes():
+            self._columns.write(part)
+        self._json.write(b'{"segments":[')
+        rows = segments.iter_dicts()
+        for pos in range(0, len(segments), JSON_BATCH):
+            batch = _dumps([row for _, row in zip(range(JSON_BATCH), rows)])[1:-1]
+            self._json.write(b"," + batch if pos else batch)
+
+    def write_metadata(self, metadata: dict) -> None:
+        meta = _dumps(metadata)
+        self._columns.write(struct.pack("<I", len(meta)) + meta)
+        self._json.write(b'],"metadata":' + meta + b"}")
+
+    def finish(self) -> str:
+        """The value to store in ``transcript_encrypted``."""
+        return COLUMNAR_TAG + self._columns.finish() + SECTION_SEPARATOR + self._json.finish()
+
+
+def pack_transcript(segments: SegmentTable, metadata: dict) -> str:
+    writer = TranscriptWriter()
+    writer.write_table(segments)
+    writer.write_metadata(metadata)
+    return writer.finish()
+
+
+def _inflate(tokens: str) -> bytes:
+    inflate = zlib.decompressobj(31)
+    pieces = [inflate.decompress(decrypt_bytes(token.encode())) for token in tokens.split(TOKEN_SEPARATOR)]
+    pieces.append(inflate.flush())
+    return b"".join(pieces)
+
+
+def load_transcript(stored: str) -> Transcript:
+    if stored.startswith(COLUMNAR_TAG):
+        columns = stored[len(COLUMNAR_TAG):].split(SECTION_SEPARATOR, 1)[0]
+        body = _inflate(columns)
+        segments, pos = SegmentTable.read(body)
+        (size,) = struct.unpack_from("<I", body, pos)
+        metadata = json.loads(body[pos + 4:pos + 4 + size])
+        return Transcript(segments, metadata)
+    data = json.loads(transcript_json(stored))
+    return Transcript(SegmentTable.from_dicts(data["segments"]), data.get("metadata", {}))
+
+
+def transcript_body(stored: str) -> Tuple[bytes, Optional[str]]:
+    """The transcript as a JSON body and that body's content coding.
+
+    Stored JSON streams come back still compressed, exactly as stored.
+    """
+    if stored.startswith(GZIP_TAG):
+        return decrypt_bytes(stored[len(GZIP_TAG):].encode()), "gzip"
+    if stored.startswith(COLUMNAR_TAG):
+        _, _, tokens = stored[len(COLUMNAR_TAG):].partition(SECTION_SEPARATOR)
+        if tokens:
+            return b"".join(decrypt_bytes(token.encode()) for token in tokens.split(TOKEN_SEPARATOR)), "gzip"
+        transcript = load_transcript(stored)
+        return _dumps({"segments": transcript.segments.to_dicts(), "metadata": transcript.metadata}), None
+    return decrypt(stored).encode(), None
+
+
+def transcript_json(stored: str) -> bytes:
+    body, encoding = transcript_body(stored)
+    return gzip.decompress(body) if encoding == "gzip" else body
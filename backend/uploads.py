@@ -0,0 +1,248 @@
+"""
+Resumable, parallel chunked uploads.
+
+A client creates an upload session with the file's size, then PUTs
+fixed-size numbered chunks in any order and over as many connections as it
+likes; a failed chunk is simply sent again. The session reports the
+contiguous offset received and the chunks still missing, so an interrupted
+client resumes where it stopped. Finalizing assembles the input and creates
+and enqueues the job exactly as ``POST /jobs/upload`` does.
+
+Each chunk is Fernet-encrypted as it arrives, holding at most one chunk in
+memory, and written to its own file. Assembly concatenates the encrypted
+chunks into the chunked input format of ``storage`` without decrypting or
+buffering the file. Session state lives in Redis so any API process can
+take any request, and expires with the session; the reaper removes chunks
+of sessions that were never finalized. A user may have at most
+``UPLOAD_MAX_SESSIONS`` sessions open (neither finalized, aborted nor
+expired) at a time, since each one holds disk space until it expires.
+"""
+
+import json
+import math
+import os
+import secrets
+import shutil
+import time
+from typing import AsyncIterator, List, NamedTuple, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from .config import settings
+from .storage import save_chunked_input, session_dir
+from .utils import encrypt_bytes
+
+SESSION_KEY = "upload:{upload_id}"
+CHUNKS_KEY = "upload:{upload_id}:chunks"
+# Sorted set of chunk writes in progress, scored by when their lease ends;
+# finalizing waits for them
+STORING_KEY = "upload:{upload_id}:storing"
+# How long a chunk being stored may hold off finalizing, should its request die midway
+STORE_LEASE_SECONDS = 60
+# Sorted set of a user's open sessions, scored by when they expire
+USER_SESSIONS_KEY = "upload:user:{user_id}:sessions"
+MIN_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadError(ValueError):
+    """A request that does not fit the upload session."""
+
+
+class UploadConflict(UploadError):
+    """A request that conflicts with the state of the session, or of the user's other sessions."""
+
+
+class UploadSession(NamedTuple):
+    upload_id: str
+    user_id: int
+    filename: str
+    size: int
+    chunk_size: int
+    options: dict
+    job_id: Optional[int] = None
+
+    @property
+    def chunks(self) -> int:
+        return max(1, math.ceil(self.size / self.chunk_size))
+
+    def chunk_length(self, index: int) -> int:
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def chunk_path(self, index: int) -> str:
+        return os.path.join(session_dir(self.upload_id), f"{index}.chunk")
+
+
+def _ttl() -> int:
+    return int(settings.upload_session_hours * 3600)
+
+
+def create_session(redis_conn, user_id: int, filename: str, size: int, chunk_size: Optional[int], options: dict) -> UploadSession:
+    chunk_size = chunk_size or settings.upload_chunk_size
+    if not MIN_CHUNK_SIZE <= chunk_size <= settings.upload_max_chunk_size:
+        raise UploadError(f"chunk_size must be between {MIN_CHUNK_SIZE} and {settings.upload_max_chunk_size} bytes")
+    session = UploadSession(secrets.token_urlsafe(16), user_id, filename, size, chunk_size, options)
+    key = SESSION_KEY.format(upload_id=session.upload_id)
+    sessions_key = USER_SESSIONS_KEY.format(user_id=user_id)
+
+    def register(pipe):
+        now = time.time()
+        if pipe.zcount(sessions_key, f"({now}", "+inf") >= settings.upload_max_sessions:
+            raise UploadConflict(f"At most {settings.upload_max_sessions} uploads may be in progress; finish or abort one first")
+        pipe.multi()
+        pipe.hset(key, mapping={
+            "user_id": user_id,
+            "filename": filename,
+            "size": size,
+            "chunk_size": chunk_size,
+            "options": json.dumps(options),
+        })
+        pipe.expire(key, _ttl())
+        pipe.zremrangebyscore(sessions_key, "-inf", now)
+        pipe.zadd(sessions_key, {session.upload_id: now + _ttl()})
+        pipe.expire(sessions_key, _ttl())
+
+    # Watched, so concurrent requests cannot open more sessions than allowed
+    redis_conn.transaction(register, sessions_key)
+    os.makedirs(session_dir(session.upload_id), exist_ok=True)
+    return session
+
+
+def get_session(redis_conn, upload_id: str, user_id: int) -> Optional[UploadSession]:
+    """The caller's session, or None if it does not exist, expired or belongs to someone else."""
+    data = redis_conn.hgetall(SESSION_KEY.format(upload_id=upload_id))
+    if not data or int(data[b"user_id"]) != user_id:
+        return None
+    job_id = data.get(b"job_id")
+    return UploadSession(
+        upload_id,
+        user_id,
+        data[b"filename"].decode(),
+        int(data[b"size"]),
+        int(data[b"chunk_size"]),
+        json.loads(data[b"options"]),
+        int(job_id) if job_id else None,
+    )
+
+
+def _store_chunk(session: UploadSession, index: int, data: bytes) -> None:
+    path = session.chunk_path(index)
+    tmp_path = f"{path}.{secrets.token_hex(4)}.part"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(encrypt_bytes(data))
+        # Retries of the same chunk may race; the last complete copy wins
+        os.replace(tmp_path, path)
+    except FileNotFoundError:
+        # The session was finalized or aborted while the chunk was arriving
+        raise UploadConflict("Upload already finalized or aborted")
+
+
+async def write_chunk(redis_conn, session: UploadSession, index: int, body: AsyncIterator[bytes]) -> None:
+    """Receive, encrypt and store chunk ``index``; sending a chunk again replaces it."""
+    if session.job_id is not None:
+        raise UploadConflict("Upload already finalized")
+    if not 0 <= index < session.chunks:
+        raise UploadError(f"Chunk index must be between 0 and {session.chunks - 1}")
+    expected = session.chunk_length(index)
+    data = bytearray()
+    async for piece in body:
+        data += piece
+        if len(data) > expected:
+            raise UploadError(f"Chunk {index} must be {expected} bytes")
+    if len(data) != expected:
+        raise UploadError(f"Chunk {index} must be {expected} bytes, got {len(data)}")
+
+    lease = _begin_store(redis_conn, session)
+    try:
+        await run_in_threadpool(_store_chunk, session, index, bytes(data))
+    finally:
+        redis_conn.zrem(STORING_KEY.format(upload_id=session.upload_id), lease)
+    chunks_key = CHUNKS_KEY.format(upload_id=session.upload_id)
+    pipe = redis_conn.pipeline()
+    pipe.sadd(chunks_key, index)
+    # Activity keeps the session alive
+    pipe.expire(chunks_key, _ttl())
+    pipe.expire(SESSION_KEY.format(upload_id=session.upload_id), _ttl())
+    pipe.zadd(USER_SESSIONS_KEY.format(user_id=session.user_id), {session.upload_id: time.time() + _ttl()}, xx=True)
+    pipe.execute()
+
+
+def _begin_store(redis_conn, session: UploadSession) -> str:
+    """Take a lease on storing a chunk, unless the session is being finalized."""
+    key = SESSION_KEY.format(upload_id=session.upload_id)
+    storing_key = STORING_KEY.format(upload_id=session.upload_id)
+    lease = secrets.token_hex(8)
+
+    def begin(pipe):
+        if pipe.hexists(key, "finalizing"):
+            raise UploadConflict("Upload is being finalized")
+        pipe.multi()
+        pipe.zadd(storing_key, {lease: time.time() + STORE_LEASE_SECONDS})
+        pipe.expire(storing_key, STORE_LEASE_SECONDS)
+
+    # Watched, so a chunk cannot start replacing a file assembly is reading
+    redis_conn.transaction(begin, key)
+    return lease
+
+
+def received_chunks(redis_conn, session: UploadSession) -> Set[int]:
+    return {int(i) for i in redis_conn.smembers(CHUNKS_KEY.format(upload_id=session.upload_id))}
+
+
+def progress(session: UploadSession, received: Set[int]) -> Tuple[int, List[int]]:
+    """Bytes received contiguously from the start, and the chunks still missing."""
+    missing = [i for i in range(session.chunks) if i not in received]
+    first_missing = missing[0] if missing else session.chunks
+    return min(session.size, first_missing * session.chunk_size), missing
+
+
+def claim_finalize(redis_conn, session: UploadSession) -> None:
+    """Only one request may assemble a session at a time, and not while chunks are being stored."""
+    key = SESSION_KEY.format(upload_id=session.upload_id)
+    storing_key = STORING_KEY.format(upload_id=session.upload_id)
+
+    def claim(pipe):
+        if pipe.hexists(key, "finalizing"):
+            raise UploadConflict("Upload is already being finalized")
+        if pipe.zcount(storing_key, f"({time.time()}", "+inf"):
+            raise UploadConflict("Chunks are still being stored; finalize again once they are")
+        pipe.multi()
+        pipe.hset(key, "finalizing", 1)
+
+    # Watched, so no chunk starts being stored between the check and the claim
+    redis_conn.transaction(claim, storing_key)
+
+
+def release_finalize(redis_conn, session: UploadSession) -> None:
+    redis_conn.hdel(SESSION_KEY.format(upload_id=session.upload_id), "finalizing")
+
+
+def assemble(session: UploadSession, job_id: int) -> str:
+    """Write the job's input from the session's encrypted chunks and return its path."""
+    return save_chunked_input(job_id, (session.chunk_path(i) for i in range(session.chunks)))
+
+
+def record_job(redis_conn, session: UploadSession, job_id: int) -> None:
+    """Record the job for repeated finalize calls in place of the claim."""
+    pipe = redis_conn.pipeline()
+    pipe.hset(SESSION_KEY.format(upload_id=session.upload_id), "job_id", job_id)
+    pipe.hdel(SESSION_KEY.format(upload_id=session.upload_id), "finalizing")
+    pipe.execute()
+
+
+def mark_finalized(redis_conn, session: UploadSession, job_id: int) -> None:
+    """Record the job for repeated finalize calls and drop the chunks."""
+    record_job(redis_conn, session, job_id)
+    pipe = redis_conn.pipeline()
+    pipe.delete(CHUNKS_KEY.format(upload_id=session.upload_id))
+    pipe.zrem(USER_SESSIONS_KEY.format(user_id=session.user_id), session.upload_id)
+    pipe.execute()
+    shutil.rmtree(session_dir(session.upload_id), ignore_errors=True)
+
+
+def discard(redis_conn, session: UploadSession) -> None:
+    pipe = redis_conn.pipeline()
+    pipe.delete(SESSION_KEY.format(upload_id=session.upload_id), CHUNKS_KEY.format(upload_id=session.upload_id))
+    pipe.zrem(USER_SESSIONS_KEY.format(user_id=session.user_id), session.upload_id)
+    pipe.execute()
+    shutil.rmtree(session_dir(session.upload_id), ignore_errors=True)
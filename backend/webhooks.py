@@ -0,0 +1,219 @@
+"""
+Idempotent, queued processing of Stripe webhook events.
+
+Stripe redelivers an event until it is acknowledged, and subscriptions
+renewing at the end of a billing cycle arrive as bursts, so the webhook does
+no database work: it verifies the signature, then remembers the event ID and
+appends the payload to a Redis stream in one transaction and answers. A
+redelivery whose ID is still remembered (``STRIPE_EVENT_TTL_HOURS``, longer
+than Stripe's three days of retries) is acknowledged without being queued
+again.
+
+Workers drain the stream through a consumer group in batches of up to
+``STRIPE_BATCH_SIZE`` events. The batch's users are looked up in one query,
+each user's events are reduced to the newest one, and the changes are
+written with one executemany UPDATE. ``get_current_user`` reads the user
+row on every request, so there is no user cache to update.
+
+Stream entries are acknowledged only after their batch commits. A batch
+that fails stays pending and is retried by the same worker; entries left
+pending by a worker that died are taken over after ``STRIPE_CLAIM_SECONDS``.
+Batches of different workers, retried and taken-over batches commit in any
+order, so every user row keeps the ``created`` time of the last event
+applied to it (``users.stripe_event_at``) and the UPDATE only applies an
+event created later. Stripe stamps events to the second; an event from the
+same second as the one already applied is ignored.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from redis.exceptions import ResponseError, WatchError
+from sqlalchemy import bindparam, or_, update
+
+from . import models
+from .config import settings
+from .database import SessionLocal
+
+logger = logging.getLogger("webhooks")
+
+STREAM_KEY = "stripe:events"
+GROUP = "entitlements"
+SEEN_KEY = "stripe:event:{event_id}"
+
+_users = models.User.__table__
+# One row per user: applied only if the event is newer than the last one applied
+APPLY_EVENT = (
+    update(_users)
+    .where(_users.c.id == bindparam("user_id"))
+    .where(or_(_users.c.stripe_event_at.is_(None), _users.c.stripe_event_at < bindparam("created")))
+    .values(is_paid=bindparam("paid"), stripe_event_at=bindparam("created"))
+)
+
+
+def enqueue_event(redis_conn, event_id: str, event_type: str, payload: bytes) -> bool:
+    """Queue a verified event; False if it was queued before. Raises RedisError if nothing was queued."""
+    seen = SEEN_KEY.format(event_id=event_id)
+    with redis_conn.pipeline() as pipe:
+        try:
+            pipe.watch(seen)
+            if pipe.exists(seen):
+                return False
+            pipe.multi()
+            pipe.set(seen, 1, ex=int(settings.stripe_event_ttl_hours * 3600))
+            pipe.xadd(STREAM_KEY, {"id": event_id, "type": event_type, "payload": payload})
+            pipe.execute()
+        except WatchError:
+            # A concurrent delivery of the same event queued it
+            return False
+    return True
+
+
+def _target(event: dict) -> Optional[Tuple[str, object, Optional[bool], int]]:
+    """The user an event is about, as ("id" | "email", value), the entitlement it sets (None: none) and its creation time."""
+    event_type = event.get("type")
+    obj = event.get("data", {}).get("object", {})
+    try:
+        if event_type == "checkout.session.completed":
+            return "id", int(obj["metadata"]["user_id"]), True, int(event["created"])
+        if event_type == "customer.subscription.deleted" and obj.get("customer_email"):
+            return "email", obj["customer_email"], False, int(event["created"])
+        if event_type == "invoice.payment_failed" and obj.get("customer_email"):
+            return "email", obj["customer_email"], None, int(event["created"])
+    except (KeyError, TypeError, ValueError) as e:
+        logger.error(f"Malformed {event_type} event {event.get('id')}: {e}")
+    return None
+
+
+def apply_events(db, events: List[dict]) -> Dict[int, bool]:
+    """Write the entitlement changes of ``events`` and return them by user ID; the caller commits.
+
+    A user's change is skipped in the database if a newer event was applied
+    to the user already, by this worker or another one.
+    """
+    targets = [(event, target) for event in events for target in [_target(event)] if target]
+    ids = {target[1] for _, target in targets if target[0] == "id"}
+    emails = {target[1] for _, target in targets if target[0] == "email"}
+    if not targets:
+        return {}
+
+    rows = db.query(models.User.id, models.User.email).filter(
+        or_(models.User.id.in_(ids), models.User.email.in_(emails))
+    ).all()
+    known_ids = {user_id for user_id, _ in rows}
+    ids_by_email = {email: user_id for user_id, email in rows}
+
+    # Newest event per user; of events from the same second, the later one in the stream
+    latest: Dict[int, Tuple[int, bool]] = {}
+    for event, (kind, value, is_paid, created) in targets:
+        if kind == "id":
+            user_id = value if value in known_ids else None
+        else:
+            user_id = ids_by_email.get(value)
+        if user_id is None:
+            logger.error(f"User {value} not found for {event['type']} event {event.get('id')}")
+        elif is_paid is None:
+            # You might want to send an email notification here
+            logger.warning(f"Payment failed for user {value}")
+        elif user_id not in latest or created >= latest[user_id][0]:
+            latest[user_id] = (created, is_paid)
+
+    if latest:
+        db.execute(APPLY_EVENT, [
+            {"user_id": user_id, "paid": is_paid, "created": created}
+            for user_id, (created, is_paid) in latest.items()
+        ])
+    return {user_id: is_paid for user_id, (_, is_paid) in latest.items()}
+
+
+class WebhookProcessor:
+    """One consumer of the event stream; several may run, each entry goes to one of them."""
+
+    def __init__(self, redis_conn, session_factory=SessionLocal, batch_size: int = None, consumer: str = None):
+        self.redis = redis_conn
+        self.session_factory = session_factory
+        self.batch_size = batch_size or settings.stripe_batch_size
+        self.consumer = consumer or f"{socket.gethostname()}:{os.getpid()}"
+
+    def ensure_group(self) -> None:
+        try:
+            self.redis.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def next_batch(self, block_ms: int) -> list:
+        """Our own entries from a batch that failed, else stalled ones of a dead consumer, else new ones."""
+        reply = self.redis.xreadgroup(GROUP, self.consumer, {STREAM_KEY: "0"}, count=self.batch_size)
+        if reply and reply[0][1]:
+            return reply[0][1]
+        claimed = self.redis.xautoclaim(
+            STREAM_KEY, GROUP, self.consumer,
+            min_idle_time=settings.stripe_claim_seconds * 1000, start_id="0-0", count=self.batch_size,
+        )
+        if claimed[1]:
+            return claimed[1]
+        reply = self.redis.xreadgroup(GROUP, self.consumer, {STREAM_KEY: ">"}, count=self.batch_size, block=block_ms)
+        return reply[0][1] if reply else []
+
+    def process(self, entries: list) -> Dict[int, bool]:
+        events = []
+        for entry_id, fields in entries:
+            try:
+                events.append(json.loads(fields[b"payload"]))
+            except (KeyError, ValueError) as e:
+                logger.error(f"Dropping unreadable Stripe event entry {entry_id}: {e}")
+
+        db = self.session_factory()
+        try:
+            changes = apply_events(db, events)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        entry_ids = [entry_id for entry_id, _ in entries]
+        pipe = self.redis.pipeline()
+        pipe.xack(STREAM_KEY, GROUP, *entry_ids)
+        pipe.xdel(STREAM_KEY, *entry_ids)
+        pipe.execute()
+        if changes:
+            activated = sum(changes.values())
+            logger.info(f"Applied {len(events)} Stripe event(s): {activated} subscription(s) activated, {len(changes) - activated} cancelled")
+        return changes
+
+    def run_once(self, block_ms: int = 1000) -> int:
+        """Process one batch; returns the number of stream entries handled."""
+        entries = self.next_batch(block_ms)
+        if entries:
+            self.process(entries)
+        return len(entries)
+
+    def run_forever(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                self.ensure_group()
+                while True:
+                    self.run_once()
+                    backoff = 1.0
+            except Exception as e:
+                # Unacknowledged entries are read again on the next pass
+                logger.error(f"Stripe event batch failed, retrying in {backoff:.0f}s: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+
+def start_webhook_processor(redis_conn) -> threading.Thread:
+    """Drain the Stripe event stream in a daemon thread."""
+    processor = WebhookProcessor(redis_conn)
+    thread = threading.Thread(target=processor.run_forever, name="stripe-webhooks", daemon=True)
+    thread.start()
+    return thread
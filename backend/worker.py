@@ -9,11 +9,23 @@ It handles both paid (high priority) and free (low priority) jobs.
 import os
 import sys
 import time
+import signal
+import shutil
 import logging
+
+# The supervisor runs several worker processes, so metrics are shared
+# through this directory. It has to be set before prometheus_client is imported.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/transcribeai-metrics")
+
 from redis import Redis
-from rq import Worker, Queue, Connection
-from rq.worker import HerokuWorker as Worker
+from rq import Queue
+from rq.worker import SimpleWorker
+from .autotune import apply_slot, load_profile, worker_slots
 from .config import settings
+from .metrics import start_metrics_server
+from .routing import Affinity, all_queue_names, initial_home, last_home, mode_of
+from .storage import start_reaper
+from .webhooks import start_webhook_processor
 
 # Setup logging
 logging.basicConfig(
@@ -22,51 +34,183 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def start_worker():
-    """Start the background worker process"""
+def reset_metrics_dir():
+    """Clear metric files left over from a previous run."""
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+class AffinityWorker(SimpleWorker):
+    """Worker that serves its home modes' sub-queues and helps elsewhere only on backlog (see routing.py).
+    
+    Jobs run in the worker process itself, next to the models it holds:
+    CTranslate2's thread pools and CUDA contexts do not survive a fork, so
+    forked work horses could not use them. A job that crashes the process
+    takes the worker with it; the supervisor starts a replacement.
+    """
+    
+    def __init__(self, *args, home=(), slot=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.affinity = Affinity(self.connection, self.name, home, slot)
+        self._queues_by_name = {queue.name: queue for queue in self.queues}
+    
+    def dequeue_job_and_maintain_ttl(self, timeout, max_idle_time=None):
+        # Block for at most one poll interval at a time, re-planning in between,
+        # so a backlog building up on another mode's queue gets noticed
+        idle_since = time.monotonic()
+        while True:
+            self._ordered_queues = [self._queues_by_name[name] for name in self.affinity.queues()]
+            if timeout is None:
+                return super().dequeue_job_and_maintain_ttl(None, max_idle_time)
+            poll = max(1, min(timeout, settings.affinity_poll_seconds))
+            result = super().dequeue_job_and_maintain_ttl(poll, max_idle_time=poll)
+            if result is not None:
+                return result
+            if max_idle_time is not None and time.monotonic() - idle_since >= max_idle_time:
+                return None
+    
+    def adopt_job_mode(self, job, queue):
+        """Make the job's mode a home mode and hold the models the home modes need."""
+        from .tasks import keep_models
+        mode = mode_of(queue.name) or job.args[2]
+        if not self.affinity.home.serves(mode):
+            logger.info(f"Worker {self.name} adopting mode {mode} (home: {list(self.affinity.home)})")
+        dropped = self.affinity.adopt(mode)
+        if dropped:
+            logger.info(f"Worker {self.name} dropping mode(s) {dropped}")
+        keep_models(self.affinity.home)
+    
+    def execute_job(self, job, queue):
+        self.adopt_job_mode(job, queue)
+        return super().execute_job(job, queue)
+    
+    def heartbeat(self, timeout=None, pipeline=None):
+        super().heartbeat(timeout, pipeline=pipeline)
+        # No heartbeats are sent while a job runs, so the one sent when it
+        # starts keeps the home modes advertised for the job's whole timeout
+        self.affinity.register(timeout)
+    
+    def register_death(self, *args, **kwargs):
+        self.affinity.leave()
+        return super().register_death(*args, **kwargs)
+
+def start_worker(supervised: bool = False, home=(), slot=None):
+    """Start the background worker process
+    
+    Under ``start_workers`` the supervisor serves metrics and runs the
+    reaper and the Stripe event processor once for all of its children. ``home`` are the modes whose
+    models the worker loads up front and serves first, unless the previous worker in ``slot``
+    recorded the ones it had adopted.
+    """
     try:
         # Connect to Redis
         redis_conn = Redis.from_url(settings.redis_url)
         logger.info("Connected to Redis")
         
-        # Create queues
-        paid_queue = Queue("paid", connection=redis_conn)
-        free_queue = Queue("free", connection=redis_conn)
+        if slot is not None:
+            home = last_home(redis_conn, slot) or home
         
-        logger.info("Created Redis queues: paid (high priority), free (low priority)")
+        if not supervised:
+            start_metrics_server(settings.worker_metrics_port)
+            # Delete finished and expired inputs and apply Stripe events in the background
+            start_reaper(redis_conn)
+            start_webhook_processor(redis_conn)
         
-        # Start worker with both queues
-        with Connection(redis_conn):
-            worker = Worker([paid_queue, free_queue])
-            logger.info(f"Starting worker {worker.name}")
-            logger.info(f"Listening to queues: {[q.name for q in worker.queues]}")
-            
-            # Start the worker
-            worker.work(
-                logging_level=logging.INFO,
-                max_jobs=10,  # Process up to 10 jobs before restarting
-                job_timeout=3600,  # 1 hour timeout per job
-                result_ttl=86400,  # Keep results for 24 hours
-                worker_ttl=300,  # Worker timeout after 5 minutes of inactivity
-            )
+        # Load the ML stack and the home modes' models before the first job
+        from .tasks import keep_models, warm_up
+        warm_up()
+        keep_models(home)
+        logger.info("ML stack loaded")
+        
+        # Per tier and mode sub-queues; paid ones always come first
+        queues = [Queue(name, connection=redis_conn) for name in all_queue_names()]
+        
+        worker = AffinityWorker(
+            queues,
+            connection=redis_conn,
+            home=home,
+            slot=slot,
+            worker_ttl=300,  # Worker timeout after 5 minutes of inactivity
+        )
+        logger.info(f"Starting worker {worker.name} with home modes {list(home) or 'none yet'}")
+        
+        # Start the worker
+        # Job timeouts, result TTLs and retries are set per job at enqueue time;
+        # the scheduler releases retries once their backoff has passed
+        worker.work(
+            logging_level=logging.INFO,
+            max_jobs=settings.worker_max_jobs or None,
+            with_scheduler=True,
+        )
             
     except Exception as e:
         logger.error(f"Worker failed to start: {e}")
         sys.exit(1)
 
-def start_workers(num_workers: int = 1):
-    """Start multiple worker processes"""
-    logger.info(f"Starting {num_workers} worker process(es)")
+def spawn_worker(index: int, slot, profile) -> int:
+    """Fork the ``index``-th worker pinned to ``slot``; returns the child's pid."""
+    home = initial_home(index)
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        apply_slot(slot, profile)
+        start_worker(supervised=True, home=home, slot=index)
+        os._exit(0)
+    logger.info(f"Started worker {pid} on CPUs {slot.cpus} with {slot.threads} thread(s), initial home modes {home}")
+    return pid
+
+def start_workers(num_workers: int = None):
+    """Start worker processes, laid out by the CPU profile unless a count is given
+    
+    Each worker is pinned to its own physical cores with a matching thread
+    budget; without a profile or with an explicit count the cores are split
+    evenly. Workers that exit (e.g. after ``WORKER_MAX_JOBS`` jobs) are
+    replaced, keeping the home modes they had adopted.
+    """
+    reset_metrics_dir()
+    profile = load_profile()
+    if profile is None:
+        logger.info(f"No CPU profile at {settings.cpu_profile_path}; run `python -m backend.autotune` to create one")
+    slots = worker_slots(profile, num_workers)
+    logger.info(f"Starting {len(slots)} worker process(es)")
+    
+    if len(slots) == 1 and profile is None and num_workers is None:
+        start_worker(home=initial_home(0) if settings.worker_modes else (), slot=0)
+        return
+    
+    start_metrics_server(settings.worker_metrics_port)
+    start_reaper(Redis.from_url(settings.redis_url))
+    start_webhook_processor(Redis.from_url(settings.redis_url))
+    
+    children = {spawn_worker(index, slot, profile): index for index, slot in enumerate(slots)}
+    stopping = False
+    
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
     
-    if num_workers == 1:
-        start_worker()
-    else:
-        # For multiple workers, you might want to use multiprocessing
-        # or run multiple instances of this script
-        logger.warning("Multiple workers not implemented yet. Starting single worker.")
-        start_worker()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        logger.warning(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting it")
+        # Avoid a hot loop when a worker cannot start at all
+        time.sleep(1)
+        children[spawn_worker(index, slots[index], profile)] = index
 
 if __name__ == "__main__":
-    # Get number of workers from command line argument
-    num_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    # Number of workers from the command line; defaults to the CPU profile
+    num_workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
     start_workers(num_workers)